@@ -0,0 +1,220 @@
+"""End-to-end pull and push timings against the mock Tally server.
+
+    python -m maithantally.benchmarks.bench_e2e [--sizes 1000,10000,100000,1GB] [--latency 0.02]
+
+For every size a mock Tally (see mock_tally) serves that many vouchers and
+a separate process drives the app's own code against it, so peak RSS is
+per size and the server never competes for the client's GIL. Sizes are
+voucher counts or export sizes ("1GB"); the export comes from synthetic,
+control characters and all:
+
+  pull  the VoucherList, Ledger and ITEMLIST exports, streamed, parsed and
+        extracted exactly as the sync jobs do (no database writes)
+  push  single-voucher envelopes for latency (p50/p99), then batched
+        envelopes for throughput, with the response mapped per voucher
+
+Run it with the bench's Python (frappe importable); no site is needed.
+`--json` saves the results to compare against a later run.
+"""
+import argparse
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+from maithantally.benchmarks import synthetic
+from maithantally.benchmarks.mock_tally import MockTally
+
+COMPANY = "Bench & Co"
+
+
+def percentile(samples, pct):
+    if len(samples) < 2:
+        return samples[0] if samples else 0.0
+    return statistics.quantiles(samples, n=100, method="inclusive")[pct - 1]
+
+
+# ---------------- WORKER (one process per size) ----------------
+
+def pull(url, xml, tag, extract=None):
+    from maithantally import tally_stream
+
+    started = time.perf_counter()
+    with tally_stream.download(url, xml, timeout=(10, 3600)) as download:
+        downloaded = time.perf_counter()
+        count = 0
+        for elem in tally_stream.iter_elements(download.chunks(), tag):
+            if extract:
+                extract(elem)
+            count += 1
+        size = download.file.tell()
+    finished = time.perf_counter()
+
+    return {
+        "objects": count,
+        "mb": size / 1024 / 1024,
+        "download_s": downloaded - started,
+        "parse_s": finished - downloaded,
+        "per_s": count / max(finished - started, 1e-9),
+    }
+
+
+def push_doc(n, lines):
+    rows = [
+        SimpleNamespace(
+            ledger=f"Ledger {(n + i) % 500}",
+            entry_type="Debit" if i % 2 == 0 else "Credit",
+            ledger_amount=100.0 + n % 900,
+        )
+        for i in range(lines)
+    ]
+    return SimpleNamespace(
+        doctype="Journal Voucher",
+        date="2025-04-01",
+        voucher_number=f"P{n}",
+        narration=f"Benchmark push {n}",
+        voucher_ledger_entry=rows,
+    )
+
+
+def push(url, docs):
+    """Build, send and map one envelope the way tally_batch does."""
+    from maithantally import tally_client
+    from maithantally.tally_batch import map_batch_results
+    from maithantally.tally_response import parse_import_response
+    from maithantally.tally_xml import accounting_voucher, import_envelope
+
+    started = time.perf_counter()
+    xml = import_envelope(COMPANY, [accounting_voucher(doc, "Journal") for doc in docs])
+    response = tally_client.post(url, xml)
+    response.raise_for_status()
+    map_batch_results(docs, parse_import_response(response.text))
+    return time.perf_counter() - started
+
+
+def measure(options):
+    from maithantally.tally import build_voucher_export
+    from maithantally.tally_extract import extract_voucher
+    from maithantally.tally_sync_fetch_itemname import build_item_export
+    from maithantally.tally_sync_fetch_ledgers import build_master_export
+
+    dataset = synthetic.Dataset(vouchers=options["vouchers"], **options["dataset"])
+    url = options["url"]
+
+    result = {"vouchers": options["vouchers"]}
+    result["pull_vouchers"] = pull(
+        url, build_voucher_export(COMPANY, dataset.start, dataset.end), "VOUCHER", extract_voucher
+    )
+    result["pull_ledgers"] = pull(url, build_master_export(COMPANY, "Ledger"), "LEDGER")
+    result["pull_items"] = pull(url, build_item_export(COMPANY), "STOCKITEM")
+
+    singles = [push(url, [push_doc(n, options["lines"])]) for n in range(options["push_samples"])]
+    result["push_single"] = {
+        "requests": len(singles),
+        "p50_ms": percentile(singles, 50) * 1000,
+        "p99_ms": percentile(singles, 99) * 1000,
+    }
+
+    total = min(options["vouchers"], options["push_limit"])
+    batch = options["batch_size"]
+    started = time.perf_counter()
+    envelopes = [
+        push(url, [push_doc(n, options["lines"]) for n in range(start, min(start + batch, total))])
+        for start in range(0, total, batch)
+    ]
+    elapsed = time.perf_counter() - started
+    result["push_batch"] = {
+        "vouchers": total,
+        "batch_size": batch,
+        "per_s": total / max(elapsed, 1e-9),
+        "p50_ms": percentile(envelopes, 50) * 1000,
+        "p99_ms": percentile(envelopes, 99) * 1000,
+    }
+
+    # ru_maxrss is in KiB on Linux
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return result
+
+
+# ---------------- DRIVER ----------------
+
+def dataset_options(args):
+    return {"lines": args.lines, "inventory": args.inventory, "junk_every": args.junk_every}
+
+
+def voucher_count(size, args):
+    return int(size) if size.isdigit() else synthetic.vouchers_for_size(size, **dataset_options(args))
+
+
+def run_size(vouchers, args):
+    dataset = synthetic.Dataset(vouchers=vouchers, **dataset_options(args))
+    with MockTally(dataset, latency=args.latency, per_object=args.per_object) as tally:
+        options = {
+            "url": tally.url,
+            "vouchers": vouchers,
+            "dataset": dataset_options(args),
+            "lines": args.lines,
+            "push_samples": args.push_samples,
+            "push_limit": args.push_limit,
+            "batch_size": args.batch_size,
+        }
+        worker = subprocess.run(
+            [sys.executable, "-m", "maithantally.benchmarks.bench_e2e", "--worker", json.dumps(options)],
+            capture_output=True,
+            text=True,
+        )
+    if worker.returncode:
+        raise SystemExit(worker.stderr)
+    return json.loads(worker.stdout.strip().splitlines()[-1])
+
+
+def report(result):
+    vouchers = result["pull_vouchers"]
+    single = result["push_single"]
+    batch = result["push_batch"]
+    print(
+        f"{result['vouchers']:>9,}"
+        f"  {vouchers['mb']:8.1f} MB {vouchers['per_s']:>10,.0f}/s"
+        f" (dl {vouchers['download_s']:6.2f}s parse {vouchers['parse_s']:6.2f}s)"
+        f"  ledgers {result['pull_ledgers']['per_s']:>9,.0f}/s"
+        f"  items {result['pull_items']['per_s']:>9,.0f}/s"
+        f"  push p50 {single['p50_ms']:6.1f} ms p99 {single['p99_ms']:6.1f} ms"
+        f"  batch {batch['per_s']:>7,.0f}/s"
+        f"  RSS {result['peak_rss_mb']:7.1f} MB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma-separated voucher counts or sizes (1GB)")
+    parser.add_argument("--lines", type=int, default=2, help="ledger entries per voucher")
+    parser.add_argument("--inventory", type=int, default=1, help="inventory entries per sales/purchase voucher")
+    parser.add_argument("--junk-every", type=int, default=50, help="control characters in every n-th object, 0 for none")
+    parser.add_argument("--latency", type=float, default=0.0, help="mock Tally seconds per request")
+    parser.add_argument("--per-object", type=float, default=0.0, help="mock Tally seconds per object")
+    parser.add_argument("--push-samples", type=int, default=200, help="single-voucher pushes per size")
+    parser.add_argument("--push-limit", type=int, default=10_000, help="most vouchers pushed in batches")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(json.loads(args.worker))))
+        return
+
+    results = []
+    for size in args.sizes.split(","):
+        results.append(run_size(voucher_count(size.strip(), args), args))
+        report(results[-1])
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(results, fh, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Compare per-field XPath lookups with the single-pass voucher extractor.
+
+    python -m maithantally.benchmarks.bench_extract [--vouchers 100000 | --size 1GB]
+
+The export is generated by synthetic and streamed to a temporary file (or
+read from --file), so it can be far larger than memory. Plain iterparse
+rejects the control characters Tally leaks, so the generated export is
+clean; the streaming sanitizer is covered by bench_e2e. Needs only lxml,
+so it runs outside a bench.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from lxml import etree
+
+from maithantally.benchmarks import synthetic
+from maithantally.tally_extract import extract_voucher
+
+
+def xpath_per_field(voucher):
+    """What the pull paths did before: one uncompiled XPath per field."""
+    def get_val(elem, tag):
+        res = elem.xpath(f".//*[local-name()='{tag}']/text()")
+        return res[0].strip() if res else ""
+
+    entries = [
+        (get_val(entry, "LEDGERNAME"), get_val(entry, "AMOUNT"))
+        for entry in voucher.xpath(".//*[local-name()='ALLLEDGERENTRIES.LIST']")
+    ]
+    return (
+        get_val(voucher, "VOUCHERNUMBER"),
+        voucher.get("VCHTYPE") or get_val(voucher, "VOUCHERTYPENAME"),
+        get_val(voucher, "DATE"),
+        get_val(voucher, "NARRATION"),
+        entries,
+    )
+
+
+def single_pass(voucher):
+    record = extract_voucher(voucher)
+    return (
+        record.voucher_number,
+        record.voucher_type,
+        record.date,
+        record.narration,
+        record.ledger_entries,
+    )
+
+
+def parse_only(voucher):
+    return None
+
+
+def run(path, extract):
+    count = 0
+    started = time.perf_counter()
+    for _, voucher in etree.iterparse(path, events=("end",), tag="VOUCHER", huge_tree=True):
+        extract(voucher)
+        voucher.clear()
+        while voucher.getprevious() is not None:
+            del voucher.getparent()[0]
+        count += 1
+    return count, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vouchers", type=int, default=100_000)
+    parser.add_argument("--size", help="generate an export of this size instead, e.g. 1GB")
+    parser.add_argument("--file", help="use an existing export instead of generating one")
+    parser.add_argument("--ledgers", type=int, default=2, help="ledger entries per voucher")
+    parser.add_argument("--items", type=int, default=1, help="inventory entries per sales/purchase voucher")
+    args = parser.parse_args()
+
+    options = {"lines": args.ledgers, "inventory": args.items, "junk_every": 0}
+
+    # Both extractors must agree before their speed means anything.
+    sample = etree.fromstring("".join(synthetic.export(synthetic.Dataset(vouchers=60, **options))).encode())
+    for voucher in sample.iter("VOUCHER"):
+        assert xpath_per_field(voucher) == single_pass(voucher)
+
+    path = args.file
+    if not path:
+        vouchers = synthetic.vouchers_for_size(args.size, **options) if args.size else args.vouchers
+        fd, path = tempfile.mkstemp(suffix=".xml")
+        os.close(fd)
+        synthetic.write_export(path, synthetic.Dataset(vouchers=vouchers, **options))
+
+    try:
+        print(f"{path}: {os.path.getsize(path) / 1024 / 1024:,.1f} MB")
+
+        _, parse_seconds = run(path, parse_only)
+        print(f"{'parse only':<16}{parse_seconds:8.2f}s")
+
+        for label, extract in (("xpath per field", xpath_per_field), ("single pass", single_pass)):
+            count, seconds = run(path, extract)
+            extract_seconds = max(seconds - parse_seconds, 1e-9)
+            print(
+                f"{label:<16}{seconds:8.2f}s  {count / seconds:>10,.0f} vouchers/s"
+                f"  (extraction alone {count / extract_seconds:>10,.0f} vouchers/s)"
+            )
+    finally:
+        if not args.file:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Time voucher serialisation: the old f-string concatenation against tally_xml.
+
+    python -m maithantally.benchmarks.bench_xml [--lines 1000] [--repeat 50]
+
+Run it with the bench's Python (frappe importable); no site is needed.
+"""
+import argparse
+import datetime
+import time
+from types import SimpleNamespace
+
+from lxml import etree
+
+from maithantally.tally_xml import accounting_voucher, import_envelope
+
+KINDS = (
+    ("Contra", {"credit_first": True}),
+    ("Journal", {}),
+    ("Payment", {"persisted_view": False}),
+    ("Receipt", {"persisted_view": False}),
+)
+
+
+def build_doc(lines):
+    rows = [
+        SimpleNamespace(
+            ledger=f"Ledger {i} & Sons <Branch>",
+            entry_type="Debit" if i % 2 else "Credit",
+            ledger_amount=100.0 + i,
+        )
+        for i in range(lines)
+    ]
+    return SimpleNamespace(
+        date=datetime.date(2025, 4, 1),
+        voucher_number="BENCH-1",
+        narration="Salary & wages for April",
+        voucher_ledger_entry=rows,
+    )
+
+
+def concatenated(doc):
+    """What the controllers did before: += per row, nothing escaped."""
+    xml = ""
+    for row in doc.voucher_ledger_entry:
+        amt = abs(row.ledger_amount)
+        if row.entry_type == "Debit":
+            xml += f"""
+<ALLLEDGERENTRIES.LIST>
+    <LEDGERNAME>{row.ledger}</LEDGERNAME>
+    <ISDEEMEDPOSITIVE>Yes</ISDEEMEDPOSITIVE>
+    <AMOUNT>-{amt}</AMOUNT>
+</ALLLEDGERENTRIES.LIST>"""
+        else:
+            xml += f"""
+<ALLLEDGERENTRIES.LIST>
+    <LEDGERNAME>{row.ledger}</LEDGERNAME>
+    <ISDEEMEDPOSITIVE>No</ISDEEMEDPOSITIVE>
+    <AMOUNT>{amt}</AMOUNT>
+</ALLLEDGERENTRIES.LIST>"""
+    return f"""<VOUCHER VCHTYPE="Journal" ACTION="Create"><NARRATION>{doc.narration}</NARRATION>{xml}</VOUCHER>"""
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    doc = build_doc(args.lines)
+
+    ms, xml = timed(lambda: concatenated(doc), args.repeat)
+    try:
+        etree.fromstring(xml.encode("utf-8"))
+        valid = "well-formed"
+    except etree.XMLSyntaxError:
+        valid = "NOT well-formed"
+    print(f"concatenated  {args.lines} lines  {ms:8.2f} ms/voucher  ({valid})")
+
+    for vch_type, options in KINDS:
+        for action in ("Create", "Alter"):
+            ms, xml = timed(lambda: accounting_voucher(doc, vch_type, action, **options), args.repeat)
+            etree.fromstring(import_envelope("Bench & Co", xml).encode("utf-8"))
+            print(f"{vch_type:<8} {action:<6} {args.lines} lines  {ms:8.2f} ms/voucher  (well-formed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""A stand-in Tally HTTP server for benchmarks and local runs.
+
+    python -m maithantally.benchmarks.mock_tally [--port 9000] [--vouchers 10000]
+
+Answers the collection exports the app sends (VoucherList, the Group and
+Ledger MASTERLIST, ITEMLIST) from a synthetic Dataset, honouring the date
+window and ALTERID filter, and acknowledges import envelopes with the
+counters Tally reports. `latency` is added to every request and
+`per_object` for every object exported or imported, to stand in for
+Tally's own processing time. Needs only lxml.
+"""
+import argparse
+import datetime
+import io
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from lxml import etree
+
+from maithantally.benchmarks import synthetic
+
+_TAG_RE = {
+    tag: re.compile(rf"<{tag}>\s*(.*?)\s*</{tag}>".encode(), re.I | re.S)
+    for tag in ("TALLYREQUEST", "ID", "SVFROMDATE", "SVTODATE")
+}
+_COLLECTION_TYPE_RE = re.compile(rb"<COLLECTION\b[^>]*>\s*<TYPE>\s*(\w+)\s*</TYPE>", re.I)
+_ALTERID_FILTER_RE = re.compile(rb"\$AlterID\s*&gt;\s*(\d+)")
+
+WRITE_BUFFER = 64 * 1024
+
+
+def _find(tag, body):
+    match = _TAG_RE[tag].search(body)
+    return match.group(1).decode() if match else None
+
+
+def _date(value):
+    return datetime.datetime.strptime(value, "%Y%m%d").date() if value else None
+
+
+class MockTally:
+    """Serve `dataset` on a background thread; use as a context manager."""
+
+    def __init__(self, dataset=None, latency=0.0, per_object=0.0, error_every=0, host="127.0.0.1", port=0):
+        self.dataset = dataset or synthetic.Dataset()
+        self.latency = latency
+        self.per_object = per_object
+        self.error_every = error_every   # reject every n-th imported voucher
+        self.stats = {"exports": 0, "imports": 0, "exported": 0, "imported": 0}
+        self._lock = threading.Lock()
+        self._last_vch_id = 0
+        self._server = ThreadingHTTPServer((host, port), _handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _count(self, key, objects):
+        with self._lock:
+            self.stats[key + "s"] += 1
+            self.stats[key + "ed"] += objects
+
+    # ---------------- EXPORTS ----------------
+
+    def export(self, body):
+        """The objects a collection export asks for, as an iterable of str."""
+        since = _ALTERID_FILTER_RE.search(body)
+        since = int(since.group(1)) if since else 0
+        collection = _find("ID", body) or ""
+        tally_type = _COLLECTION_TYPE_RE.search(body)
+        tally_type = tally_type.group(1).decode() if tally_type else ""
+
+        if collection.lower() == "voucherlist" or tally_type.lower() == "voucher":
+            indexes = self.dataset.voucher_range(_date(_find("SVFROMDATE", body)), _date(_find("SVTODATE", body)))
+            build = synthetic.voucher
+        elif tally_type in synthetic.MASTERS:
+            build, count = synthetic.MASTERS[tally_type]
+            indexes = range(getattr(self.dataset, count))
+        else:
+            return None, 0
+
+        # ALTERID is n + 1, so the filter drops a prefix.
+        indexes = range(max(indexes.start, since), indexes.stop) if since else indexes
+        return (build(self.dataset, n) for n in indexes), len(indexes)
+
+    # ---------------- IMPORTS ----------------
+
+    def import_(self, body):
+        counters = {"Create": 0, "Alter": 0, "Delete": 0}
+        line_errors = []
+
+        for seen, (_, vch) in enumerate(etree.iterparse(io.BytesIO(body), tag="VOUCHER", recover=True), 1):
+            number = vch.findtext("VOUCHERNUMBER") or vch.get("TAGVALUE") or ""
+            if self.error_every and seen % self.error_every == 0:
+                line_errors.append(f"Voucher '{number}': Ledger 'Missing Ledger' does not exist!")
+            else:
+                action = vch.get("ACTION") or "Create"
+                counters[action] = counters.get(action, 0) + 1
+            vch.clear()
+
+        with self._lock:
+            self._last_vch_id += counters["Create"]
+            last_vch_id = self._last_vch_id
+
+        total = sum(counters.values()) + len(line_errors)
+        response = (
+            "<ENVELOPE><HEADER><VERSION>1</VERSION><STATUS>1</STATUS></HEADER>"
+            "<BODY><DATA><IMPORTRESULT>"
+            f"<CREATED>{counters['Create']}</CREATED><ALTERED>{counters['Alter']}</ALTERED>"
+            f"<DELETED>{counters['Delete']}</DELETED><LASTVCHID>{last_vch_id}</LASTVCHID>"
+            "<LASTMID>0</LASTMID><COMBINED>0</COMBINED><IGNORED>0</IGNORED>"
+            f"<ERRORS>{len(line_errors)}</ERRORS><CANCELLED>0</CANCELLED><EXCEPTIONS>0</EXCEPTIONS>"
+            + "".join(f"<LINEERROR>{message}</LINEERROR>" for message in line_errors)
+            + "</IMPORTRESULT></DATA></BODY></ENVELOPE>"
+        )
+        return response, total
+
+
+def _handler(tally):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"   # keep-alive, like Tally
+        # Headers and body leave in one segment, so small responses are not
+        # held back by Nagle and delayed ACKs (a flat 40 ms per request).
+        disable_nagle_algorithm = True
+        wbufsize = WRITE_BUFFER
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            request = (_find("TALLYREQUEST", body) or "").lower()
+
+            if request == "import":
+                response, objects = tally.import_(body)
+                tally._count("import", objects)
+                self._wait(objects)
+                self._send_whole(response.encode("utf-8"))
+                return
+
+            objects, count = tally.export(body)
+            if objects is None:
+                self._send_whole(b"<RESPONSE>Unknown Request, cannot be processed</RESPONSE>")
+                return
+
+            tally._count("export", count)
+            self._wait(count)
+            self._send_chunked(synthetic.envelope(objects))
+
+        def _wait(self, objects):
+            delay = tally.latency + tally.per_object * objects
+            if delay > 0:
+                time.sleep(delay)
+
+        def _send_whole(self, data):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/xml; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_chunked(self, parts):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/xml; charset=utf-8")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            buffer, size = [], 0
+            for part in parts:
+                data = part.encode("utf-8")
+                buffer.append(data)
+                size += len(data)
+                if size >= WRITE_BUFFER:
+                    self._write_chunk(b"".join(buffer))
+                    buffer, size = [], 0
+            if buffer:
+                self._write_chunk(b"".join(buffer))
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _write_chunk(self, data):
+            self.wfile.write(b"%X\r\n%s\r\n" % (len(data), data))
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--vouchers", type=int, default=10_000)
+    parser.add_argument("--ledgers", type=int, default=500)
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--lines", type=int, default=2, help="ledger entries per voucher")
+    parser.add_argument("--inventory", type=int, default=1, help="inventory entries per sales/purchase voucher")
+    parser.add_argument("--junk-every", type=int, default=50, help="control characters in every n-th object, 0 for none")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--per-object", type=float, default=0.0, help="seconds added per object")
+    parser.add_argument("--error-every", type=int, default=0, help="reject every n-th imported voucher")
+    args = parser.parse_args()
+
+    tally = MockTally(
+        synthetic.Dataset(
+            vouchers=args.vouchers,
+            ledgers=args.ledgers,
+            items=args.items,
+            lines=args.lines,
+            inventory=args.inventory,
+            junk_every=args.junk_every,
+        ),
+        latency=args.latency,
+        per_object=args.per_object,
+        error_every=args.error_every,
+        host=args.host,
+        port=args.port,
+    )
+    print(f"Mock Tally on {tally.url} ({args.vouchers} vouchers)")
+    try:
+        tally.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""Deterministic, Tally-shaped exports for the mock server and benchmarks.
+
+    python -m maithantally.benchmarks.synthetic --size 1GB --out /tmp/vouchers.xml
+
+Vouchers carry N ledger entries, inventory entries with batch and
+accounting allocations, UDF fields under the TallyUDF namespace, and the
+junk Tally really emits: raw control characters in narrations and `&#4;`
+references in names. Object n depends only on the Dataset and n, so the
+mock server can serve any slice of a company and two runs of a benchmark
+see the same bytes. Exports are written as a stream, so size is bounded by
+disk, not memory. Nothing here needs frappe.
+"""
+import argparse
+import datetime
+import gzip
+import re
+
+VOUCHER_TYPES = ("Contra", "Payment", "Receipt", "Journal", "Sales", "Purchase")
+INVENTORY_TYPES = ("Sales", "Purchase")
+
+UDF_NAMESPACE = "TallyUDF"
+WRITE_BUFFER = 1024 * 1024
+_SIZE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([KMG]?)B?\s*$", re.I)
+
+_WORDS = (
+    "cash", "deposit", "transfer", "against", "bill", "invoice", "freight", "advance",
+    "settlement", "rent", "salary", "purchase", "sale", "refund", "charges", "GST",
+)
+
+
+def _mix(n, salt=0):
+    """Cheap per-index pseudo-randomness (Knuth multiplicative hash)."""
+    return ((n + salt) * 2654435761) & 0xFFFFFFFF
+
+
+class Dataset:
+    """A company of `vouchers` vouchers spread evenly from `start` to `end`.
+
+    Voucher n has ALTERID/MASTERID n + 1, so watermark filters select a
+    suffix of the dataset, as they do against a real Tally. `junk_every`
+    puts control characters into every n-th object (0 for clean XML).
+    """
+
+    def __init__(self, vouchers=1000, ledgers=500, groups=40, items=200, lines=2,
+                 inventory=1, junk_every=50, udf=True, seed=0,
+                 start=datetime.date(2025, 4, 1), end=datetime.date(2026, 3, 31)):
+        self.vouchers = vouchers
+        self.ledgers = ledgers
+        self.groups = groups
+        self.items = items
+        self.lines = lines
+        self.inventory = inventory
+        self.junk_every = junk_every
+        self.udf = udf
+        self.seed = seed
+        self.start = start
+        self.end = end
+        self._span = (end - start).days + 1
+
+    def voucher_date(self, n):
+        return self.start + datetime.timedelta(days=n * self._span // max(self.vouchers, 1))
+
+    def voucher_range(self, from_date=None, to_date=None):
+        """Indexes of the vouchers dated inside [from_date, to_date]."""
+        lo = 0 if from_date is None else self._first_on_or_after(from_date)
+        hi = self.vouchers if to_date is None else self._first_on_or_after(to_date + datetime.timedelta(days=1))
+        return range(lo, hi)
+
+    def _first_on_or_after(self, day):
+        offset = (day - self.start).days
+        if offset <= 0:
+            return 0
+        # smallest n with n * span // vouchers >= offset
+        return min(self.vouchers, -(-offset * self.vouchers // self._span))
+
+    def junk(self, n):
+        return bool(self.junk_every) and n % self.junk_every == 0
+
+    def narration(self, n):
+        h = _mix(n, self.seed)
+        words = " ".join(_WORDS[(h >> shift) % len(_WORDS)] for shift in range(0, 4 * (2 + h % 6), 4))
+        text = f"Being {words} ref {n} for Bench &amp; Co"
+        if self.junk(n):
+            # What Tally leaks from pasted text: a raw EOT and a form feed.
+            text = f"{text}\x04 \x0c(copied)"
+        return text
+
+
+# ---------------- VOUCHERS ----------------
+
+def voucher(dataset, n):
+    h = _mix(n, dataset.seed)
+    vch_type = VOUCHER_TYPES[n % len(VOUCHER_TYPES)]
+    date = f"{dataset.voucher_date(n):%Y%m%d}"
+    party = f"Ledger {h % dataset.ledgers}"
+
+    parts = [
+        f'<VOUCHER REMOTEID="bench-{dataset.seed}-{n}" VCHKEY="bench-{n}:00000008" '
+        f'VCHTYPE="{vch_type}" ACTION="Create" OBJVIEW="Accounting Voucher View">'
+        '<OLDAUDITENTRYIDS.LIST TYPE="Number"><OLDAUDITENTRYIDS>-1</OLDAUDITENTRYIDS></OLDAUDITENTRYIDS.LIST>'
+        f"<DATE>{date}</DATE><GUID>bench-{dataset.seed}-{n}</GUID>"
+        f"<NARRATION>{dataset.narration(n)}</NARRATION>"
+        f"<VOUCHERTYPENAME>{vch_type}</VOUCHERTYPENAME>"
+        f"<VOUCHERNUMBER>B{n}</VOUCHERNUMBER>"
+        f"<PARTYLEDGERNAME>{party}</PARTYLEDGERNAME>"
+        "<PERSISTEDVIEW>Accounting Voucher View</PERSISTEDVIEW>"
+        f"<EFFECTIVEDATE>{date}</EFFECTIVEDATE>"
+        f"<ALTERID>{n + 1}</ALTERID><MASTERID>{n + 1}</MASTERID><VOUCHERKEY>{190000 + n}</VOUCHERKEY>"
+    ]
+
+    if dataset.udf:
+        parts.append(
+            '<UDF:VCHREFERENCE.LIST DESC="`VchReference`" ISLIST="YES" TYPE="String" INDEX="1001">'
+            f'<UDF:VCHREFERENCE DESC="`VchReference`">REF/{n}</UDF:VCHREFERENCE>'
+            "</UDF:VCHREFERENCE.LIST>"
+        )
+
+    inventory_total = 0
+    if vch_type in INVENTORY_TYPES:
+        for i in range(dataset.inventory):
+            qty = 1 + (h >> (i + 3)) % 50
+            rate = 10 + (h >> (i + 7)) % 990
+            amount = qty * rate
+            inventory_total += amount
+            item = f"Item {(n + i) % dataset.items}"
+            if dataset.junk(n) and i == 0:
+                item = f"&#4; {item}"
+            parts.append(
+                "<ALLINVENTORYENTRIES.LIST>"
+                f"<STOCKITEMNAME>{item}</STOCKITEMNAME>"
+                f"<ISDEEMEDPOSITIVE>{'No' if vch_type == 'Sales' else 'Yes'}</ISDEEMEDPOSITIVE>"
+                f"<RATE>{rate}.00/Nos</RATE><AMOUNT>{amount}.00</AMOUNT>"
+                f"<ACTUALQTY> {qty} Nos</ACTUALQTY><BILLEDQTY> {qty} Nos</BILLEDQTY>"
+                "<BATCHALLOCATIONS.LIST><GODOWNNAME>Main Location</GODOWNNAME>"
+                f"<BATCHNAME>Primary Batch</BATCHNAME><AMOUNT>{amount}.00</AMOUNT>"
+                f"<ACTUALQTY> {qty} Nos</ACTUALQTY><BILLEDQTY> {qty} Nos</BILLEDQTY></BATCHALLOCATIONS.LIST>"
+                "<ACCOUNTINGALLOCATIONS.LIST>"
+                f"<LEDGERNAME>{vch_type} Accounts</LEDGERNAME>"
+                f"<AMOUNT>{amount}.00</AMOUNT></ACCOUNTINGALLOCATIONS.LIST>"
+                "</ALLINVENTORYENTRIES.LIST>"
+            )
+
+    # Every line carries the same amount, so an even number of lines balances.
+    amount = inventory_total or 100 + h % 900
+    for i in range(dataset.lines):
+        debit = i % 2 == 0
+        parts.append(
+            "<ALLLEDGERENTRIES.LIST>"
+            '<OLDAUDITENTRYIDS.LIST TYPE="Number"><OLDAUDITENTRYIDS>-1</OLDAUDITENTRYIDS></OLDAUDITENTRYIDS.LIST>'
+            f"<LEDGERNAME>{party if i == 0 else f'Ledger {(n + i) % dataset.ledgers}'}</LEDGERNAME>"
+            f"<ISDEEMEDPOSITIVE>{'Yes' if debit else 'No'}</ISDEEMEDPOSITIVE>"
+            f"<ISPARTYLEDGER>{'Yes' if i == 0 else 'No'}</ISPARTYLEDGER>"
+            f"<AMOUNT>{'-' if debit else ''}{amount}.00</AMOUNT>"
+            "<BANKALLOCATIONS.LIST>       </BANKALLOCATIONS.LIST>"
+            "<BILLALLOCATIONS.LIST>       </BILLALLOCATIONS.LIST>"
+            "</ALLLEDGERENTRIES.LIST>"
+        )
+
+    parts.append("</VOUCHER>")
+    return "".join(parts)
+
+
+# ---------------- MASTERS ----------------
+
+def group(dataset, n):
+    parent = f"Group {n % 4}" if n >= 4 else "&#4; Primary" if dataset.junk_every else "Primary"
+    return (
+        f'<GROUP NAME="Group {n}" RESERVEDNAME=""><NAME>Group {n}</NAME><PARENT>{parent}</PARENT>'
+        f"<ALTERID>{n + 1}</ALTERID><MASTERID>{n + 1}</MASTERID></GROUP>"
+    )
+
+
+def ledger(dataset, n):
+    return (
+        f'<LEDGER NAME="Ledger {n}" RESERVEDNAME=""><NAME>Ledger {n}</NAME>'
+        f"<PARENT>Group {n % max(dataset.groups, 1)}</PARENT>"
+        f"<OPENINGBALANCE>{(_mix(n, dataset.seed) % 100000) / 100:.2f}</OPENINGBALANCE>"
+        f"<ALTERID>{n + 1}</ALTERID><MASTERID>{n + 1}</MASTERID></LEDGER>"
+    )
+
+
+def stock_item(dataset, n):
+    return (
+        f'<STOCKITEM NAME="Item {n}" RESERVEDNAME=""><NAME>Item {n}</NAME><PARENT>Stock Group {n % 10}</PARENT>'
+        f"<BASEUNITS>Nos</BASEUNITS><OPENINGRATE>{10 + n % 90}.00/Nos</OPENINGRATE>"
+        f"<ALTERID>{n + 1}</ALTERID><MASTERID>{n + 1}</MASTERID></STOCKITEM>"
+    )
+
+
+MASTERS = {
+    # TDL collection TYPE -> (element builder, Dataset attribute with the count)
+    "Group": (group, "groups"),
+    "Ledger": (ledger, "ledgers"),
+    "StockItem": (stock_item, "items"),
+}
+
+COLLECTIONS = {"Voucher": (voucher, "vouchers"), **MASTERS}
+
+
+def envelope(objects):
+    """Wrap an iterable of object strings the way Tally wraps an export."""
+    yield (
+        "<ENVELOPE><HEADER><VERSION>1</VERSION><STATUS>1</STATUS></HEADER>"
+        f'<BODY><DESC></DESC><DATA><COLLECTION xmlns:UDF="{UDF_NAMESPACE}">'
+    )
+    yield from objects
+    yield "</COLLECTION></DATA></BODY></ENVELOPE>"
+
+
+def export(dataset, collection="Voucher", indexes=None):
+    """The whole export of `collection` as a stream of str pieces."""
+    build, count = COLLECTIONS[collection]
+    indexes = range(getattr(dataset, count)) if indexes is None else indexes
+    return envelope(build(dataset, n) for n in indexes)
+
+
+# ---------------- ON DISK ----------------
+
+def parse_size(text):
+    """'1GB', '250MB', '512K' or plain bytes -> bytes."""
+    match = _SIZE_RE.match(str(text))
+    if not match:
+        raise ValueError(f"Not a size: {text}")
+    number, unit = match.groups()
+    return int(float(number) * 1024 ** " KMG".index(unit.upper() or " "))
+
+
+def vouchers_for_size(size, sample=1000, **options):
+    """How many vouchers of a Dataset(**options) make an export of `size` bytes."""
+    probe = Dataset(vouchers=sample, **options)
+    sample_bytes = sum(len(voucher(probe, n).encode("utf-8")) for n in range(sample))
+    return max(1, int(parse_size(size) * sample / sample_bytes))
+
+
+def write_export(path, dataset, collection="Voucher"):
+    """Stream an export to `path` (gzip if it ends in .gz); returns its size
+    before compression."""
+    opener = gzip.open if str(path).endswith(".gz") else open
+    written = 0
+    buffer, size = [], 0
+
+    with opener(path, "wb") as fh:
+        for piece in export(dataset, collection):
+            data = piece.encode("utf-8")
+            buffer.append(data)
+            size += len(data)
+            if size >= WRITE_BUFFER:
+                fh.write(b"".join(buffer))
+                written += size
+                buffer, size = [], 0
+        fh.write(b"".join(buffer))
+        written += size
+
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True, help="file to write (.gz to compress)")
+    parser.add_argument("--collection", default="Voucher", choices=sorted(COLLECTIONS))
+    parser.add_argument("--size", help="target size of a voucher export, e.g. 1GB (overrides --vouchers)")
+    parser.add_argument("--vouchers", type=int, default=10_000)
+    parser.add_argument("--ledgers", type=int, default=500)
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--lines", type=int, default=2, help="ledger entries per voucher")
+    parser.add_argument("--inventory", type=int, default=1, help="inventory entries per sales/purchase voucher")
+    parser.add_argument("--junk-every", type=int, default=50, help="control characters in every n-th object, 0 for none")
+    parser.add_argument("--no-udf", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    options = {
+        "ledgers": args.ledgers,
+        "items": args.items,
+        "lines": args.lines,
+        "inventory": args.inventory,
+        "junk_every": args.junk_every,
+        "udf": not args.no_udf,
+        "seed": args.seed,
+    }
+    vouchers = vouchers_for_size(args.size, **options) if args.size else args.vouchers
+    written = write_export(args.out, Dataset(vouchers=vouchers, **options), args.collection)
+    print(f"{args.out}: {vouchers:,} vouchers, {written / 1024 / 1024:,.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -147,29 +147,29 @@ app_license = "mit"
 # }
 doc_events = {
     "Sales Voucher": {
-        "after_insert":"maithantally.tally_sales.send_to_tally",
-        "on_cancel":"maithantally.tally_sales.delete_sales_voucher",
-        "after_delete":"maithantally.tally_sales.delete_sales_voucher"
+        "validate": "maithantally.tally_sales.validate_sales_voucher",
+        "after_insert": "maithantally.tally_outbox.enqueue_create",
+        "on_cancel": "maithantally.tally_outbox.enqueue_delete",
+        "after_delete": "maithantally.tally_outbox.enqueue_delete"
     },
     "Purchase Voucher": {
-    "after_insert":"maithantally.tally_purchase.send_to_tally",
-    "on_cancel":"maithantally.tally_purchase.delete_purchase_voucher",
-    "after_delete":"maithantally.tally_purchase.delete_purchase_voucher"
-    
+        "validate": "maithantally.tally_purchase.validate_purchase_voucher",
+        "after_insert": "maithantally.tally_outbox.enqueue_create",
+        "on_cancel": "maithantally.tally_outbox.enqueue_delete",
+        "after_delete": "maithantally.tally_outbox.enqueue_delete"
     },
     "Sales Order": {
-    "after_insert": "maithantally.tally_sales_order.send_to_tally",
-    "on_cancel":"maithantally.tally_sales_order.delete_sales_order",
-    "after_delete":"maithantally.tally_sales_order.delete_sales_order"
-    
+        "validate": "maithantally.tally_sales_order.validate_sales_order",
+        "after_insert": "maithantally.tally_outbox.enqueue_create",
+        "on_cancel": "maithantally.tally_outbox.enqueue_delete",
+        "after_delete": "maithantally.tally_outbox.enqueue_delete"
     },
-    "Purchase Order":{
-        "after_insert":"maithantally.tally_purchase_order.send_to_tally",
-        "on_cancel":"maithantally.tally_purchase_order.delete_purchase_order",
-        "after_delete":"maithantally.tally_purchase_order.delete_purchase_order"
+    "Purchase Order": {
+        "validate": "maithantally.tally_purchase_order.validate_purchase_order",
+        "after_insert": "maithantally.tally_outbox.enqueue_create",
+        "on_cancel": "maithantally.tally_outbox.enqueue_delete",
+        "after_delete": "maithantally.tally_outbox.enqueue_delete"
     }
-
-
 }
 
 
@@ -203,6 +203,23 @@ doc_events = {
 #     }
 # }
 
+scheduler_events = {
+    "cron": {
+        # Safety net for the Tally Outbox: picks up retries whose backoff has
+        # elapsed and anything the on-save drain job missed.
+        "* * * * *": [
+            "maithantally.tally_outbox.process_outbox",
+            # Enqueues the incremental ledger/item/voucher pulls that are due;
+            # cadence and backoff live in tally_scheduler.
+            "maithantally.tally_scheduler.run_due_jobs"
+        ]
+    },
+    # Drops archived Tally payloads past their retention (see tally_archive).
+    "daily": [
+        "maithantally.tally_archive.purge"
+    ]
+}
+
 # Testing
 # -------
 
@@ -1,9 +1,22 @@
 # Copyright (c) 2025, epsumlabs and contributors
 # For license information, please see license.txt
 
-# import frappe
+import frappe
 from frappe.model.document import Document
 
+from maithantally import tally_ledger_groups
+
 
 class Ledger(Document):
-	pass
+	def on_update(self):
+		self.clear_group_cache()
+
+	def on_trash(self):
+		self.clear_group_cache()
+
+	def after_rename(self, old, new, merge=False):
+		self.clear_group_cache()
+
+	def clear_group_cache(self):
+		tally_ledger_groups.clear_cache()
+		frappe.db.after_commit.add(tally_ledger_groups.clear_cache)
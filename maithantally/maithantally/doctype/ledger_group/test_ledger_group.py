@@ -0,0 +1,69 @@
+# Copyright (c) 2026, epsumlabs and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from maithantally import tally_ledger_groups
+
+# On IntegrationTestCase, the doctype test records and all
+# link-field test record dependencies are recursively loaded
+# Use these module variables to add/remove to/from that list
+EXTRA_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+IGNORE_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+
+
+def group(name, parent=tally_ledger_groups.PRIMARY):
+	frappe.get_doc({"doctype": "Ledger Group", "group_name": name, "parent_group": parent}).insert(
+		ignore_permissions=True
+	)
+
+
+def ledger(name, parent):
+	frappe.get_doc({"doctype": "Ledger", "ledger_name": name, "parent_ledger": parent}).insert(
+		ignore_permissions=True
+	)
+
+
+class IntegrationTestLedgerGroup(IntegrationTestCase):
+	def setUp(self):
+		group("_Test Tally Assets")
+		group("_Test Tally Banks", "_Test Tally Assets")
+		group("_Test Tally Current Accounts", "_Test Tally Banks")
+		ledger("_Test Tally HDFC", "_Test Tally Current Accounts")
+		ledger("_Test Tally Petty Cash", "_Test Tally Assets")
+
+	def tearDown(self):
+		frappe.db.rollback()
+		# The closure of the rolled-back rows is still cached.
+		tally_ledger_groups.clear_cache()
+
+	def test_ledger_is_under_every_group_above_it(self):
+		self.assertEqual(
+			tally_ledger_groups.ledger_groups("_Test Tally HDFC"),
+			{"_Test Tally Current Accounts", "_Test Tally Banks", "_Test Tally Assets"},
+		)
+		self.assertTrue(tally_ledger_groups.is_under("_Test Tally HDFC", "Sales Accounts", "_Test Tally Banks"))
+		self.assertFalse(tally_ledger_groups.is_under("_Test Tally Petty Cash", "_Test Tally Banks"))
+
+	def test_unknown_ledger_is_under_nothing(self):
+		self.assertEqual(tally_ledger_groups.ledger_groups("_Test Tally Missing"), frozenset())
+
+	def test_group_edit_refreshes_the_closure(self):
+		self.assertTrue(tally_ledger_groups.is_under("_Test Tally HDFC", "_Test Tally Assets"))
+
+		banks = frappe.get_doc("Ledger Group", "_Test Tally Banks")
+		banks.parent_group = tally_ledger_groups.PRIMARY
+		banks.save(ignore_permissions=True)
+
+		self.assertFalse(tally_ledger_groups.is_under("_Test Tally HDFC", "_Test Tally Assets"))
+
+	def test_cyclic_groups_terminate(self):
+		group("_Test Tally Loop A", "_Test Tally Loop B")
+		group("_Test Tally Loop B", "_Test Tally Loop A")
+		ledger("_Test Tally Looped", "_Test Tally Loop A")
+
+		self.assertEqual(
+			tally_ledger_groups.build_closure()["_Test Tally Looped"],
+			{"_Test Tally Loop A", "_Test Tally Loop B"},
+		)
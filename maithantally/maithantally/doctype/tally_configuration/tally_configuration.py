@@ -1,9 +1,23 @@
 # Copyright (c) 2025, epsumlabs and contributors
 # For license information, please see license.txt
 
-# import frappe
+import frappe
 from frappe.model.document import Document
 
+from maithantally import tally_config
+
 
 class TallyConfiguration(Document):
-	pass
+	def on_update(self):
+		self.clear_config_cache()
+
+	def on_trash(self):
+		self.clear_config_cache()
+
+	def after_rename(self, old, new, merge=False):
+		self.clear_config_cache()
+
+	def clear_config_cache(self):
+		tally_config.clear_cache()
+		# Again once committed, so no worker re-caches the old row in between.
+		frappe.db.after_commit.add(tally_config.clear_cache)
@@ -0,0 +1,32 @@
+// Copyright (c) 2026, epsumlabs and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on("Tally Outbox", {
+	refresh(frm) {
+		if (frm.doc.compressed_response) {
+			frm.add_custom_button(__("View Tally Response"), () => {
+				frappe.call({
+					method: "maithantally.tally_outbox.get_response",
+					args: { name: frm.doc.name },
+					callback: (r) => {
+						frappe.msgprint({
+							title: __("Tally Response"),
+							message: `<pre>${frappe.utils.escape_html(r.message || "")}</pre>`,
+							wide: true,
+						});
+					},
+				});
+			});
+		}
+
+		if (frm.doc.status !== "Dead") return;
+
+		frm.add_custom_button(__("Retry"), () => {
+			frappe.call({
+				method: "maithantally.tally_outbox.requeue",
+				args: { name: frm.doc.name },
+				callback: () => frm.reload_doc(),
+			});
+		});
+	},
+});
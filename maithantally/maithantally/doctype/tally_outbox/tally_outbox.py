@@ -0,0 +1,14 @@
+# Copyright (c) 2026, epsumlabs and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class TallyOutbox(Document):
+	pass
+
+
+def on_doctype_update():
+	# "Failed pushes this week" filters on both columns.
+	frappe.db.add_index("Tally Outbox", ["response_status", "processed_on"])
@@ -0,0 +1,119 @@
+# Copyright (c) 2026, epsumlabs and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests import IntegrationTestCase
+from frappe.utils import now_datetime
+
+from maithantally import tally_batch, tally_outbox
+
+# On IntegrationTestCase, the doctype test records and all
+# link-field test record dependencies are recursively loaded
+# Use these module variables to add/remove to/from that list
+EXTRA_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+IGNORE_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+
+REFERENCE = "TST-OUTBOX-1"
+
+
+def voucher():
+	# Never saved: the outbox only needs the doctype, name and, for a Delete, a snapshot.
+	doc = frappe.get_doc({"doctype": "Journal Voucher", "voucher_number": REFERENCE})
+	doc.name = REFERENCE
+	return doc
+
+
+def entries():
+	return frappe.get_all(
+		"Tally Outbox",
+		filters={"reference_doctype": "Journal Voucher", "reference_name": REFERENCE},
+		fields=["name", "action", "status", "snapshot"],
+		order_by="creation asc",
+	)
+
+
+class IntegrationTestTallyOutbox(IntegrationTestCase):
+	def test_repeated_saves_queue_one_push(self):
+		tally_outbox.enqueue_push(voucher(), "Create", wake=False)
+		tally_outbox.enqueue_push(voucher(), "Create", wake=False)
+		tally_outbox.enqueue_push(voucher(), "Alter", wake=False)
+		tally_outbox.enqueue_push(voucher(), "Alter", wake=False)
+
+		self.assertEqual([(e.action, e.status) for e in entries()], [("Create", "Queued"), ("Alter", "Queued")])
+		self.assertTrue(tally_outbox.has_pending(voucher(), "Create"))
+
+	def test_delete_before_the_create_left_discards_both(self):
+		tally_outbox.enqueue_push(voucher(), "Create", wake=False)
+		tally_outbox.enqueue_push(voucher(), "Alter", wake=False)
+		tally_outbox.enqueue_push(voucher(), "Delete", wake=False)
+
+		self.assertEqual(entries(), [])
+
+	def test_delete_keeps_a_snapshot(self):
+		tally_outbox.enqueue_push(voucher(), "Delete", wake=False)
+
+		(entry,) = entries()
+		self.assertEqual(entry.action, "Delete")
+		self.assertEqual(frappe.parse_json(entry.snapshot)["voucher_number"], REFERENCE)
+
+	def test_cancel_then_delete_queues_one_delete(self):
+		doc = voucher()
+		doc.docstatus = 2
+		tally_outbox.enqueue_delete(doc, "on_cancel")
+		tally_outbox.enqueue_delete(doc, "after_delete")
+		tally_outbox.enqueue_push(voucher(), "Delete", wake=False)
+
+		self.assertEqual([e.action for e in entries()], ["Delete"])
+
+	def test_failure_backs_off_then_goes_dead(self):
+		tally_outbox.enqueue_push(voucher(), "Create", wake=False)
+		entry = frappe.get_doc("Tally Outbox", entries()[0].name)
+
+		tally_outbox._mark_failed(entry, "Connection refused")
+		entry.reload()
+		self.assertEqual((entry.status, entry.attempts, entry.last_error), ("Queued", 1, "Connection refused"))
+		self.assertGreater(entry.next_attempt_at, now_datetime())
+
+		entry.db_set("attempts", tally_outbox.MAX_ATTEMPTS - 1)
+		tally_outbox._mark_failed(entry, "Connection refused")
+		entry.reload()
+		self.assertEqual(entry.status, "Dead")
+		self.assertIsNone(entry.next_attempt_at)
+
+	def test_validation_error_is_not_retried(self):
+		tally_outbox.enqueue_push(voucher(), "Create", wake=False)
+		entry = frappe.get_doc("Tally Outbox", entries()[0].name)
+
+		tally_outbox._mark_failed(entry, frappe.ValidationError("Ledger Amount must be greater than zero"))
+		entry.reload()
+		self.assertEqual((entry.status, entry.attempts), ("Dead", 1))
+
+	def test_tally_rejection_is_not_retried(self):
+		tally_outbox.enqueue_push(voucher(), "Create", wake=False)
+		entry = frappe.get_doc("Tally Outbox", entries()[0].name)
+		result = frappe._dict(
+			status=tally_batch.FAILED,
+			error="Voucher 'TST-OUTBOX-1' already exists",
+			retryable=False,
+			summary=None,
+			response_text="<RESPONSE><ERRORS>1</ERRORS></RESPONSE>",
+			request_hash=None,
+		)
+
+		tally_outbox._apply_result(entry, result)
+		entry.reload()
+		self.assertEqual((entry.status, entry.attempts), ("Dead", 1))
+
+	def test_shared_envelope_keeps_only_the_vouchers_own_outcome(self):
+		result = frappe._dict(
+			status=tally_batch.FAILED,
+			error="Voucher 'TST-OUTBOX-1' already exists",
+			summary=None,
+			response_text="<RESPONSE><CREATED>4</CREATED><LASTVCHID>99</LASTVCHID></RESPONSE>",
+			request_hash=None,
+		)
+		values = tally_outbox._response_fields(result)
+
+		self.assertEqual(values["line_errors"], "Voucher 'TST-OUTBOX-1' already exists")
+		self.assertEqual((values["tally_created"], values["tally_voucher_id"]), (0, None))
+		self.assertIsNotNone(values["compressed_response"])
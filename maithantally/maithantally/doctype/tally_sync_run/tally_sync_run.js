@@ -0,0 +1,16 @@
+// Copyright (c) 2026, epsumlabs and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on("Tally Sync Run", {
+	refresh(frm) {
+		if (frm.doc.status !== "Failed") return;
+
+		frm.add_custom_button(__("Resume"), () => {
+			frappe.call({
+				method: "maithantally.tally_sync_run.resume",
+				args: { name: frm.doc.name },
+				callback: () => frm.reload_doc(),
+			});
+		});
+	},
+});
@@ -0,0 +1,93 @@
+# Copyright (c) 2026, epsumlabs and Contributors
+# See license.txt
+
+from datetime import date
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from maithantally import tally_sync_run, tally_watermarks
+from maithantally.tally_bulk import VoucherBulkWriter
+from maithantally.tally_chunks import ChunkFetchError, ChunkPlanner
+from maithantally.tally_stream import Download
+
+# On IntegrationTestCase, the doctype test records and all
+# link-field test record dependencies are recursively loaded
+# Use these module variables to add/remove to/from that list
+EXTRA_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+IGNORE_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+
+METHOD = "maithantally.tests.tally_sync_run"
+COMPANY = "_Test Tally Sync Run Company"
+COLLECTIONS = tally_watermarks.scoped("vouchers", ["Journal"])
+
+
+def export(*alter_ids):
+	download = Download()
+	download.write(b"".join(b"<VOUCHER><ALTERID>%d</ALTERID></VOUCHER>" % alter_id for alter_id in alter_ids))
+	return download
+
+
+class IntegrationTestTallySyncRun(IntegrationTestCase):
+	def tearDown(self):
+		# Runs commit per chunk, so clean up explicitly.
+		frappe.db.rollback()
+		for name in frappe.get_all("Tally Sync Run", filters={"method": METHOD}, pluck="name"):
+			frappe.delete_doc("Tally Sync Run", name, force=True, ignore_permissions=True)
+		frappe.db.commit()
+
+	def start(self, **kwargs):
+		return tally_sync_run.start(METHOD, COMPANY, date(2025, 1, 1), date(2025, 1, 31), **kwargs)
+
+	def test_failed_run_resumes_after_its_completed_chunks(self):
+		run = self.start()
+		payloads = {date(2025, 1, 1): (11, 14), date(2025, 1, 16): (12,)}
+
+		def fetch(start, end):
+			if start not in payloads:
+				raise ChunkFetchError("Memory Access Violation")
+			download = export(*payloads[start])
+			return download, download.vouchers
+
+		def process(window, download):
+			return {"vouchers": download.vouchers}
+
+		planner = ChunkPlanner(date(2025, 1, 1), date(2025, 1, 31), window_days=15, max_days=15)
+		with self.assertRaises(ChunkFetchError):
+			tally_sync_run.run_chunks(run, planner, fetch, 1, process, VoucherBulkWriter())
+		tally_sync_run.fail(run, "Memory Access Violation")
+
+		run = tally_sync_run.load(run.name)
+		self.assertEqual(
+			tally_sync_run.completed_windows(run),
+			[(date(2025, 1, 1), date(2025, 1, 15)), (date(2025, 1, 16), date(2025, 1, 30))],
+		)
+		self.assertEqual((run.vouchers, run.last_alter_id), (3, 14))
+		self.assertTrue(all(chunk.payload_hash for chunk in run.chunks))
+
+		resumed = ChunkPlanner(
+			date(2025, 1, 1), date(2025, 1, 31), completed=tally_sync_run.completed_windows(run)
+		)
+		self.assertEqual(resumed.next_window(), (date(2025, 1, 31), date(2025, 1, 31)))
+
+	def test_completed_run_cannot_be_reopened(self):
+		run = self.start()
+		tally_sync_run.finish(run)
+
+		with self.assertRaises(frappe.ValidationError):
+			tally_sync_run.load(run.name)
+
+	def test_watermarks_stop_below_held_vouchers(self):
+		run = self.start()
+		run.last_alter_id = 90
+		run.held_alter_id = 61
+
+		tally_sync_run.advance_watermarks(run, COLLECTIONS)
+		self.assertEqual(tally_watermarks.get_since(COMPANY, COLLECTIONS), 60)
+
+	def test_explicit_range_leaves_watermarks_alone(self):
+		run = self.start(update_watermarks=False)
+		run.last_alter_id = 90
+
+		tally_sync_run.advance_watermarks(run, COLLECTIONS)
+		self.assertEqual(tally_watermarks.get_since(COMPANY, COLLECTIONS), 0)
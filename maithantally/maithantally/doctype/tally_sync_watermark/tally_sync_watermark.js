@@ -0,0 +1,8 @@
+// Copyright (c) 2026, epsumlabs and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("Tally Sync Watermark", {
+// 	refresh(frm) {
+
+// 	},
+// });
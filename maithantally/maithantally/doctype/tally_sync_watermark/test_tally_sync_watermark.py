@@ -0,0 +1,57 @@
+# Copyright (c) 2026, epsumlabs and Contributors
+# See license.txt
+
+from frappe.tests import IntegrationTestCase
+
+from maithantally import tally_watermarks
+
+# On IntegrationTestCase, the doctype test records and all
+# link-field test record dependencies are recursively loaded
+# Use these module variables to add/remove to/from that list
+EXTRA_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+IGNORE_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+
+COMPANY = "_Test Tally Watermark Company"
+COLLECTIONS = tally_watermarks.scoped("vouchers", ["Journal", "Contra"])
+
+
+class IntegrationTestTallySyncWatermark(IntegrationTestCase):
+	def test_no_watermark_means_full_sync(self):
+		self.assertEqual(tally_watermarks.get_since(COMPANY, COLLECTIONS), 0)
+
+		tally_watermarks.advance(COMPANY, COLLECTIONS[:1], 50)
+		self.assertEqual(tally_watermarks.get_since(COMPANY, COLLECTIONS), 0)
+
+	def test_advance_never_moves_back(self):
+		tally_watermarks.advance(COMPANY, COLLECTIONS, 50, master_id=7)
+		tally_watermarks.advance(COMPANY, COLLECTIONS, 40, master_id=3)
+
+		self.assertEqual(tally_watermarks.get_since(COMPANY, COLLECTIONS), 50)
+
+	def test_held_alter_id_stops_the_watermark_below_it(self):
+		tally_watermarks.advance(COMPANY, COLLECTIONS, 90, held_alter_id=61)
+		self.assertEqual(tally_watermarks.get_since(COMPANY, COLLECTIONS), 60)
+
+	def test_nothing_to_advance_to(self):
+		tally_watermarks.advance(COMPANY, COLLECTIONS, 90, held_alter_id=1)
+		tally_watermarks.advance(COMPANY, COLLECTIONS, 0)
+
+		self.assertEqual(tally_watermarks.get_since(COMPANY, COLLECTIONS), 0)
+
+	def test_pull_methods_keep_their_own_watermarks(self):
+		tally_watermarks.advance(COMPANY, tally_watermarks.scoped("contra", ["Contra"]), 80)
+
+		self.assertEqual(tally_watermarks.get_alter_id(COMPANY, "contra:Contra"), 80)
+		self.assertEqual(tally_watermarks.get_alter_id(COMPANY, "vouchers:Contra"), 0)
+
+	def test_max_ids(self):
+		payload = b"<VOUCHER><ALTERID> 12</ALTERID><MASTERID>3</MASTERID></VOUCHER><ALTERID TYPE=\"Number\">9</ALTERID>"
+		self.assertEqual(tally_watermarks.max_ids(payload), (12, 3))
+		self.assertEqual(tally_watermarks.max_ids(b""), (0, 0))
+
+	def test_collection_filter(self):
+		self.assertEqual(tally_watermarks.collection_filter(0), ("", ""))
+
+		filters, definition = tally_watermarks.collection_filter(42)
+		self.assertIn(tally_watermarks.FILTER_NAME, filters)
+		self.assertIn("$AlterID &gt; 42", definition)
@@ -15,22 +15,32 @@ frappe.pages['fetching-item-name'].on_page_load = function(wrapper) {
 			freeze: true,
 			freeze_message:"Fetching Item.....",
 			callback: function(r){
-				let items=r.message || [];
-				if (!Array.isArray(items)) {
-					items=[items];
+				let result=r.message || {};
+				if (result.error) {
+					$('#item-result').html(`
+						<div class="frappe-card p-3">
+						<h4>Item fetch failed</h4>
+						<p>${frappe.utils.escape_html(result.error)}</p>
+						</div>
+					`);
+					return;
 				}
+				let items=result.items || [];
+				let summary=`${result.inserted || 0} new, ${result.updated || 0} updated, ${result.unchanged || 0} unchanged`;
 				if(items.length===0) {
 					$('#item-result').html(`
 						<div class="frappe-card p-3">
 						<h4>No new items found.</h4>
+						<p>${summary}</p>
 						</div>
 					`);
 					return;
 				}
-				let htmlRows=items.map(i => `<tr><td>${i}</td></tr>`).join("");
+				let htmlRows=items.map(i => `<tr><td>${frappe.utils.escape_html(i)}</td></tr>`).join("");
 				$('#item-result').html(`
 					<div class="frappe-card p-8">
 					<h4>Fetched Items List:</h4>
+					<p>${summary}</p>
 					<table class="table table-bordered">
 					<thead>
 					<tr>
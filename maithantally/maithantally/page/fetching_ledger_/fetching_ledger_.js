@@ -24,27 +24,38 @@ frappe.pages['fetching-ledger-'].on_page_load = function (wrapper) {
             freeze_message: "Fetching Ledger...",
             callback: function (r) {
 
-                let ledgers = r.message || [];
+                let result = r.message || {};
 
-                if (!Array.isArray(ledgers)) {
-                    ledgers = [ledgers];
+                if (result.error) {
+                    $('#ledger-result').html(`
+                        <div class="frappe-card p-3">
+                            <h4>Ledger fetch failed</h4>
+                            <p>${frappe.utils.escape_html(result.error)}</p>
+                        </div>
+                    `);
+                    return;
                 }
 
+                let ledgers = result.ledgers || [];
+                let summary = `${result.inserted || 0} new, ${result.updated || 0} updated, ${result.unchanged || 0} unchanged`;
+
                 if (ledgers.length === 0) {
                     $('#ledger-result').html(`
                         <div class="frappe-card p-3">
                             <h4>No new ledgers found.</h4>
+                            <p>${summary}</p>
                         </div>
                     `);
                     return;
                 }
 
                 
-                let htmlRows = ledgers.map(l => `<tr><td>${l}</td></tr>`).join("");
+                let htmlRows = ledgers.map(l => `<tr><td>${frappe.utils.escape_html(l)}</td></tr>`).join("");
 
                 $('#ledger-result').html(`
                     <div class="frappe-card p-3">
                         <h4>Fetched Ledgers List:</h4>
+                        <p>${summary}</p>
                         <table class="table table-bordered">
                             <thead>
                                 <tr>
@@ -1,42 +1,43 @@
-import requests
-from lxml import etree
+import logging
 import re
-import frappe
-from datetime import datetime
 import xml.sax.saxutils as saxutils
+from contextlib import nullcontext
+from datetime import date, datetime
+
+import frappe
+from frappe.utils import getdate
+
+from maithantally import tally_stream, tally_sync_run, tally_watermarks
+from maithantally.tally_bulk import VoucherBulkWriter
+from maithantally.tally_chunks import ChunkPlanner
+from maithantally.tally_concurrency import exclusive_sync, get_request_budget
+from maithantally.tally_config import get_active_tally_config
+from maithantally.tally_extract import extract_voucher
+from maithantally.tally_ledger_resolver import LedgerResolver
+from maithantally.tally_log import RunLog
+from maithantally.tally_metrics import StageTimer
+
+VOUCHER_MAP = {
+    "Contra": "Contra Voucher",
+    "Receipt": "Receipt Voucher",
+    "Payment": "Payment Voucher",
+    "Journal": "Journal Voucher",
+}
+
+
+def get_sync_range(from_date=None, to_date=None):
+    """Default to the current financial year (April to March) up to today."""
+    to_date = getdate(to_date) if to_date else getdate()
+    if from_date:
+        return getdate(from_date), to_date
+
+    fy_start_year = to_date.year if to_date.month >= 4 else to_date.year - 1
+    return date(fy_start_year, 4, 1), to_date
+
 
-def get_frappe_ledger(tally_name):
-    if not tally_name:
-        return None
-        
-    # Standardize spaces
-    clean_name = " ".join(tally_name.split()).strip()
-    
-    # 1. Try direct match
-    if frappe.db.exists("Ledger", clean_name):
-        return clean_name
-        
-    # 2. Handle the common '&' character mismatch (e.g., 'Ventures And Industries' vs 'Ventures & Industries')
-    if " and " in clean_name.lower():
-        test_name = re.sub(r'(?i)\sand\s', ' & ', clean_name)
-        if frappe.db.exists("Ledger", test_name):
-            return test_name
-            
-    # 3. Fallback to SQL 'LIKE' for flexible matching
-    match = frappe.db.get_value("Ledger", {"name": ["like", f"%{clean_name}%"]}, "name")
-    return match if match else clean_name
-
-def sync_contra_vouchers():
-    tally_url = "http://v41066.22055.tallyprimecloud.in:9040/"
-    
-    # CRITICAL: This must match the Tally Title Bar EXACTLY
-    company_name = "Dummy Company" 
-    
-    # CHUNKING: Requesting 1 month only to prevent 'Memory Access Violation'
-    start_date = "20260401"
-    end_date = "20260430"
-    
-    tally_payload = f"""<ENVELOPE>
+def build_voucher_export(company_name, start_date, end_date, since_alter_id=0):
+    filters, filter_definition = tally_watermarks.collection_filter(since_alter_id)
+    return f"""<ENVELOPE>
   <HEADER>
     <VERSION>1</VERSION>
     <TALLYREQUEST>Export</TALLYREQUEST>
@@ -48,118 +49,202 @@ def sync_contra_vouchers():
       <STATICVARIABLES>
         <SVCURRENTCOMPANY>{saxutils.escape(company_name)}</SVCURRENTCOMPANY>
         <SVEXPORTFORMAT>$$SysName:XML</SVEXPORTFORMAT>
-        <SVFROMDATE>{start_date}</SVFROMDATE>
-        <SVTODATE>{end_date}</SVTODATE>
+        <SVFROMDATE>{start_date.strftime("%Y%m%d")}</SVFROMDATE>
+        <SVTODATE>{end_date.strftime("%Y%m%d")}</SVTODATE>
       </STATICVARIABLES>
       <TDL>
         <TDLMESSAGE>
           <COLLECTION NAME="VoucherList" ISMODIFY="No">
             <TYPE>Voucher</TYPE>
-            <FETCH>VOUCHERNUMBER, DATE, VCHTYPE, VOUCHERTYPENAME, NARRATION, ALLLEDGERENTRIES.LIST</FETCH>
+            <FETCH>VOUCHERNUMBER, DATE, VCHTYPE, VOUCHERTYPENAME, NARRATION, ALTERID, MASTERID, ALLLEDGERENTRIES.LIST</FETCH>
+            {filters}
           </COLLECTION>
+          {filter_definition}
         </TDLMESSAGE>
       </TDL>
     </DESC>
   </BODY>
 </ENVELOPE>"""
 
+
+def fetch_voucher_window(config, start_date, end_date, since_alter_id=0, budget=None, timer=None):
+    """Fetch one date window. Runs in a worker thread: HTTP only, no DB."""
+    with timer.stage("build_xml") if timer else nullcontext():
+        xml = build_voucher_export(config.company, start_date, end_date, since_alter_id)
+
+    download = tally_stream.download(config.url, xml, timeout=config.timeout, budget=budget, timer=timer)
+    return download, download.vouchers
+
+
+@exclusive_sync
+def sync_contra_vouchers(from_date=None, to_date=None, full=False, run=None):
+    """Pull Contra, Receipt, Payment and Journal vouchers into Frappe.
+
+    Every completed date window is committed and checkpointed on a Tally
+    Sync Run; pass `run` (the name of a failed run) to resume it.
+    """
+    timer = StageTimer("pull")
+
+    # CRITICAL: the configured company must match the Tally Title Bar EXACTLY
+    with timer.stage("config"):
+        config = get_active_tally_config()
+    log = RunLog("pull", config)
+    collections = tally_watermarks.scoped("contra", VOUCHER_MAP)
+
+    if run:
+        run = tally_sync_run.load(run)
+        company_name = run.company
+        from_date, to_date = getdate(run.from_date), getdate(run.to_date)
+        since_alter_id = run.since_alter_id
+        completed = tally_sync_run.completed_windows(run)
+    else:
+        company_name = config.company
+        # The watermarks belong to the default range; an explicit one is pulled in full.
+        explicit_range = bool(from_date or to_date)
+        # CHUNKING: the range is pulled in adaptive date windows (see tally_chunks)
+        # to prevent 'Memory Access Violation' on large exports
+        from_date, to_date = get_sync_range(from_date, to_date)
+        # INCREMENTAL: only vouchers altered since the last successful run (see
+        # tally_watermarks).
+        since_alter_id = 0 if full or explicit_range else tally_watermarks.get_since(company_name, collections)
+        completed = []
+        run = tally_sync_run.start(
+            "maithantally.tally.sync_contra_vouchers", company_name, from_date, to_date, full, since_alter_id,
+            update_watermarks=not explicit_range,
+        )
+    log.bind(run.name)
+
+    if since_alter_id:
+        # A delta is small, so it starts as a single window.
+        planner = ChunkPlanner(from_date, to_date, window_days=(to_date - from_date).days + 1, completed=completed)
+        log.info("Incremental sync: vouchers altered after ALTERID %s", since_alter_id)
+    else:
+        planner = ChunkPlanner(from_date, to_date, completed=completed)
+
+    budget = get_request_budget(config)
+
+    def fetch(start_date, end_date):
+        return fetch_voucher_window(config, start_date, end_date, since_alter_id, budget, timer)
+
+    # All Ledger names are loaded once and matched in memory for the whole run.
+    with timer.stage("ledger_resolve"):
+        ledgers = LedgerResolver.load()
+    writer = VoucherBulkWriter(timer=timer)
+
+    def process(window, download):
+        vouchers = timer.iterate(tally_stream.iter_vouchers(download.chunks()), "stream")
+        synced = import_vouchers(vouchers, ledgers, writer, timer, log)
+        log.info("Window %s to %s: %s vouchers synced", window[0], window[1], synced)
+        return {"vouchers": synced}
+
     try:
-        # Increased timeout for Tally Cloud stability
-        response = requests.post(tally_url, data=tally_payload, timeout=60)
-        raw_xml = response.content.decode("utf-8", errors="ignore")
-        
-        if "<VOUCHER" in raw_xml:
-            v_count = raw_xml.count("<VOUCHER")
-            print(f"SUCCESS: Found {v_count} vouchers. Starting Import...")
-        else:
-            print("WARNING: No Vouchers found. Ensure the Company is open in Tally.")
-            return
+        tally_sync_run.run_chunks(
+            run, planner, fetch, config.parallel_fetches, process, writer, archive=config.archive_payloads
+        )
     except Exception as e:
-        print(f"CONNECTION ERROR: {str(e)}")
+        log.error("Sync failed; resume the run to continue: %s", e)
         frappe.log_error("Tally Sync Connection Error", str(e))
-        return
-
-    def clean_text(text):
-        if not text: return ""
-        text = re.sub(r'[\x00-\x1f\x7f-\xff]', '', text)
-        text = saxutils.unescape(text)
-        return " ".join(text.split()).strip()
-
-    def get_val(elem, tag):
-        res = elem.xpath(f".//*[local-name()='{tag}']/text()")
-        return clean_text(res[0]) if res else ""
-
-    voucher_map = {
-        "Contra": "Contra Voucher",
-        "Receipt": "Receipt Voucher",
-        "Payment": "Payment Voucher",
-        "Journal": "Journal Voucher",
-    }
-
-    parser = etree.XMLParser(recover=True)
-    root = etree.fromstring(raw_xml.encode("utf-8"), parser=parser)
+        tally_sync_run.fail(run, e, timer, log)
+        return run
+
+    if not run.vouchers and not since_alter_id:
+        log.warning("No vouchers found. Ensure the company is open in Tally.")
+
+    tally_sync_run.advance_watermarks(run, collections)
+    tally_sync_run.finish(run, timer, log)
+    log.info(
+        "Import complete: %s vouchers synced (%s new, %s updated, %s unchanged)",
+        run.vouchers, run.inserted, run.updated, run.unchanged,
+    )
+    return run
+
+
+def clean_text(text):
+    if not text:
+        return ""
+    text = re.sub(r'[\x00-\x1f\x7f-\xff]', '', text)
+    text = saxutils.unescape(text)
+    return " ".join(text.split()).strip()
+
+
+def import_vouchers(vouchers, ledgers=None, writer=None, timer=None, log=None):
+    """Upsert every supported voucher from a stream of <VOUCHER> elements; returns the count.
+
+    Vouchers are handed to a VoucherBulkWriter, which writes and commits
+    them in batches; without one, a writer is flushed at the end. Extraction
+    and ledger matching are charged to `timer` (a tally_metrics.StageTimer);
+    per-voucher outcomes are counted, and sampled, on `log` (a tally_log.RunLog).
+    """
+    log = log or RunLog("pull")
+    ledgers = ledgers or LedgerResolver.load()
+    own_writer = writer is None
+    writer = writer or VoucherBulkWriter(timer=timer)
     tally_vouchers_seen = 0
 
-    for voucher in root.xpath("//VOUCHER"):
+    for voucher in vouchers:
+        record = None
         try:
-            v_num = get_val(voucher, "VOUCHERNUMBER").upper()
-            v_type_tally = voucher.get("VCHTYPE") or get_val(voucher, "VOUCHERTYPENAME")
-            
-            if not v_num or v_type_tally not in voucher_map:
+            with timer.stage("parse") if timer else nullcontext():
+                record = extract_voucher(voucher)
+            v_num = clean_text(record.voucher_number).upper()
+            v_type_tally = clean_text(record.voucher_type)
+
+            if not v_num or v_type_tally not in VOUCHER_MAP:
+                log.event("skip_unsupported")
                 continue
 
-            v_date_str = get_val(voucher, "DATE")
+            v_date_str = clean_text(record.date)
             v_date = datetime.strptime(v_date_str, "%Y%m%d").date() if v_date_str else None
-            v_narration = get_val(voucher, "NARRATION")
+            v_narration = clean_text(record.narration)
             ledger_rows = []
 
-            for entry in voucher.xpath(".//*[local-name()='ALLLEDGERENTRIES.LIST']"):
-                raw_lname = get_val(entry, "LEDGERNAME")
-                lname = get_frappe_ledger(raw_lname)
-                
-                amt = float(get_val(entry, "AMOUNT") or 0)
-                if not lname or amt == 0: 
-                    continue
+            with timer.stage("ledger_resolve") if timer else nullcontext():
+                for raw_lname, raw_amount in record.ledger_entries:
+                    lname = ledgers.resolve(clean_text(raw_lname))
 
-                ledger_rows.append({
-                    "ledger": lname,
-                    "entry_type": "Debit" if amt < 0 else "Credit",
-                    "ledger_amount": abs(amt)
-                })
+                    amt = float(clean_text(raw_amount) or 0)
+                    if not lname or amt == 0:
+                        continue
+                    if not ledgers.is_known(lname):
+                        raise frappe.LinkValidationError(f"Could not find Ledger: {lname}")
+
+                    ledger_rows.append({
+                        "ledger": lname,
+                        "entry_type": "Debit" if amt < 0 else "Credit",
+                        "ledger_amount": abs(amt)
+                    })
 
             if len(ledger_rows) < 2:
+                # Cancelled, optional and memo vouchers export like this; no
+                # later pull will import them, so the watermark moves past.
+                log.event("skip_incomplete", "Skipped %s #%s: fewer than two ledger entries", v_type_tally, v_num)
                 continue
 
-            doctype = voucher_map[v_type_tally]
-            existing = frappe.db.exists(doctype, {"voucher_number": v_num, "voucher_type": v_type_tally})
-            
-            if existing:
-                doc = frappe.get_doc(doctype, existing)
-                doc.date = v_date
-                doc.narration = v_narration
-                doc.set("voucher_ledger_entry", [])
-                for row in ledger_rows:
-                    doc.append("voucher_ledger_entry", row)
-                doc.save(ignore_permissions=True)
-            else:
-                doc = frappe.get_doc({
-                    "doctype": doctype,
-                    "voucher_number": v_num,
-                    "voucher_type": v_type_tally,
-                    "date": v_date,
-                    "narration": v_narration,
-                    "is_pushed_to_tally": 1,
-                    "voucher_ledger_entry": ledger_rows
-                })
-                doc.flags.from_pull = True
-                doc.insert(ignore_permissions=True)
-
-            tally_vouchers_seen += 1
-            print(f"Synced {v_type_tally} #{v_num}")
-            
+            pulled = {
+                "voucher_number": v_num,
+                "voucher_type": v_type_tally,
+                "date": v_date,
+                "narration": v_narration,
+                "entries": ledger_rows,
+            }
+
+        except frappe.LinkValidationError as e:
+            # A ledger not pulled yet: hold the watermark so the next delta retries it.
+            writer.hold(record.alter_id)
+            log.event("skip_unknown_ledger", "Skipped %s #%s: %s", v_type_tally, v_num, e, level=logging.WARNING)
+            continue
         except Exception as e:
-            print(f"Error processing voucher: {str(e)}")
+            # Malformed data fails the same way every time; holding for it
+            # would pin the watermark for good.
+            log.event("error", "Error processing voucher: %s", e, level=logging.WARNING)
             continue
 
-    frappe.db.commit()
-    print(f"Import Complete. {tally_vouchers_seen} vouchers synced.")
\ No newline at end of file
+        # Outside the try: a failed batch write must abort the sync, not be
+        # reported as one bad voucher.
+        writer.add(VOUCHER_MAP[v_type_tally], pulled)
+        tally_vouchers_seen += 1
+        log.event("synced", "Synced %s #%s", v_type_tally, v_num)
+
+    if own_writer:
+        writer.flush()
+    return tally_vouchers_seen
@@ -0,0 +1,186 @@
+import cProfile
+import gzip
+import hashlib
+import os
+import tempfile
+import time
+
+import frappe
+from frappe.utils import cint
+
+from maithantally import tally_stream
+from maithantally.tally_bulk import VoucherBulkWriter
+from maithantally.tally_config import get_active_tally_config
+from maithantally.tally_ledger_resolver import LedgerResolver
+from maithantally.tally_log import RunLog
+from maithantally.tally_metrics import StageTimer
+
+# Raw Tally payloads, kept so a misbehaving pull can be reproduced. With
+# "Archive Payloads" on in the Tally Configuration, every voucher export is
+# stored as Tally sent it (control characters and all) and every import
+# envelope as it was sent, gzipped, under private/tally_archive of the site.
+# Files are named by the SHA-256 of the uncompressed bytes, so a window that
+# comes back unchanged is stored once. The index is what already records
+# the hash: each Tally Sync Run chunk (payload_hash) for exports and each
+# Tally Outbox entry (request_hash) for imports.
+#
+# replay() feeds a stored export through the same extraction, ledger
+# matching and bulk writes as sync_contra_vouchers, without Tally.
+
+ARCHIVE_DIR = "tally_archive"
+DEFAULT_RETENTION_DAYS = 14
+CHUNK_SIZE = tally_stream.CHUNK_SIZE
+
+
+def archive_path(digest):
+    return frappe.get_site_path("private", ARCHIVE_DIR, digest[:2], f"{digest}.xml.gz")
+
+
+def store(chunks, digest=None):
+    """Store a payload given as byte chunks; returns its SHA-256.
+
+    Pass `digest` when it is already known (tally_stream.Download hashes
+    the body as it arrives) to skip a payload that is stored already.
+    """
+    if digest and os.path.exists(archive_path(digest)):
+        # Fresh again as far as purge() is concerned.
+        os.utime(archive_path(digest))
+        return digest
+
+    directory = frappe.get_site_path("private", ARCHIVE_DIR)
+    os.makedirs(directory, exist_ok=True)
+    sha = hashlib.sha256()
+
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6, mtime=0) as out:
+            for chunk in chunks:
+                sha.update(chunk)
+                out.write(chunk)
+
+        digest = sha.hexdigest()
+        path = archive_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Another worker may have stored the same payload meanwhile; same bytes either way.
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return digest
+
+
+def store_download(download):
+    return store(download.chunks(), download.payload_hash)
+
+
+def store_text(text):
+    return store([text.encode("utf-8")])
+
+
+def read_chunks(digest=None, path=None, chunk_size=CHUNK_SIZE):
+    """Yield a stored payload, or a local export file (plain or .gz), as bytes."""
+    path = path or archive_path(digest)
+    if not os.path.exists(path):
+        frappe.throw(f"No archived Tally payload at {path}")
+
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as fh:
+        while True:
+            chunk = fh.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def run_payloads(run, chunk=None):
+    """The archived export hashes of a Tally Sync Run, one per chunk (by row number)."""
+    filters = {"parent": run, "parenttype": "Tally Sync Run", "parentfield": "chunks"}
+    if chunk:
+        filters["idx"] = cint(chunk)
+    hashes = frappe.get_all("Tally Sync Run Chunk", filters=filters, order_by="idx asc", pluck="payload_hash")
+    hashes = [digest for digest in hashes if digest]
+    if not hashes:
+        frappe.throw(f"Tally Sync Run {run} has no archived chunk {chunk or ''}".rstrip())
+    return hashes
+
+
+class _DiscardingWriter(VoucherBulkWriter):
+    """Batches like the real writer but never touches the voucher tables."""
+
+    def write(self, doctype, vouchers):
+        self.counts["unchanged"] += len(vouchers)
+
+
+def replay(run=None, chunk=None, payload_hash=None, path=None, write=True, profile=None):
+    """Re-run voucher import on archived exports, with no Tally connection.
+
+        bench --site <site> execute maithantally.tally_archive.replay \\
+            --kwargs "{'run': '<sync run name>', 'chunk': 3, 'profile': '/tmp/replay.prof'}"
+
+    The payload is a chunk of `run` (every chunk when `chunk` is not
+    given), a stored `payload_hash`, or an export file at `path` copied
+    from another site. With `write` the vouchers are upserted exactly as a
+    pull would, so replay on a copy of the site; without it only parsing
+    and ledger matching run. `profile` dumps cProfile stats to that file.
+    Returns the counts and per-stage timings.
+    """
+    if path:
+        sources = [{"path": path}]
+    elif payload_hash:
+        sources = [{"digest": payload_hash}]
+    elif run:
+        sources = [{"digest": digest} for digest in run_payloads(run, chunk)]
+    else:
+        frappe.throw("Pass a run, a payload_hash or a path to replay")
+
+    # Deferred: tally imports tally_sync_run, which imports this module.
+    from maithantally.tally import import_vouchers
+
+    timer = StageTimer("replay")
+    log = RunLog("replay", get_active_tally_config())
+    log.bind(run or payload_hash or os.path.basename(path))
+    with timer.stage("ledger_resolve"):
+        ledgers = LedgerResolver.load()
+    writer = VoucherBulkWriter(timer=timer) if write else _DiscardingWriter(timer=timer)
+
+    profiler = cProfile.Profile() if profile else None
+    started = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    try:
+        vouchers = 0
+        for source in sources:
+            elements = tally_stream.iter_vouchers(read_chunks(**source))
+            vouchers += import_vouchers(timer.iterate(elements, "stream"), ledgers, writer, timer, log)
+        writer.flush()
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile)
+
+    log.summary()
+    return {
+        "payloads": len(sources),
+        "vouchers": vouchers,
+        "seconds": round(time.perf_counter() - started, 3),
+        **writer.counts,
+        "stages": timer.summary(),
+    }
+
+
+def purge(days=None):
+    """Delete archived payloads older than the retention period. Runs daily."""
+    directory = frappe.get_site_path("private", ARCHIVE_DIR)
+    if not os.path.isdir(directory):
+        return
+
+    if days is None:
+        days = frappe.db.get_value("Tally Configuration", {"is_active": 1}, "archive_retention_days")
+    cutoff = time.time() - (cint(days) or DEFAULT_RETENTION_DAYS) * 86400
+
+    for root, _, files in os.walk(directory):
+        for name in files:
+            file_path = os.path.join(root, name)
+            if os.path.getmtime(file_path) < cutoff:
+                os.remove(file_path)
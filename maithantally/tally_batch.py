@@ -0,0 +1,297 @@
+import re
+from contextlib import nullcontext
+
+import frappe
+from frappe.utils import cint, getdate
+
+from maithantally import tally_archive, tally_client, tally_stream
+from maithantally.tally_concurrency import get_request_budget
+from maithantally.tally_config import get_active_tally_config
+from maithantally.tally_extract import extract_voucher
+from maithantally.tally_log import capture_payload, get_logger
+from maithantally.tally_response import describe, is_rejection, parse_import_response, processed_count
+from maithantally.tally_xml import escape_xml, import_envelope, tally_date
+
+# Packs many vouchers of any supported type into one import envelope so a
+# back-load of thousands of documents costs a few dozen HTTP round-trips.
+
+VOUCHER_BUILDERS = {
+    "Sales Voucher": "maithantally.tally_sales.build_voucher_xml",
+    "Purchase Voucher": "maithantally.tally_purchase.build_voucher_xml",
+    "Sales Order": "maithantally.tally_sales_order.build_voucher_xml",
+    "Purchase Order": "maithantally.tally_purchase_order.build_voucher_xml",
+    "Contra Voucher": "maithantally.maithantally.doctype.contra_voucher.contra_voucher.build_voucher_xml",
+    "Journal Voucher": "maithantally.maithantally.doctype.journal_voucher.journal_voucher.build_voucher_xml",
+    "Payment Voucher": "maithantally.maithantally.doctype.payment_voucher.payment_voucher.build_voucher_xml",
+    "Receipt Voucher": "maithantally.maithantally.doctype.receipt_voucher.receipt_voucher.build_voucher_xml",
+}
+
+# Tally voucher type each DocType is pushed as.
+VOUCHER_TYPES = {
+    "Sales Voucher": "Sales",
+    "Purchase Voucher": "Purchase",
+    "Sales Order": "Sales Order",
+    "Purchase Order": "Purchase Order",
+    "Contra Voucher": "Contra",
+    "Journal Voucher": "Journal",
+    "Payment Voucher": "Payment",
+    "Receipt Voucher": "Receipt",
+}
+
+SUCCESS = "Success"
+FAILED = "Failed"
+UNKNOWN = "Unknown"
+
+
+def push_batch(items, batch_size=None, timer=None):
+    """Push `(doc, action)` pairs to Tally, `batch_size` vouchers per envelope.
+
+    Returns one result per item, in input order, with `status` set to
+    Success, Failed or Unknown (Tally reported errors that could not be
+    tied to a specific voucher). `retryable` marks transport failures.
+    `summary`, Tally's counters and ids, is only set for a voucher that
+    was alone in its envelope: they cannot be told apart per voucher.
+    Stages are charged to `timer` (a tally_metrics.StageTimer).
+    """
+    with _stage(timer, "config"):
+        config = get_active_tally_config()
+    batch_size = cint(batch_size) or config.push_batch_size
+
+    results = []
+    for start in range(0, len(items), batch_size):
+        results.extend(_push_chunk(config, items[start:start + batch_size], timer))
+    return results
+
+
+def _stage(timer, name):
+    return timer.stage(name) if timer else nullcontext()
+
+
+def _push_chunk(config, chunk, timer=None):
+    results = [None] * len(chunk)
+    blocks = []
+    sent = []
+
+    with _stage(timer, "build_xml"):
+        for idx, (doc, action) in enumerate(chunk):
+            try:
+                builder = frappe.get_attr(VOUCHER_BUILDERS[doc.doctype])
+                blocks.append(builder(doc, action))
+                sent.append(idx)
+            except Exception as e:
+                results[idx] = _result(doc, action, FAILED, error=str(e))
+
+        if not sent:
+            return results
+        envelope = import_envelope(config.company, blocks)
+
+    capture_payload(config, "request", envelope, vouchers=len(sent))
+    request_hash = _archive(envelope) if config.archive_payloads else None
+    try:
+        response = tally_client.post(
+            config.url,
+            envelope,
+            timeout=config.timeout,
+            budget=get_request_budget(config),
+            timer=timer,
+        )
+        response.raise_for_status()
+    except Exception as e:
+        for idx in sent:
+            doc, action = chunk[idx]
+            results[idx] = _result(doc, action, FAILED, error=str(e), retryable=True, request_hash=request_hash)
+        return results
+
+    capture_payload(config, "response", response.text, vouchers=len(sent))
+    with _stage(timer, "parse"):
+        summary = parse_import_response(response.text)
+        statuses = map_batch_results([chunk[idx][0] for idx in sent], summary)
+    statuses = verify_unknown(config, [chunk[idx] for idx in sent], statuses, timer)
+
+    own_summary = summary if len(sent) == 1 else None
+    for idx, (status, error) in zip(sent, statuses, strict=True):
+        doc, action = chunk[idx]
+        results[idx] = _result(
+            doc, action, status, error=error, response_text=response.text, summary=own_summary,
+            request_hash=request_hash,
+        )
+
+    return results
+
+
+def _archive(envelope):
+    # Archiving is for reproducing problems; it must never stop a push.
+    try:
+        return tally_archive.store_text(envelope)
+    except Exception:
+        get_logger().warning("Could not archive a Tally import envelope", exc_info=True)
+        return None
+
+
+def map_batch_results(docs, summary):
+    """Attribute a batch response back to each voucher as (status, error).
+
+    Tally only reports totals plus free-text LINEERRORs, so a failure is
+    pinned to a voucher when the error text names its voucher number.
+    Whatever cannot be attributed is reported as Unknown rather than
+    guessed, because retrying a Create that actually went through would
+    duplicate it in Tally; verify_unknown then asks Tally.
+    """
+    if not is_rejection(summary):
+        return [(SUCCESS, None)] * len(docs)
+
+    joined = "; ".join(summary["line_errors"]) or "Tally reported errors"
+    if not processed_count(summary):
+        return [(FAILED, joined)] * len(docs)
+
+    failed = {}
+    for message in summary["line_errors"]:
+        matches = [i for i, doc in enumerate(docs) if _mentions_voucher(message, doc.voucher_number)]
+        if len(matches) == 1:
+            failed.setdefault(matches[0], []).append(message)
+
+    all_attributed = len(failed) >= max(summary["errors"], len(summary["line_errors"]))
+
+    statuses = []
+    for i in range(len(docs)):
+        if i in failed:
+            statuses.append((FAILED, "; ".join(failed[i])))
+        elif all_attributed:
+            statuses.append((SUCCESS, None))
+        else:
+            statuses.append((UNKNOWN, joined))
+    return statuses
+
+
+def verify_unknown(config, items, statuses, timer=None):
+    """Settle Unknown Creates and Deletes by asking Tally which of those
+    vouchers exist now.
+
+    A Create whose voucher is in Tally went through and one that is not
+    failed, so it can be retried without duplicating anything; the reverse
+    holds for a Delete. Alters stay Unknown, as re-sending one is harmless.
+    If Tally cannot be asked, every status stands.
+    """
+    pending = [
+        i for i, (status, _) in enumerate(statuses)
+        if status == UNKNOWN and items[i][1] in ("Create", "Delete") and _lookup_key(items[i][0])
+    ]
+    if not pending:
+        return statuses
+
+    try:
+        present = find_vouchers(config, [items[i][0] for i in pending], timer)
+    except Exception:
+        get_logger().warning("Could not verify an ambiguous Tally import", exc_info=True)
+        return statuses
+
+    statuses = list(statuses)
+    for i in pending:
+        doc, action = items[i]
+        number = _lookup_key(doc)
+        exists = any((vch_type.casefold(), number) in present for vch_type in _type_names(doc))
+        if exists == (action == "Create"):
+            statuses[i] = (SUCCESS, None)
+        else:
+            statuses[i] = (FAILED, statuses[i][1])
+    return statuses
+
+
+def find_vouchers(config, docs, timer=None):
+    """{(voucher type, voucher number)} of `docs` that exist in Tally, casefolded."""
+    with _stage(timer, "build_xml"):
+        xml = build_lookup_export(config.company, docs)
+    response = tally_client.post(
+        config.url, xml, timeout=config.timeout, budget=get_request_budget(config), timer=timer
+    )
+    response.raise_for_status()
+
+    found = set()
+    with _stage(timer, "parse"):
+        for elem in tally_stream.iter_vouchers([response.content]):
+            record = extract_voucher(elem)
+            number = record.voucher_number.strip().casefold()
+            for vch_type in (record.vch_type, record.voucher_type_name):
+                if vch_type:
+                    found.add((vch_type.strip().casefold(), number))
+    return found
+
+
+def build_lookup_export(company, docs):
+    """Export of the vouchers numbered like `docs`, over the dates they span."""
+    dates = [getdate(doc.date) for doc in docs]
+    numbers = sorted({str(doc.voucher_number).strip() for doc in docs})
+    formula = " OR ".join(f'$VoucherNumber = "{number}"' for number in numbers)
+    return f"""<ENVELOPE>
+  <HEADER><VERSION>1</VERSION><TALLYREQUEST>Export</TALLYREQUEST><TYPE>Collection</TYPE><ID>MaithanLookup</ID></HEADER>
+  <BODY><DESC>
+    <STATICVARIABLES>
+      <SVCURRENTCOMPANY>{escape_xml(company)}</SVCURRENTCOMPANY>
+      <SVEXPORTFORMAT>$$SysName:XML</SVEXPORTFORMAT>
+      <SVFROMDATE>{tally_date(min(dates))}</SVFROMDATE>
+      <SVTODATE>{tally_date(max(dates))}</SVTODATE>
+    </STATICVARIABLES>
+    <TDL><TDLMESSAGE>
+      <COLLECTION NAME="MaithanLookup" ISMODIFY="No">
+        <TYPE>Voucher</TYPE>
+        <FETCH>VOUCHERNUMBER, VOUCHERTYPENAME</FETCH>
+        <FILTERS>MaithanLookupNumbers</FILTERS>
+      </COLLECTION>
+      <SYSTEM TYPE="Formulae" NAME="MaithanLookupNumbers">{escape_xml(formula)}</SYSTEM>
+    </TDLMESSAGE></TDL>
+  </DESC></BODY>
+</ENVELOPE>"""
+
+
+def _lookup_key(doc):
+    """The casefolded voucher number to look `doc` up by, or None if it cannot be."""
+    number = str(doc.voucher_number or "").strip()
+    # A double quote cannot be written inside a TDL string.
+    if not number or '"' in number or not doc.date:
+        return None
+    return number.casefold()
+
+
+def _type_names(doc):
+    names = {VOUCHER_TYPES[doc.doctype], getattr(doc, "voucher_type", None)}
+    return [name for name in names if name]
+
+
+def _mentions_voucher(message, voucher_number):
+    if not voucher_number:
+        return False
+    number = re.escape(str(voucher_number))
+    return bool(
+        re.search(rf"['\"]{number}['\"]", message)
+        or re.search(rf"Voucher\s*(?:Number|No\.?)\s*:?\s*{number}(?![\w/-])", message, re.I)
+    )
+
+
+def _result(doc, action, status, error=None, response_text=None, summary=None, retryable=False, request_hash=None):
+    return frappe._dict({
+        "doctype": doc.doctype,
+        "name": doc.name,
+        "action": action,
+        "status": status,
+        "error": error,
+        "response_text": response_text,
+        "summary": summary,
+        "retryable": retryable,
+        "request_hash": request_hash,
+    })
+
+
+def update_source_document(result):
+    """Write a successful push back onto the voucher it came from."""
+    if result.action == "Delete" or not frappe.db.exists(result.doctype, result.name):
+        return
+
+    # The counters, not the raw text; the outbox keeps the rest. A voucher
+    # sent alongside others only gets its own outcome.
+    if result.summary:
+        values = {"tally_response": describe(result.summary)}
+    else:
+        values = {"tally_response": "Created" if result.action == "Create" else "Altered"}
+    if frappe.get_meta(result.doctype).has_field("is_pushed_to_tally"):
+        values["is_pushed_to_tally"] = 1
+    frappe.db.set_value(result.doctype, result.name, values, update_modified=False)
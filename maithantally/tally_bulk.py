@@ -0,0 +1,199 @@
+import hashlib
+import json
+from contextlib import nullcontext
+
+import frappe
+from frappe.utils import cint, flt, now_datetime
+
+# Writes pulled vouchers straight to the database in batches: one query to
+# load the stored content hashes, multi-row INSERTs for new vouchers and
+# their ledger rows, one bulk UPDATE for changed parents and a commit per
+# batch. A voucher whose hash matches is skipped without touching its rows.
+#
+# Controllers never run here, which is also what keeps pulled vouchers
+# from being pushed back to Tally (the from_pull guarantee): no
+# after_insert/on_update hook fires, so nothing reaches the outbox.
+
+LEDGER_ENTRY_DOCTYPE = "Voucher Ledger Entry"
+LEDGER_ENTRY_FIELD = "voucher_ledger_entry"
+
+DEFAULT_COMMIT_EVERY = 500
+TOMBSTONE_BATCH_SIZE = 500
+
+PARENT_FIELDS = ("voucher_number", "voucher_type", "date", "narration")
+ENTRY_FIELDS = ("ledger", "entry_type", "ledger_amount")
+
+STANDARD_FIELDS = ("name", "owner", "creation", "modified", "modified_by", "docstatus", "idx")
+CHILD_FIELDS = (*STANDARD_FIELDS, "parent", "parenttype", "parentfield", *ENTRY_FIELDS)
+
+
+class VoucherBulkWriter:
+    """Collects pulled vouchers and upserts them every `commit_every` vouchers.
+
+    A voucher is a dict with PARENT_FIELDS plus `entries`, a list of
+    {"ledger", "entry_type", "ledger_amount"} dicts. Vouchers are named by
+    voucher number, like the voucher DocTypes themselves.
+    """
+
+    def __init__(self, commit_every=DEFAULT_COMMIT_EVERY, timer=None):
+        self.commit_every = commit_every or DEFAULT_COMMIT_EVERY
+        self.timer = timer
+        self.pending = {}
+        self.counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+        self.last_key = None
+        self.held_alter_id = 0
+
+    def hold(self, alter_id):
+        """Note a voucher left out that a later pull can import (a ledger
+        not pulled yet); the run's watermark must stay below its ALTERID.
+        Without one the watermark cannot move at all. Vouchers that will
+        never import (incomplete, unbalanced, malformed) are not held."""
+        alter_id = cint(alter_id) or 1
+        if not self.held_alter_id or alter_id < self.held_alter_id:
+            self.held_alter_id = alter_id
+
+    def add(self, doctype, voucher):
+        # Names compare case-insensitively in the database, so here too.
+        self.pending[(doctype, voucher["voucher_number"].casefold())] = voucher
+        self.last_key = voucher["voucher_number"]
+        if len(self.pending) >= self.commit_every:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        by_doctype = {}
+        for (doctype, key), voucher in self.pending.items():
+            by_doctype.setdefault(doctype, {})[key] = voucher
+        self.pending = {}
+
+        with self.timer.stage("db_write") if self.timer else nullcontext():
+            for doctype, vouchers in by_doctype.items():
+                self.write(doctype, vouchers)
+            frappe.db.commit()
+
+    def write(self, doctype, vouchers):
+        """Upsert `vouchers`, a dict of casefolded voucher number -> voucher.
+
+        An existing voucher keeps its stored name, whatever case Tally sends
+        the number in now.
+        """
+        stored = {
+            doc.name.casefold(): doc
+            for doc in frappe.get_all(
+                doctype,
+                filters={"name": ["in", [voucher["voucher_number"] for voucher in vouchers.values()]]},
+                fields=["name", "tally_content_hash", "is_deleted_in_tally"],
+            )
+        }
+
+        inserts = {}
+        updates = {}
+        for key, voucher in vouchers.items():
+            voucher["tally_content_hash"] = content_hash(voucher)
+            current = stored.get(key)
+            if not current:
+                inserts[voucher["voucher_number"]] = voucher
+            elif current.tally_content_hash != voucher["tally_content_hash"] or current.is_deleted_in_tally:
+                updates[current.name] = voucher
+            else:
+                self.counts["unchanged"] += 1
+
+        now = now_datetime()
+        if inserts:
+            self.insert_parents(doctype, list(inserts.values()), now)
+        if updates:
+            frappe.db.bulk_update(
+                doctype,
+                {
+                    name: {
+                        "date": v["date"],
+                        "narration": v["narration"],
+                        "tally_content_hash": v["tally_content_hash"],
+                        "is_deleted_in_tally": 0,
+                    }
+                    for name, v in updates.items()
+                },
+                modified=now,
+            )
+            frappe.db.delete(LEDGER_ENTRY_DOCTYPE, {"parenttype": doctype, "parent": ("in", list(updates))})
+
+        rows = []
+        for name, voucher in [*inserts.items(), *updates.items()]:
+            for idx, entry in enumerate(voucher["entries"], start=1):
+                rows.append(self.child_row(doctype, name, idx, entry, now))
+        if rows:
+            frappe.db.bulk_insert(LEDGER_ENTRY_DOCTYPE, CHILD_FIELDS, rows)
+
+        self.counts["inserted"] += len(inserts)
+        self.counts["updated"] += len(updates)
+
+    def insert_parents(self, doctype, vouchers, now):
+        fields = [*STANDARD_FIELDS, *PARENT_FIELDS, "tally_content_hash"]
+        extra = {}
+        if frappe.get_meta(doctype).has_field("is_pushed_to_tally"):
+            # Pulled vouchers already exist in Tally.
+            extra["is_pushed_to_tally"] = 1
+        fields.extend(extra)
+
+        user = frappe.session.user
+        values = [
+            (
+                voucher["voucher_number"], user, now, now, user, 0, 0,
+                *(voucher[field] for field in PARENT_FIELDS),
+                voucher["tally_content_hash"],
+                *extra.values(),
+            )
+            for voucher in vouchers
+        ]
+        frappe.db.bulk_insert(doctype, fields, values)
+
+    def child_row(self, doctype, parent, idx, entry, now):
+        user = frappe.session.user
+        return (
+            frappe.generate_hash(length=10), user, now, now, user, 0, idx,
+            parent, doctype, LEDGER_ENTRY_FIELD,
+            entry["ledger"], entry["entry_type"], flt(entry["ledger_amount"], 2),
+        )
+
+
+def content_hash(voucher):
+    """Fingerprint of everything a pull writes for a voucher."""
+    payload = [
+        voucher["voucher_type"],
+        str(voucher["date"] or ""),
+        voucher["narration"] or "",
+        [(e["ledger"], e["entry_type"], f"{flt(e['ledger_amount'], 2):.2f}") for e in voucher["entries"]],
+    ]
+    return hashlib.sha1(json.dumps(payload, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+def tombstone_missing(doctype, from_date, to_date, seen_names):
+    """Flag vouchers dated inside the window that Tally no longer returned.
+
+    Only the window's own rows are queried, so vouchers outside it are never
+    touched, and only those Tally has had: a voucher still waiting in the
+    outbox is not missing. Returns the number of vouchers flagged.
+    """
+    stored = frappe.get_all(
+        doctype,
+        filters={
+            "date": ["between", [from_date, to_date]],
+            "is_deleted_in_tally": 0,
+            "is_pushed_to_tally": 1,
+        },
+        pluck="name",
+    )
+    # Names compare case-insensitively in the database, so here too.
+    seen = {name.casefold() for name in seen_names}
+    missing = [name for name in stored if name.casefold() not in seen]
+
+    for start in range(0, len(missing), TOMBSTONE_BATCH_SIZE):
+        frappe.db.set_value(
+            doctype,
+            {"name": ["in", missing[start:start + TOMBSTONE_BATCH_SIZE]]},
+            "is_deleted_in_tally",
+            1,
+        )
+    return len(missing)
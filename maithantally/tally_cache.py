@@ -0,0 +1,50 @@
+import frappe
+
+# Values read on every push, pull or validation (the active Tally
+# Configuration, the ledger group closure) are cached twice: in Redis,
+# shared by all workers of the site, and in a per-process memo checked
+# against a version stamp in Redis. clear() drops the Redis copy and bumps
+# the stamp, which makes every process drop its memo on its next lookup.
+
+
+class VersionedCache:
+    """`load()` cached in Redis under `key`, memoised per process and site.
+
+    `load` returns what goes to Redis and must not return None. With
+    `build`, the memo holds `build(value)` instead, for work each process
+    should do once per version and never share (decrypting a password).
+    """
+
+    def __init__(self, key, version_key, load, build=None):
+        self.key = key
+        self.version_key = version_key
+        self.load = load
+        self.build = build
+        self._memo = {}   # site -> (version, value)
+
+    def get(self):
+        site = frappe.local.site
+        version = frappe.cache.get_value(self.version_key)
+
+        memo = self._memo.get(site)
+        if memo and version and memo[0] == version:
+            return memo[1]
+
+        value = frappe.cache.get_value(self.key)
+        if value is None:
+            value = self.load()
+            frappe.cache.set_value(self.key, value)
+
+        if not version:
+            version = frappe.generate_hash(length=10)
+            frappe.cache.set_value(self.version_key, version)
+
+        if self.build:
+            value = self.build(value)
+        self._memo[site] = (version, value)
+        return value
+
+    def clear(self):
+        frappe.cache.delete_value(self.key)
+        frappe.cache.set_value(self.version_key, frappe.generate_hash(length=10))
+        self._memo.pop(frappe.local.site, None)
@@ -0,0 +1,135 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from frappe.utils import cint, getdate
+
+from maithantally.tally_concurrency import TallyBusy
+
+# Voucher exports are pulled in date windows. Tally falls over
+# ("Memory Access Violation", dropped connections, timeouts) when asked for
+# too much at once, so a window that fails is split in half and retried,
+# windows that come back nearly empty grow, and several windows are fetched
+# concurrently up to a per-endpoint limit. A window that found no free
+# request slot never reached Tally, so it is retried as it was.
+
+DEFAULT_WINDOW_DAYS = 31
+MIN_WINDOW_DAYS = 1
+MAX_WINDOW_DAYS = 366
+
+SMALL_WINDOW_VOUCHERS = 500     # grow the next windows below this
+LARGE_WINDOW_VOUCHERS = 5000    # shrink the next windows above this
+
+MAX_ATTEMPTS_PER_WINDOW = 3
+
+
+class ChunkFetchError(Exception):
+    pass
+
+
+class ChunkPlanner:
+    """Hand out (from_date, to_date) windows covering a date range."""
+
+    def __init__(self, from_date, to_date, window_days=DEFAULT_WINDOW_DAYS,
+                 min_days=MIN_WINDOW_DAYS, max_days=MAX_WINDOW_DAYS, completed=()):
+        self.cursor = getdate(from_date)
+        self.to_date = getdate(to_date)
+        self.window_days = window_days
+        self.min_days = min_days
+        self.max_days = max_days
+        self.attempts = {}
+        self.retry = deque()
+        # Windows an earlier, interrupted run already imported.
+        self.completed = sorted((getdate(start), getdate(end)) for start, end in completed)
+
+    def next_window(self):
+        if self.retry:
+            return self.retry.popleft()
+        self._skip_completed()
+        if self.cursor > self.to_date:
+            return None
+
+        end = min(self.cursor + timedelta(days=self.window_days - 1), self.to_date)
+        for start, _ in self.completed:
+            if start > self.cursor:
+                end = min(end, start - timedelta(days=1))
+                break
+        window = (self.cursor, end)
+        self.cursor = end + timedelta(days=1)
+        return window
+
+    def has_more(self):
+        self._skip_completed()
+        return bool(self.retry) or self.cursor <= self.to_date
+
+    def _skip_completed(self):
+        for start, end in self.completed:
+            if start <= self.cursor <= end:
+                self.cursor = end + timedelta(days=1)
+
+    def record_success(self, window, voucher_count):
+        if voucher_count < SMALL_WINDOW_VOUCHERS:
+            self.window_days = min(self.window_days * 2, self.max_days)
+        elif voucher_count > LARGE_WINDOW_VOUCHERS:
+            self.window_days = max(self.window_days // 2, self.min_days)
+
+    def record_busy(self, window):
+        """Queue a window that never got a request slot again, unchanged."""
+        self.retry.append(window)
+
+    def record_failure(self, window, error):
+        """Split a failed window and queue the halves; give up on tiny windows."""
+        start, end = window
+        days = (end - start).days + 1
+        self.window_days = max(min(self.window_days, days) // 2, self.min_days)
+
+        if days > self.min_days:
+            middle = start + timedelta(days=days // 2 - 1)
+            self.retry.appendleft((middle + timedelta(days=1), end))
+            self.retry.appendleft((start, middle))
+            return
+
+        attempts = self.attempts.get(window, 0) + 1
+        self.attempts[window] = attempts
+        if attempts >= MAX_ATTEMPTS_PER_WINDOW:
+            raise ChunkFetchError(f"Tally export failed for {start} to {end}: {error}")
+        self.retry.append(window)
+
+
+def fetch_windows(planner, fetch, max_parallel=1):
+    """Yield (window, payload) as windows complete, keeping up to
+    `max_parallel` requests in flight.
+
+    `fetch(from_date, to_date)` runs in a worker thread and must only talk
+    to Tally (no frappe.db access); it returns `(payload, voucher_count)`
+    and raises on anything that should shrink the window (TallyBusy
+    re-queues it as it is). The caller
+    processes each payload on its own thread, so the DB work stays on the
+    request's connection.
+    """
+    max_parallel = max(cint(max_parallel), 1)
+
+    with ThreadPoolExecutor(max_workers=max_parallel) as pool:
+        in_flight = {}
+
+        while planner.has_more() or in_flight:
+            while len(in_flight) < max_parallel:
+                window = planner.next_window()
+                if not window:
+                    break
+                in_flight[pool.submit(fetch, *window)] = window
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                window = in_flight.pop(future)
+                try:
+                    payload, voucher_count = future.result()
+                except TallyBusy:
+                    planner.record_busy(window)
+                    continue
+                except Exception as e:
+                    planner.record_failure(window, e)
+                    continue
+
+                planner.record_success(window, voucher_count)
+                yield window, payload
@@ -0,0 +1,105 @@
+import os
+import threading
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Every push/pull goes through one pooled session per worker process so that
+# a burst of voucher saves reuses a handful of keep-alive sockets instead of
+# doing a fresh TCP (and TLS) handshake against Tally for every request.
+
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 8
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def _build_session():
+    session = requests.Session()
+
+    # Only connection failures are retried: the request never reached Tally,
+    # so a retry cannot create a duplicate voucher.
+    retry = Retry(total=2, connect=2, read=0, status=0, other=0, backoff_factor=0.3)
+    adapter = HTTPAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        max_retries=retry,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({
+        "Content-Type": "text/xml",
+        "Connection": "keep-alive",
+    })
+    return session
+
+
+def get_session():
+    """Return the pooled session of the current process.
+
+    The pid check makes forked workers build their own pool instead of
+    sharing sockets inherited from the parent.
+    """
+    global _session, _session_pid
+
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                _session = _build_session()
+                _session_pid = pid
+    return _session
+
+
+def close_session():
+    global _session, _session_pid
+
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+        _session_pid = None
+
+
+def post(url, xml, timeout=None, stream=False, budget=None, timer=None):
+    """POST an XML envelope to Tally over the pooled session.
+
+    `budget` (a tally_concurrency.RequestBudget) holds a request slot for the
+    duration of the call; streamed responses go through stream() instead.
+    `timer` (a tally_metrics.StageTimer) is charged the round trip, split
+    into Tally's processing time and transfer.
+    """
+    if isinstance(xml, str):
+        xml = xml.encode("utf-8")
+
+    with budget.slot() if budget else nullcontext():
+        started = perf_counter()
+        response = get_session().post(
+            url,
+            data=xml,
+            timeout=timeout or (CONNECT_TIMEOUT, READ_TIMEOUT),
+            stream=stream,
+        )
+        if timer:
+            timer.record_response(response, started, streamed=stream)
+        return response
+
+
+@contextmanager
+def stream(url, xml, timeout=None, budget=None, timer=None):
+    """Streamed POST; the budget slot is held until the body is consumed.
+
+    Only the wait for the headers is charged to `timer` here; reading the
+    body is up to the caller.
+    """
+    with budget.slot() if budget else nullcontext():
+        with post(url, xml, timeout=timeout, stream=True, timer=timer) as response:
+            yield response
@@ -0,0 +1,152 @@
+import functools
+import time
+import uuid
+from contextlib import contextmanager
+
+import frappe
+
+from maithantally import tally_config
+
+# Tally serves one export at a time and tends to crash when several land
+# together, so access to it is coordinated across every worker through Redis:
+#
+# - a sync lock per (company, Tally endpoint), held for a whole pull, so two
+#   pulls of the same books never overlap;
+# - a request budget per endpoint: a counting semaphore every push and pull
+#   request takes a slot from, sized by Max Concurrent Requests;
+# - a run queue whose job ids coalesce repeated sync requests into one job.
+#
+# Keys are not site-scoped on purpose: sites of one bench pointing at the
+# same Tally share its lock and budget.
+
+SYNC_LOCK_TIMEOUT = 4 * 60 * 60   # matches the long-queue job timeout
+SLOT_LEASE = 15 * 60              # a crashed worker's slot frees itself after this
+SLOT_POLL_INTERVAL = 0.25
+
+SYNC_METHODS = {
+    "vouchers": "maithantally.tally_sync_vouchers.sync_vouchers_from_tally_frappe_orm",
+    "contra": "maithantally.tally.sync_contra_vouchers",
+}
+
+# Drops expired leases, then takes a slot if one is free. The score of a
+# member is the time its lease runs out.
+_ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call('ZADD', KEYS[1], ARGV[3], ARGV[4])
+    redis.call('EXPIRE', KEYS[1], ARGV[5])
+    return 1
+end
+return 0
+"""
+
+
+class SyncLocked(frappe.ValidationError):
+    pass
+
+
+class TallyBusy(Exception):
+    """No request slot freed up in time."""
+
+
+class RequestBudget:
+    """Counting semaphore over the requests in flight against one Tally server.
+
+    Built on the request's thread (it holds on to the Redis client), then
+    safe to use from fetch worker threads.
+    """
+
+    def __init__(self, endpoint, limit, wait=None):
+        self.key = f"maithantally:tally_budget:{endpoint}"
+        self.limit = max(int(limit or 1), 1)
+        self.wait = wait or SLOT_LEASE
+        self.redis = frappe.cache
+
+    def acquire(self):
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.wait
+        while True:
+            now = time.time()
+            taken = self.redis.eval(
+                _ACQUIRE_SCRIPT, 1, self.key, now, self.limit, now + SLOT_LEASE, token, SLOT_LEASE
+            )
+            if taken:
+                return token
+            if time.monotonic() >= deadline:
+                raise TallyBusy(f"No free Tally request slot after {self.wait}s ({self.limit} in use)")
+            time.sleep(SLOT_POLL_INTERVAL)
+
+    def release(self, token):
+        self.redis.zrem(self.key, token)
+
+    @contextmanager
+    def slot(self):
+        token = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(token)
+
+
+def get_request_budget(config=None):
+    config = config or tally_config.get_active_tally_config()
+    # A request waits at most as long as Tally may take to answer one.
+    return RequestBudget(config.endpoint, config.max_concurrent_requests, wait=sum(config.timeout))
+
+
+def sync_lock_key(company, endpoint):
+    return f"maithantally:tally_sync_lock:{endpoint}:{(company or '').casefold()}"
+
+
+def exclusive_sync(fn):
+    """Run a pull while holding the sync lock of the active company/endpoint.
+
+    A pull that finds the lock taken fails fast with SyncLocked instead of
+    queueing up behind the running one.
+    """
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        config = tally_config.get_active_tally_config()
+        lock = frappe.cache.lock(sync_lock_key(config.company, config.endpoint), timeout=SYNC_LOCK_TIMEOUT)
+        if not lock.acquire(blocking=False):
+            frappe.throw(
+                f"A Tally sync for {config.company} is already running against {config.endpoint}",
+                SyncLocked,
+            )
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            lock.release()
+
+    return wrapper
+
+
+def enqueue_sync(method, **kwargs):
+    """Queue a pull on the long queue, coalesced with any identical pending one.
+
+    The job id is derived from the method and the company, so a request made
+    while the same pull is queued or running is dropped instead of piling up.
+    Returns True if a job was queued.
+    """
+    config = tally_config.get_active_tally_config()
+    job_id = f"tally_sync::{method}::{config.company}"
+    job = frappe.enqueue(
+        method,
+        queue="long",
+        timeout=SYNC_LOCK_TIMEOUT,
+        job_id=job_id,
+        deduplicate=True,
+        **kwargs,
+    )
+    return job is not None
+
+
+@frappe.whitelist()
+def queue_sync(sync):
+    frappe.only_for("System Manager")
+
+    method = SYNC_METHODS.get(sync)
+    if not method:
+        frappe.throw(f"Unknown Tally sync: {sync}")
+    return enqueue_sync(method)
@@ -0,0 +1,145 @@
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+import frappe
+from frappe.utils import cint, get_url
+from frappe.utils.password import get_decrypted_password
+
+from maithantally import tally_client, tally_log
+from maithantally.tally_cache import VersionedCache
+
+# The active Tally Configuration is read on every push, pull and fetch, so
+# it is cached in Redis and memoised per process (see tally_cache). Saving
+# or deleting a Tally Configuration clears it.
+
+CACHE_KEY = "maithantally:active_tally_config"
+VERSION_KEY = "maithantally:active_tally_config_version"
+
+DEFAULT_PUSH_BATCH_SIZE = 50
+DEFAULT_PARALLEL_REQUESTS = 2
+DEFAULT_CONCURRENT_REQUESTS = 2
+
+# Scheduled sync cadence, in minutes
+DEFAULT_VOUCHER_SYNC_INTERVAL = 5
+DEFAULT_LEDGER_SYNC_INTERVAL = 15
+DEFAULT_ITEM_SYNC_INTERVAL = 30
+DEFAULT_MAX_SYNC_INTERVAL = 120
+
+
+class TallyConfig(NamedTuple):
+    name: str
+    company: str
+    url: str
+    username: str
+    password: str
+    connect_timeout: int
+    read_timeout: int
+    push_batch_size: int
+    max_parallel_requests: int
+    max_concurrent_requests: int
+    scheduled_sync: bool
+    voucher_sync_interval: int
+    ledger_sync_interval: int
+    item_sync_interval: int
+    max_sync_interval: int
+    log_level: str
+    capture_payloads: bool
+    payload_log_size: int
+    archive_payloads: bool
+
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    @property
+    def endpoint(self):
+        """scheme://host:port of the Tally server, for per-server limits."""
+        parts = urlsplit(self.url)
+        return f"{parts.scheme}://{parts.netloc}".lower()
+
+    @property
+    def parallel_fetches(self):
+        """Export windows fetched at once; past the request budget they would only wait for a slot."""
+        return min(self.max_parallel_requests, self.max_concurrent_requests)
+
+
+def get_active_tally_config():
+    return _cache.get()
+
+
+def _build_config(values):
+    # The password stays out of Redis; each process decrypts it once per version.
+    password = get_decrypted_password(
+        "Tally Configuration", values["name"], "password", raise_exception=False
+    )
+    return TallyConfig(password=password or "", **values)
+
+
+def _load_values():
+    config = frappe.db.get_all(
+        "Tally Configuration",
+        filters={"is_active": 1},
+        fields=[
+            "name",
+            "company",
+            "url",
+            "username",
+            "connect_timeout",
+            "read_timeout",
+            "push_batch_size",
+            "max_parallel_requests",
+            "max_concurrent_requests",
+            "enable_scheduled_sync",
+            "voucher_sync_interval",
+            "ledger_sync_interval",
+            "item_sync_interval",
+            "max_sync_interval",
+            "log_level",
+            "capture_payloads",
+            "payload_log_size",
+            "archive_payloads",
+        ],
+        limit=1
+    )
+    if not config:
+        config_url = get_url("/desk/tally-configuration-")
+        frappe.throw(
+            f'No Active Tally Configuration found.<br>'
+            f'<a href="{config_url}" target="_blank"><b>Click here to activate</b></a>'
+        )
+
+    config = config[0]
+    return {
+        "name": config.name,
+        "company": config.company,
+        "url": normalize_url(config.url),
+        "username": config.username or "",
+        "connect_timeout": cint(config.connect_timeout) or tally_client.CONNECT_TIMEOUT,
+        "read_timeout": cint(config.read_timeout) or tally_client.READ_TIMEOUT,
+        "push_batch_size": cint(config.push_batch_size) or DEFAULT_PUSH_BATCH_SIZE,
+        "max_parallel_requests": cint(config.max_parallel_requests) or DEFAULT_PARALLEL_REQUESTS,
+        "max_concurrent_requests": cint(config.max_concurrent_requests) or DEFAULT_CONCURRENT_REQUESTS,
+        "scheduled_sync": bool(config.enable_scheduled_sync),
+        "voucher_sync_interval": cint(config.voucher_sync_interval) or DEFAULT_VOUCHER_SYNC_INTERVAL,
+        "ledger_sync_interval": cint(config.ledger_sync_interval) or DEFAULT_LEDGER_SYNC_INTERVAL,
+        "item_sync_interval": cint(config.item_sync_interval) or DEFAULT_ITEM_SYNC_INTERVAL,
+        "max_sync_interval": cint(config.max_sync_interval) or DEFAULT_MAX_SYNC_INTERVAL,
+        "log_level": config.log_level or tally_log.DEFAULT_LEVEL,
+        "capture_payloads": bool(config.capture_payloads),
+        "payload_log_size": cint(config.payload_log_size) or tally_log.DEFAULT_PAYLOAD_LOG_SIZE,
+        "archive_payloads": bool(config.archive_payloads),
+    }
+
+
+_cache = VersionedCache(CACHE_KEY, VERSION_KEY, _load_values, build=_build_config)
+
+
+def normalize_url(url):
+    url = (url or "").strip()
+    if url and "://" not in url:
+        url = f"http://{url}"
+    return url
+
+
+def clear_cache():
+    _cache.clear()
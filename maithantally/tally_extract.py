@@ -0,0 +1,124 @@
+from lxml import etree
+
+# Pulls the fields we import out of a <VOUCHER> element in one walk over its
+# children, instead of one `.//*[local-name()=...]` subtree scan per field.
+# Values are returned as stripped strings; callers clean and convert them.
+
+LEDGER_LISTS = ("ALLLEDGERENTRIES.LIST", "LEDGERENTRIES.LIST")
+INVENTORY_LISTS = ("ALLINVENTORYENTRIES.LIST", "INVENTORYENTRIES.LIST")
+
+_VOUCHER_FIELDS = {
+    "VOUCHERNUMBER": "voucher_number",
+    "DATE": "date",
+    "VOUCHERTYPENAME": "voucher_type_name",
+    "NARRATION": "narration",
+    "ALTERID": "alter_id",
+    "MASTERID": "master_id",
+}
+_INVENTORY_FIELDS = {
+    "STOCKITEMNAME": "item_name",
+    "ACTUALQTY": "actual_quantity",
+    "BILLEDQTY": "billed_quantity",
+    "RATE": "rate",
+    "AMOUNT": "amount",
+}
+
+# Only used when a required field is not a direct child of the voucher.
+_FIRST_TEXT = etree.XPath(".//*[local-name()=$name]/text()")
+
+
+class VoucherRecord:
+    __slots__ = (
+        "alter_id",
+        "date",
+        "inventory_entries",
+        "ledger_entries",
+        "master_id",
+        "narration",
+        "vch_type",
+        "voucher_number",
+        "voucher_type_name",
+    )
+
+    def __init__(self, vch_type=""):
+        self.vch_type = vch_type
+        self.voucher_number = ""
+        self.date = ""
+        self.voucher_type_name = ""
+        self.narration = ""
+        self.alter_id = ""
+        self.master_id = ""
+        self.ledger_entries = []      # (ledger name, signed amount)
+        self.inventory_entries = []   # dicts keyed by _INVENTORY_FIELDS values
+
+    @property
+    def voucher_type(self):
+        return self.vch_type or self.voucher_type_name
+
+
+def extract_voucher(voucher):
+    record = VoucherRecord(voucher.get("VCHTYPE") or "")
+    all_ledgers = []
+    ledgers = []
+
+    for child in voucher:
+        tag = _local_name(child)
+        if tag is None:
+            continue
+
+        field = _VOUCHER_FIELDS.get(tag)
+        if field:
+            if not getattr(record, field):
+                setattr(record, field, _text(child))
+        elif tag == "ALLLEDGERENTRIES.LIST":
+            all_ledgers.append(_ledger_entry(child))
+        elif tag == "LEDGERENTRIES.LIST":
+            ledgers.append(_ledger_entry(child))
+        elif tag in INVENTORY_LISTS:
+            record.inventory_entries.append(_inventory_entry(child))
+
+    record.ledger_entries = all_ledgers or ledgers
+
+    if not record.voucher_number:
+        record.voucher_number = _first_text(voucher, "VOUCHERNUMBER")
+    if not record.date:
+        record.date = _first_text(voucher, "DATE")
+
+    return record
+
+
+def _ledger_entry(entry):
+    name = amount = ""
+    for child in entry:
+        tag = _local_name(child)
+        if tag == "LEDGERNAME" and not name:
+            name = _text(child)
+        elif tag == "AMOUNT" and not amount:
+            amount = _text(child)
+    return name, amount
+
+
+def _inventory_entry(entry):
+    row = dict.fromkeys(_INVENTORY_FIELDS.values(), "")
+    for child in entry:
+        field = _INVENTORY_FIELDS.get(_local_name(child))
+        if field and not row[field]:
+            row[field] = _text(child)
+    return row
+
+
+def _local_name(elem):
+    tag = elem.tag
+    if not isinstance(tag, str):   # comments, processing instructions
+        return None
+    return tag.rpartition("}")[2] if tag[0] == "{" else tag
+
+
+def _text(elem):
+    text = elem.text
+    return text.strip() if text else ""
+
+
+def _first_text(elem, name):
+    found = _FIRST_TEXT(elem, name=name)
+    return found[0].strip() if found else ""
@@ -0,0 +1,66 @@
+import frappe
+
+from maithantally.tally_cache import VersionedCache
+
+# Voucher validation asks "is this ledger under Bank Accounts / Sales
+# Accounts / ...?". Tally groups nest (a bank ledger may sit in a sub-group
+# of Bank Accounts), so the answer is every group above the ledger, not just
+# its immediate parent. The Ledger Group tree is flattened into
+# ledger -> {all its groups} once, cached in Redis and memoised per process
+# (see tally_cache). Ledger and group syncs, and edits to either, clear it.
+
+CACHE_KEY = "maithantally:ledger_group_closure"
+VERSION_KEY = "maithantally:ledger_group_closure_version"
+
+PRIMARY = "Primary"   # what Tally reports as the parent of a top-level group
+
+CASH_AND_BANK = ("Cash-in-Hand", "Bank Accounts")
+SALES_ACCOUNTS = "Sales Accounts"
+PURCHASE_ACCOUNTS = "Purchase Accounts"
+
+
+def get_closure():
+    """{ledger name: frozenset of every group above it}."""
+    return _cache.get()
+
+
+def build_closure():
+    parents = {
+        group.name: group.parent_group
+        for group in frappe.get_all("Ledger Group", fields=["name", "parent_group"])
+    }
+    ancestors = {}
+
+    def groups_of(group):
+        path = []
+        node = group
+        while node and node != PRIMARY and node not in ancestors and node not in path:
+            path.append(node)
+            node = parents.get(node)
+
+        above = ancestors.get(node, frozenset())
+        for i in range(len(path) - 1, -1, -1):
+            above = ancestors[path[i]] = above | {path[i]}
+        return ancestors.get(group, frozenset())
+
+    return {
+        ledger.name: groups_of(ledger.parent_ledger)
+        for ledger in frappe.get_all("Ledger", fields=["name", "parent_ledger"])
+        if ledger.parent_ledger
+    }
+
+
+_cache = VersionedCache(CACHE_KEY, VERSION_KEY, build_closure)
+
+
+def ledger_groups(ledger):
+    return get_closure().get(ledger, frozenset())
+
+
+def is_under(ledger, *groups):
+    """True if `ledger` sits anywhere below one of `groups`."""
+    return not ledger_groups(ledger).isdisjoint(groups)
+
+
+def clear_cache():
+    _cache.clear()
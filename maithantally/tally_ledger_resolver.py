@@ -0,0 +1,94 @@
+import re
+
+import frappe
+
+# Maps ledger names as Tally spells them onto Ledger documents. All names
+# are loaded once per sync; lookups are dictionary hits, and the fuzzy
+# "name contains" fallback goes through a trigram index instead of a
+# LIKE '%name%' table scan per ledger row.
+
+_AND_RE = re.compile(r"\s+and\s+")
+_AMPERSAND_RE = re.compile(r"\s*&\s*")
+
+
+def collapse(name):
+    return " ".join(name.split())
+
+
+def fold(name):
+    return collapse(name).casefold()
+
+
+def canonical(name):
+    """Case-folded form with "and" and "&" spelt the same way."""
+    return _AMPERSAND_RE.sub(" & ", _AND_RE.sub(" & ", fold(name)))
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class LedgerResolver:
+    def __init__(self, names=()):
+        self.by_folded = {}
+        self.by_canonical = {}
+        self.folded_names = {}
+        self.index = {}
+        self.memo = {}
+        for name in names:
+            self.add(name)
+
+    @classmethod
+    def load(cls):
+        return cls(frappe.get_all("Ledger", pluck="name", order_by="name asc"))
+
+    def add(self, name):
+        folded = fold(name)
+        self.by_folded.setdefault(folded, name)
+        self.by_canonical.setdefault(canonical(name), name)
+        self.folded_names[name] = folded
+        for gram in trigrams(folded):
+            self.index.setdefault(gram, set()).add(name)
+        self.memo.clear()
+
+    def is_known(self, name):
+        return name in self.folded_names
+
+    def resolve(self, tally_name):
+        """Best matching Ledger name, or the cleaned Tally name if none."""
+        if not tally_name:
+            return None
+
+        if tally_name not in self.memo:
+            self.memo[tally_name] = self._resolve(tally_name)
+        return self.memo[tally_name]
+
+    def _resolve(self, tally_name):
+        clean_name = collapse(tally_name)
+
+        match = self.by_folded.get(clean_name.casefold()) or self.by_canonical.get(canonical(clean_name))
+        if match:
+            return match
+
+        return self.containing(fold(clean_name)) or clean_name
+
+    def containing(self, folded):
+        """Shortest ledger whose name contains `folded` (what LIKE '%x%' matched)."""
+        if not folded:
+            return None
+
+        grams = trigrams(folded)
+        if grams:
+            candidates = None
+            for gram in sorted(grams, key=lambda g: len(self.index.get(g, ()))):
+                postings = self.index.get(gram)
+                if not postings:
+                    return None
+                candidates = set(postings) if candidates is None else candidates & postings
+                if not candidates:
+                    return None
+        else:
+            candidates = self.folded_names
+
+        matches = [name for name in candidates if folded in self.folded_names[name]]
+        return min(matches, key=lambda name: (len(name), name)) if matches else None
@@ -0,0 +1,155 @@
+import gzip
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import Counter
+from logging.handlers import RotatingFileHandler
+from time import monotonic
+
+import frappe
+
+# Logging for sync runs and pushes, at a cost that does not grow with the
+# export. A RunLog lives for one sync run or push batch:
+#
+#   info/warning/error  run-level messages (a window fetched, a run failed)
+#   event               per-voucher happenings ("synced", "skip_unbalanced"):
+#                       always counted, but only the first SAMPLE_FIRST of
+#                       each are written, then at most one per SAMPLE_INTERVAL
+#                       seconds, and only when the configured level allows
+#   summary             one line with every count, at the end of the run
+#
+# Request envelopes and Tally's responses are never written to the regular
+# log. With "Capture Payloads" on in the Tally Configuration they go to
+# logs/tally_payloads.log of the site, rotated by size, old files gzipped.
+
+LOGGER = "maithantally"
+LEVELS = {"DEBUG": logging.DEBUG, "INFO": logging.INFO, "WARNING": logging.WARNING, "ERROR": logging.ERROR}
+DEFAULT_LEVEL = "INFO"
+
+SAMPLE_FIRST = 10
+SAMPLE_INTERVAL = 10.0
+
+PAYLOAD_LOG = "tally_payloads.log"
+PAYLOAD_BACKUPS = 5
+DEFAULT_PAYLOAD_LOG_SIZE = 20   # MB per file
+
+_payload_loggers = {}   # site -> logging.Logger
+_payload_lock = threading.Lock()
+
+
+def get_logger():
+    # RunLog applies the configured level itself.
+    logger = frappe.logger(LOGGER, allow_site=True)
+    logger.setLevel(logging.DEBUG)
+    return logger
+
+
+class RunLog:
+    """Levelled, counted and sampled logging for one run or batch."""
+
+    def __init__(self, pipeline, config=None):
+        self.pipeline = pipeline
+        self.name = pipeline
+        self.level = LEVELS.get(getattr(config, "log_level", None) or DEFAULT_LEVEL, logging.INFO)
+        self.counts = Counter()
+        self.suppressed = Counter()
+        self._next_sample = {}
+        self.logger = get_logger()
+
+    def bind(self, name):
+        """Prefix every message with `name` (e.g. the Tally Sync Run)."""
+        self.name = f"{self.pipeline} {name}"
+
+    def log(self, level, message, *args):
+        if level >= self.level:
+            self.logger.log(level, f"[{self.name}] {message}", *args)
+
+    def debug(self, message, *args):
+        self.log(logging.DEBUG, message, *args)
+
+    def info(self, message, *args):
+        self.log(logging.INFO, message, *args)
+
+    def warning(self, message, *args):
+        self.log(logging.WARNING, message, *args)
+
+    def error(self, message, *args):
+        self.log(logging.ERROR, message, *args)
+
+    def event(self, event, message=None, *args, level=logging.DEBUG):
+        """Count `event`; write `message` (formatted lazily) if sampled.
+        Returns whether it was written."""
+        self.counts[event] += 1
+        if message is None or level < self.level:
+            return False
+
+        seen = self.counts[event]
+        if seen > SAMPLE_FIRST:
+            now = monotonic()
+            if now < self._next_sample.get(event, 0.0):
+                self.suppressed[event] += 1
+                return False
+            self._next_sample[event] = now + SAMPLE_INTERVAL
+            if self.suppressed[event]:
+                message = f"{message} (+{self.suppressed[event]} similar not logged)"
+                self.suppressed[event] = 0
+        self.log(level, message, *args)
+        return True
+
+    def summary(self):
+        counts = ", ".join(f"{event}={count}" for event, count in sorted(self.counts.items()))
+        self.info("done: %s", counts or "nothing to report")
+
+    def as_json(self, previous=None):
+        """The counts as JSON, added to `previous` (an earlier attempt's)."""
+        counts = Counter(json.loads(previous or "{}"))
+        counts.update(self.counts)
+        return json.dumps(dict(sorted(counts.items())))
+
+
+def capture_payload(config, kind, payload, **context):
+    """Append a request or response body to the payload log, if enabled."""
+    if not payload or not getattr(config, "capture_payloads", False):
+        return
+    try:
+        if isinstance(payload, bytes):
+            payload = payload.decode("utf-8", errors="replace")
+        _payload_logger(config).info("%s %s\n%s", kind, json.dumps(context, default=str), payload)
+    except Exception:
+        get_logger().warning("Could not capture Tally payload", exc_info=True)
+
+
+def _payload_logger(config):
+    site = frappe.local.site
+    logger = _payload_loggers.get(site)
+    if logger:
+        return logger
+
+    with _payload_lock:
+        if site not in _payload_loggers:
+            size = (getattr(config, "payload_log_size", 0) or DEFAULT_PAYLOAD_LOG_SIZE) * 1024 * 1024
+            handler = RotatingFileHandler(
+                frappe.get_site_path("logs", PAYLOAD_LOG),
+                maxBytes=size,
+                backupCount=PAYLOAD_BACKUPS,
+                encoding="utf-8",
+                delay=True,
+            )
+            handler.namer = lambda name: f"{name}.gz"
+            handler.rotator = _gzip_rotate
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+
+            logger = logging.getLogger(f"{LOGGER}.payloads.{site}")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(handler)
+            _payload_loggers[site] = logger
+    return _payload_loggers[site]
+
+
+def _gzip_rotate(source, dest):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
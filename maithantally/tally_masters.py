@@ -0,0 +1,88 @@
+from contextlib import nullcontext
+
+import frappe
+from frappe.utils import now_datetime
+
+from maithantally.tally_bulk import STANDARD_FIELDS
+
+# Bulk import of Tally masters (ledgers, stock items). Every stored row of
+# the DocType is loaded once into a dict; the export is streamed past it and
+# only the differences hit the database: multi-row INSERTs for new masters,
+# one bulk UPDATE for changed ones and a commit per batch. Like the voucher
+# writer in tally_bulk, no controller runs.
+
+DEFAULT_BATCH_SIZE = 2000
+
+
+class MasterBulkWriter:
+    """Upserts masters named by `name_field` (e.g. Ledger.ledger_name).
+
+    `fields` are the other columns a pull writes; a master whose values all
+    match the stored row is counted as unchanged and never written.
+    """
+
+    def __init__(self, doctype, name_field, fields, batch_size=DEFAULT_BATCH_SIZE, timer=None):
+        self.doctype = doctype
+        self.name_field = name_field
+        self.fields = tuple(fields)
+        self.batch_size = batch_size or DEFAULT_BATCH_SIZE
+        self.timer = timer
+        self.inserts = {}
+        self.updates = {}
+        self.inserted = []
+        self.counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+
+        # Names compare case-insensitively in the database, so here too.
+        self.stored = {
+            row.name.casefold(): row
+            for row in frappe.get_all(doctype, fields=["name", *self.fields])
+        }
+
+    def add(self, name, values):
+        key = name.casefold()
+        current = self.stored.get(key)
+
+        if current is None:
+            if key not in self.inserts:
+                self.inserts[key] = (name, values)
+        elif any((current.get(field) or "") != (values.get(field) or "") for field in self.fields):
+            self.updates[current.name] = values
+            current.update(values)
+        else:
+            self.counts["unchanged"] += 1
+            return
+
+        if len(self.inserts) + len(self.updates) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.inserts and not self.updates:
+            return
+
+        with self.timer.stage("db_write") if self.timer else nullcontext():
+            self.write()
+
+    def write(self):
+        now = now_datetime()
+        if self.inserts:
+            user = frappe.session.user
+            frappe.db.bulk_insert(
+                self.doctype,
+                [*STANDARD_FIELDS, self.name_field, *self.fields],
+                [
+                    (name, user, now, now, user, 0, 0, name, *(values.get(field) for field in self.fields))
+                    for name, values in self.inserts.values()
+                ],
+            )
+            for key, (name, values) in self.inserts.items():
+                self.stored[key] = frappe._dict(name=name, **values)
+                self.inserted.append(name)
+            self.counts["inserted"] += len(self.inserts)
+
+        if self.updates:
+            frappe.db.bulk_update(self.doctype, self.updates, modified=now)
+            self.counts["updated"] += len(self.updates)
+
+        self.inserts = {}
+        self.updates = {}
+        frappe.db.commit()
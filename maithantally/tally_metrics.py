@@ -0,0 +1,168 @@
+import json
+import threading
+from time import perf_counter
+
+import frappe
+from werkzeug.wrappers import Response
+
+# Wall time per pipeline stage. A StageTimer lives for one sync run or one
+# push batch: the run/outbox rows keep its summary, and publish() adds it
+# to per-site totals in Redis that metrics() serves in the Prometheus text
+# format, so "where do the minutes go" is a scrape, not a log grep.
+#
+#   config            reading the Tally Configuration
+#   build_xml         building request envelopes
+#   tally_processing  waiting for Tally's response headers (Tally working)
+#   http_send         the rest of the round trip: upload and body transfer
+#   stream            reading a spooled export and parsing its XML
+#   parse             field extraction and parsing import responses
+#   ledger_resolve    loading and matching ledger names
+#   db_write          bulk writes, outbox/voucher updates and commits
+
+STAGES = (
+    "config", "build_xml", "tally_processing", "http_send", "stream", "parse", "ledger_resolve", "db_write",
+)
+
+METRICS_KEY = "maithantally:stage_metrics"
+
+
+class _Stage:
+    __slots__ = ("name", "started", "timer")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.started = perf_counter()
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, perf_counter() - self.started)
+
+
+class StageTimer:
+    """Accumulates seconds and call counts per stage. Thread-safe: window
+    fetches record their HTTP stages from worker threads."""
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.calls = dict.fromkeys(STAGES, 0)
+        self._lock = threading.Lock()
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def add(self, name, seconds, calls=1):
+        with self._lock:
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+            self.calls[name] = self.calls.get(name, 0) + calls
+
+    def iterate(self, iterable, name):
+        """Yield from `iterable`, charging the time spent producing each item."""
+        iterator = iter(iterable)
+        while True:
+            started = perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(name, perf_counter() - started, calls=0)
+                return
+            self.add(name, perf_counter() - started)
+            yield item
+
+    def record_response(self, response, started, streamed=False):
+        """Split a round trip started at `started` into Tally's wait and
+        transfer. A streamed body is not read yet; its reader charges it."""
+        total = perf_counter() - started
+        waited = min(response.elapsed.total_seconds(), total)
+        self.add("tally_processing", waited)
+        if not streamed:
+            self.add("http_send", total - waited)
+
+    def summary(self):
+        return {
+            name: {"seconds": round(self.seconds[name], 4), "calls": self.calls[name]}
+            for name in self.seconds
+            if self.calls[name] or self.seconds[name]
+        }
+
+    def as_json(self, previous=None):
+        """The summary as JSON, added to `previous` (an earlier summary's
+        JSON, e.g. of the attempt a resumed run started with)."""
+        summary = self.summary()
+        for name, values in json.loads(previous or "{}").items():
+            current = summary.setdefault(name, {"seconds": 0.0, "calls": 0})
+            current["seconds"] = round(current["seconds"] + values["seconds"], 4)
+            current["calls"] += values["calls"]
+        return json.dumps(summary)
+
+    def publish(self):
+        """Add this timer to the site's totals. Never fails the caller."""
+        try:
+            key = frappe.cache.make_key(METRICS_KEY)
+            pipe = frappe.cache.pipeline()
+            for name, values in self.summary().items():
+                pipe.hincrbyfloat(key, f"{self.pipeline}|{name}|seconds", values["seconds"])
+                pipe.hincrby(key, f"{self.pipeline}|{name}|calls", values["calls"])
+            pipe.hincrby(key, f"{self.pipeline}||runs", 1)
+            pipe.execute()
+        except Exception:
+            frappe.logger().warning("Could not publish Tally stage metrics", exc_info=True)
+
+
+def read_totals():
+    """{(pipeline, stage, kind): value} as published by every worker of the site."""
+    # Through a raw pipeline: frappe.cache.hgetall would unpickle the values.
+    pipe = frappe.cache.pipeline()
+    pipe.hgetall(frappe.cache.make_key(METRICS_KEY))
+    raw = pipe.execute()[0] or {}
+    totals = {}
+    for field, value in raw.items():
+        pipeline, stage, kind = field.decode().split("|")
+        totals[(pipeline, stage, kind)] = float(value)
+    return totals
+
+
+def render(totals):
+    lines = [
+        "# HELP maithantally_stage_seconds_total Wall time spent in each Tally pipeline stage.",
+        "# TYPE maithantally_stage_seconds_total counter",
+    ]
+    lines += [
+        f'maithantally_stage_seconds_total{{pipeline="{pipeline}",stage="{stage}"}} {value:.6f}'
+        for (pipeline, stage, kind), value in sorted(totals.items())
+        if kind == "seconds"
+    ]
+    lines += [
+        "# HELP maithantally_stage_calls_total Times each Tally pipeline stage ran.",
+        "# TYPE maithantally_stage_calls_total counter",
+    ]
+    lines += [
+        f'maithantally_stage_calls_total{{pipeline="{pipeline}",stage="{stage}"}} {int(value)}'
+        for (pipeline, stage, kind), value in sorted(totals.items())
+        if kind == "calls"
+    ]
+    lines += [
+        "# HELP maithantally_runs_total Sync runs and push batches timed.",
+        "# TYPE maithantally_runs_total counter",
+    ]
+    lines += [
+        f'maithantally_runs_total{{pipeline="{pipeline}"}} {int(value)}'
+        for (pipeline, stage, kind), value in sorted(totals.items())
+        if kind == "runs"
+    ]
+    return "\n".join(lines) + "\n"
+
+
+@frappe.whitelist()
+def metrics():
+    """Prometheus scrape target: /api/method/maithantally.tally_metrics.metrics"""
+    frappe.only_for("System Manager")
+    return Response(render(read_totals()), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@frappe.whitelist()
+def reset_metrics():
+    frappe.only_for("System Manager")
+    frappe.cache.delete_value(METRICS_KEY)
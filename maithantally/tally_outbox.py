@@ -0,0 +1,367 @@
+import json
+
+import frappe
+from frappe.utils import add_to_date, now_datetime
+
+from maithantally import tally_batch
+from maithantally.tally_config import get_active_tally_config
+from maithantally.tally_metrics import StageTimer
+from maithantally.tally_response import decompress, response_fields
+
+# Pushes to Tally never run on the request path. Hooks and voucher
+# controllers only write a "Tally Outbox" row; a background worker drains
+# the outbox, retries failures with exponential backoff and parks entries
+# that keep failing as "Dead" so they can be inspected and re-queued.
+
+DRAIN_JOB_ID = "maithantally_tally_outbox_drain"
+
+DRAIN_LIMIT = 100
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 30       # seconds before the first retry
+BACKOFF_CAP = 60 * 60   # never wait longer than an hour between retries
+STALE_PROCESSING_MINUTES = 15
+
+
+# ---------------- ENQUEUE (request path) ----------------
+
+def enqueue_create(doc, method=None):
+    enqueue_push(doc, "Create")
+
+
+def enqueue_delete(doc, method=None):
+    # Hooked to on_cancel and after_delete: a cancelled voucher was already
+    # queued for deletion when it was cancelled.
+    if method == "after_delete" and doc.docstatus == 2:
+        return
+    enqueue_push(doc, "Delete")
+
+
+def enqueue_push(doc, action, wake=True):
+    """Record a pending push for `doc` and wake the drain worker.
+
+    Duplicate requests are coalesced: a queued Create/Alter always sends the
+    latest saved state, a Delete already waiting is not queued again, and
+    deleting a voucher whose Create never left the outbox simply discards it.
+    """
+    if action == "Delete" and discard_pending(doc, "Create"):
+        discard_pending(doc, "Alter")
+        return
+
+    if action != "Delete" and _pending(doc, action, ("Queued",)):
+        return
+
+    # A second Delete would only fail in Tally.
+    if action == "Delete" and _pending(doc, action, ("Queued", "Processing")):
+        return
+
+    if action == "Delete":
+        discard_pending(doc, "Alter")
+
+    outbox = frappe.get_doc({
+        "doctype": "Tally Outbox",
+        "reference_doctype": doc.doctype,
+        "reference_name": doc.name,
+        "action": action,
+        "status": "Queued",
+        "attempts": 0,
+        "next_attempt_at": now_datetime(),
+        # Deleted documents are gone by the time the worker runs, so the
+        # envelope is built from this snapshot instead.
+        "snapshot": frappe.as_json(doc.as_dict()) if action == "Delete" else None,
+    })
+    outbox.insert(ignore_permissions=True)
+
+    if wake:
+        frappe.enqueue(
+            "maithantally.tally_outbox.process_outbox",
+            queue="short",
+            job_id=DRAIN_JOB_ID,
+            deduplicate=True,
+            enqueue_after_commit=True,
+        )
+
+
+@frappe.whitelist()
+def push_documents(doctype, names=None, filters=None, action="Create"):
+    """Back-load existing vouchers into Tally through the outbox.
+
+    Documents already pushed (for a Create) or already waiting in the
+    outbox are left out, so running this twice never duplicates a voucher
+    in Tally. Returns the number of documents considered.
+    """
+    frappe.only_for("System Manager")
+
+    if doctype not in tally_batch.VOUCHER_BUILDERS:
+        frappe.throw(f"{doctype} cannot be pushed to Tally")
+
+    names = frappe.parse_json(names) if names else frappe.get_all(
+        doctype, filters=frappe.parse_json(filters) if filters else None, pluck="name"
+    )
+
+    frappe.enqueue(
+        "maithantally.tally_outbox.run_push_documents",
+        queue="long",
+        timeout=60 * 60,
+        doctype=doctype,
+        names=names,
+        action=action,
+    )
+    return len(names)
+
+
+def run_push_documents(doctype, names, action="Create"):
+    """Queue every eligible document, then drain the outbox. Returns the number queued."""
+    skip = set()
+    if frappe.get_meta(doctype).has_field("is_pushed_to_tally"):
+        # A Create only for what Tally does not have yet; anything else only for what it has.
+        skip.update(frappe.get_all(
+            doctype,
+            filters={"name": ["in", names], "is_pushed_to_tally": 1 if action == "Create" else 0},
+            pluck="name",
+        ))
+    skip.update(frappe.get_all(
+        "Tally Outbox",
+        filters={
+            "reference_doctype": doctype,
+            "reference_name": ["in", names],
+            "action": action,
+            "status": ["in", ("Queued", "Processing")],
+        },
+        pluck="reference_name",
+    ))
+
+    queued = 0
+    for name in names:
+        if name not in skip:
+            enqueue_push(frappe.get_doc(doctype, name), action, wake=False)
+            queued += 1
+    frappe.db.commit()
+
+    # Entries that fail wait for their backoff, so this ends; the scheduler retries them.
+    while process_outbox():
+        pass
+    return queued
+
+
+def has_pending(doc, action):
+    return bool(_pending(doc, action, ("Queued", "Processing")))
+
+
+def discard_pending(doc, action):
+    names = _pending(doc, action, ("Queued",))
+    for name in names:
+        frappe.delete_doc("Tally Outbox", name, ignore_permissions=True, force=True)
+    return bool(names)
+
+
+def _pending(doc, action, statuses):
+    return frappe.get_all(
+        "Tally Outbox",
+        filters={
+            "reference_doctype": doc.doctype,
+            "reference_name": doc.name,
+            "action": action,
+            "status": ["in", statuses],
+        },
+        pluck="name",
+    )
+
+
+# ---------------- DRAIN (background worker) ----------------
+
+def process_outbox(limit=DRAIN_LIMIT):
+    _requeue_stale()
+
+    due = frappe.get_all(
+        "Tally Outbox",
+        filters={"status": "Queued", "next_attempt_at": ["<=", now_datetime()]},
+        order_by="creation asc",
+        limit=limit,
+        pluck="name",
+    )
+    if not due:
+        return 0
+
+    batch_size = get_active_tally_config().push_batch_size
+
+    for start in range(0, len(due), batch_size):
+        process_batch(due[start:start + batch_size])
+    return len(due)
+
+
+def process_batch(names):
+    entries = [frappe.get_doc("Tally Outbox", name) for name in names if _claim(name)]
+
+    ready = []
+    items = []
+    for entry in entries:
+        try:
+            items.append((_load_reference(entry), entry.action))
+            ready.append(entry)
+        except Exception as e:
+            _mark_failed(entry, e)
+
+    if not items:
+        frappe.db.commit()
+        return
+
+    timer = StageTimer("push")
+    results = tally_batch.push_batch(items, batch_size=len(items), timer=timer)
+
+    with timer.stage("db_write"):
+        for entry, result in zip(ready, results, strict=True):
+            _apply_result(entry, result)
+
+        # Commit per envelope so a crash never re-sends vouchers Tally accepted.
+        frappe.db.commit()
+
+    # Every entry of the envelope shares its timings, written in one UPDATE.
+    frappe.db.sql(
+        "update `tabTally Outbox` set stage_timings = %(timings)s where name in %(names)s",
+        {"timings": timer.as_json(), "names": [entry.name for entry in ready]},
+    )
+    frappe.db.commit()
+    timer.publish()
+
+
+def _claim(name):
+    # Row lock so a scheduler tick and an on-demand drain never send the
+    # same entry twice.
+    status = frappe.db.get_value("Tally Outbox", name, "status", for_update=True)
+    if status != "Queued":
+        frappe.db.commit()
+        return False
+
+    frappe.db.set_value("Tally Outbox", name, "status", "Processing")
+    frappe.db.commit()
+    return True
+
+
+def _load_reference(entry):
+    if entry.snapshot:
+        return frappe.get_doc(json.loads(entry.snapshot))
+    return frappe.get_doc(entry.reference_doctype, entry.reference_name)
+
+
+def _apply_result(entry, result):
+    if result.status == tally_batch.SUCCESS:
+        _mark_done(entry, result)
+    elif result.status == tally_batch.UNKNOWN and entry.action == "Create":
+        # Tally could not be asked whether it exists (see
+        # tally_batch.verify_unknown), and re-sending could duplicate it.
+        _mark_dead(entry, f"Batch outcome unknown, verify in Tally: {result.error}", result)
+    elif result.retryable or result.status == tally_batch.UNKNOWN:
+        _mark_failed(entry, result.error, result)
+    else:
+        # Tally rejected it (or it could not be built): the same envelope
+        # would fail the same way, so it goes straight to Dead.
+        _mark_failed(entry, result.error, result, permanent=True)
+
+
+def _mark_done(entry, result):
+    entry.db_set({
+        "status": "Completed",
+        "attempts": entry.attempts + 1,
+        "last_error": None,
+        "processed_on": now_datetime(),
+        **_response_fields(result),
+    })
+    tally_batch.update_source_document(result)
+
+
+def _mark_failed(entry, error, result=None, permanent=None):
+    attempts = entry.attempts + 1
+    if permanent is None:
+        permanent = isinstance(error, frappe.ValidationError)
+
+    if permanent or attempts >= MAX_ATTEMPTS:
+        _mark_dead(entry, error, result, attempts=attempts)
+        return
+
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_CAP)
+    entry.db_set({
+        "status": "Queued",
+        "attempts": attempts,
+        "next_attempt_at": add_to_date(now_datetime(), seconds=delay),
+        "last_error": _message(error),
+        "processed_on": now_datetime(),
+        **_response_fields(result),
+    })
+
+
+def _mark_dead(entry, error, result=None, attempts=None):
+    message = _message(error)
+    entry.db_set({
+        "status": "Dead",
+        "attempts": attempts or entry.attempts + 1,
+        "next_attempt_at": None,
+        "last_error": message,
+        "processed_on": now_datetime(),
+        **_response_fields(result),
+    })
+
+    if entry.action != "Delete" and frappe.db.exists(entry.reference_doctype, entry.reference_name):
+        frappe.db.set_value(
+            entry.reference_doctype,
+            entry.reference_name,
+            "tally_response",
+            f"ERROR: {message}",
+            update_modified=False,
+        )
+
+
+def _response_fields(result):
+    # Counters, ids, (on failure) the compressed payload and the archived
+    # envelope's hash, written in the same update as the status. Errors
+    # raised before anything was sent count as failed pushes too.
+    if result is None:
+        return {**response_fields(tally_batch.FAILED), "request_hash": None}
+    return {
+        **response_fields(result.status, result.summary, result.response_text, result.error),
+        "request_hash": result.request_hash,
+    }
+
+
+def _message(error):
+    if isinstance(error, Exception):
+        return str(error) or error.__class__.__name__
+    return error or "Unknown error"
+
+
+def _requeue_stale():
+    # A worker that died mid-push leaves its entry in "Processing".
+    cutoff = add_to_date(now_datetime(), minutes=-STALE_PROCESSING_MINUTES)
+    stale = frappe.get_all(
+        "Tally Outbox",
+        filters={"status": "Processing", "modified": ["<", cutoff]},
+        pluck="name",
+    )
+    for name in stale:
+        frappe.db.set_value("Tally Outbox", name, "status", "Queued")
+    if stale:
+        frappe.db.commit()
+
+
+@frappe.whitelist()
+def requeue(name):
+    frappe.only_for("System Manager")
+
+    frappe.db.set_value("Tally Outbox", name, {
+        "status": "Queued",
+        "attempts": 0,
+        "next_attempt_at": now_datetime(),
+    })
+    frappe.enqueue(
+        "maithantally.tally_outbox.process_outbox",
+        queue="short",
+        job_id=DRAIN_JOB_ID,
+        deduplicate=True,
+        enqueue_after_commit=True,
+    )
+
+
+@frappe.whitelist()
+def get_response(name):
+    """The raw Tally response kept for a push that did not succeed."""
+    frappe.only_for("System Manager")
+    return decompress(frappe.db.get_value("Tally Outbox", name, "compressed_response"))
@@ -0,0 +1,107 @@
+import base64
+import re
+import zlib
+from xml.sax.saxutils import unescape
+
+# Counters Tally reports after an import, e.g.
+# <RESPONSE><CREATED>2</CREATED><ALTERED>0</ALTERED>...<ERRORS>1</ERRORS></RESPONSE>
+# The element may sit at the root or inside ENVELOPE/BODY/DATA/IMPORTRESULT,
+# so the counters are picked out by tag rather than by path.
+COUNTER_TAGS = (
+    "CREATED",
+    "ALTERED",
+    "DELETED",
+    "COMBINED",
+    "IGNORED",
+    "ERRORS",
+    "CANCELLED",
+    "EXCEPTIONS",
+)
+
+_COUNTER_RE = re.compile(r"<(%s)>\s*(-?\d+)\s*</\1>" % "|".join(COUNTER_TAGS))
+_LINEERROR_RE = re.compile(r"<LINEERROR>(.*?)</LINEERROR>", re.S)
+_LASTVCHID_RE = re.compile(r"<LASTVCHID>\s*(\d+)\s*</LASTVCHID>")
+_LASTMID_RE = re.compile(r"<LASTMID>\s*(\d+)\s*</LASTMID>")
+
+
+def parse_import_response(text):
+    """Summarise a Tally import response into counters and line errors."""
+    text = text or ""
+    summary = {tag.lower(): 0 for tag in COUNTER_TAGS}
+
+    for tag, value in _COUNTER_RE.findall(text):
+        summary[tag.lower()] += int(value)
+
+    # Error text arrives XML-escaped (&apos;, &amp;); store and match it as written.
+    summary["line_errors"] = [
+        " ".join(unescape(m, {"&apos;": "'", "&quot;": '"'}).split()) for m in _LINEERROR_RE.findall(text)
+    ]
+
+    vch_id = _LASTVCHID_RE.search(text)
+    mid = _LASTMID_RE.search(text)
+    summary["last_vch_id"] = int(vch_id.group(1)) if vch_id else None
+    summary["last_mid"] = int(mid.group(1)) if mid else None
+
+    return summary
+
+
+def is_rejection(summary):
+    return bool(summary["errors"] or summary["exceptions"] or summary["line_errors"])
+
+
+def processed_count(summary):
+    return (
+        summary["created"]
+        + summary["altered"]
+        + summary["deleted"]
+        + summary["combined"]
+        + summary["ignored"]
+    )
+
+
+# A push is stored as the columns below rather than as the raw response:
+# counters and Tally's ids are queryable, and the payload itself, kept
+# only when the push did not succeed, is zlib-compressed.
+
+
+def compress(text):
+    if not text:
+        return None
+    return base64.b64encode(zlib.compress(text.encode("utf-8"))).decode("ascii")
+
+
+def decompress(data):
+    if not data:
+        return ""
+    return zlib.decompress(base64.b64decode(data)).decode("utf-8")
+
+
+def response_fields(status, summary=None, response_text=None, error=None):
+    """Tally Outbox values for a push that ended in `status`.
+
+    Without a `summary` (the voucher shared its envelope with others) only
+    the voucher's own `error` is kept; counters and ids stay empty.
+    """
+    summary = summary or {}
+    return {
+        "response_status": status,
+        "tally_created": summary.get("created", 0),
+        "tally_altered": summary.get("altered", 0),
+        "tally_errors": summary.get("errors", 0) + summary.get("exceptions", 0),
+        "line_errors": "\n".join(summary.get("line_errors") or ()) or error or None,
+        "tally_voucher_id": summary.get("last_vch_id"),
+        "tally_master_id": summary.get("last_mid"),
+        "compressed_response": None if status == "Success" else compress(response_text),
+    }
+
+
+def describe(summary):
+    """One line for a voucher's Tally Response field, e.g. "Created 1"."""
+    parts = [
+        f"{tag.title()} {summary[tag.lower()]}"
+        for tag in COUNTER_TAGS
+        if summary.get(tag.lower())
+    ]
+    if summary.get("last_vch_id"):
+        parts.append(f"Voucher ID {summary['last_vch_id']}")
+    return ", ".join(parts) or "No changes"
@@ -1,166 +1,62 @@
-import requests
 import frappe
-from datetime import datetime
-from frappe.utils import get_url
+from frappe.utils import flt
 
-def get_active_tally_config():
-    config = frappe.db.get_all(
-        "Tally Configuration",
-        filters={"is_active": 1},
-        fields=["company", "url"],
-        limit=1
-    )
-    if not config:
-        config_url = get_url("/desk/tally-configuration-")
-        frappe.throw(
-            f'No Active Tally Configuration found.<br>'
-            f'<a href="{config_url}" target="_blank"><b>Click here to activate</b></a>'
-        )
-    return config[0].company, config[0].url
+from maithantally.tally_ledger_groups import SALES_ACCOUNTS, is_under
+from maithantally.tally_xml import XmlWriter, delete_voucher, tally_amount, tally_date
 
-def send_to_tally(doc, method):
-    company, TALLY_URL = get_active_tally_config()
 
+def validate_sales_voucher(doc, method=None):
     if not doc.date or not doc.credit_ledger or not doc.debit_ledger or not doc.items:
         frappe.throw("All fields (Date, From Ledger, To Ledger, Items) are required")
 
-    xml_date = datetime.strptime(str(doc.date), "%Y-%m-%d").strftime("%Y%m%d")
-    credit_ledger = doc.credit_ledger
-    debit_ledger = doc.debit_ledger
-    amount = doc.ledger_amount
-    parent_from = frappe.db.get_value("Ledger", credit_ledger, "parent_ledger")
-    parent_to = frappe.db.get_value("Ledger", debit_ledger, "parent_ledger")
-    if parent_from in ["Sales Accounts"]:
-        credit_ledger = credit_ledger
-    else:
+    if not is_under(doc.credit_ledger, SALES_ACCOUNTS):
         frappe.throw("For Sales, Credit ledger must be a Sales")
 
 
-  
-    inventory_xml = ""
-    total_amount = 0
-    for item in doc.items:
-        uom = item.uom or ""
-        inventory_xml += f"""
-        <ALLINVENTORYENTRIES.LIST>
-            <STOCKITEMNAME>{item.item_name}</STOCKITEMNAME>
-            <ISDEEMEDPOSITIVE>No</ISDEEMEDPOSITIVE>
-            <ACTUALQTY>{item.actual_quantity} {uom}</ACTUALQTY>
-            <BILLEDQTY>{item.billed_quantity} {uom}</BILLEDQTY>
-            <RATE>{item.rate}</RATE>
-            <AMOUNT>{item.amount}</AMOUNT>
-            <ACCOUNTINGALLOCATIONS.LIST>
-                <LEDGERNAME>{doc.credit_ledger}</LEDGERNAME>
-                <AMOUNT>{item.amount}</AMOUNT>
-            </ACCOUNTINGALLOCATIONS.LIST>
-        </ALLINVENTORYENTRIES.LIST>
-        """
-        total_amount += float(item.amount)
-
-
-    xml = f"""
-<ENVELOPE>
- <HEADER>
-  <TALLYREQUEST>Import Data</TALLYREQUEST>
- </HEADER>
- <BODY>
-  <IMPORTDATA>
-   <REQUESTDESC>
-    <REPORTNAME>Vouchers</REPORTNAME>
-    <STATICVARIABLES>
-     <SVCURRENTCOMPANY>{company}</SVCURRENTCOMPANY>
-    </STATICVARIABLES>
-   </REQUESTDESC>
-   <REQUESTDATA>
-    <TALLYMESSAGE>
-     <VOUCHER VCHTYPE="Sales" ACTION="Create" OBJVIEW="Invoice Voucher View">
-        <DATE>{xml_date}</DATE>
-        <VOUCHERTYPENAME>{doc.voucher_type}</VOUCHERTYPENAME>
-        <VOUCHERNUMBER>{doc.voucher_number}</VOUCHERNUMBER>
-        <PARTYNAME>{doc.credit_ledger}</PARTYNAME>
-        <PARTYLEDGERNAME>{doc.credit_ledger}</PARTYLEDGERNAME>
-        <VCHENTRYMODE>Item Invoice</VCHENTRYMODE>
-        <NARRATION>{doc.narration}</NARRATION>
-
-        {inventory_xml}
-
-        <LEDGERENTRIES.LIST>
-            <LEDGERNAME>{doc.debit_ledger}</LEDGERNAME>
-            <AMOUNT>-{total_amount}</AMOUNT>
-        </LEDGERENTRIES.LIST>
-     </VOUCHER>
-    </TALLYMESSAGE>
-   </REQUESTDATA>
-  </IMPORTDATA>
- </BODY>
-</ENVELOPE>
-"""
-
-    try:
-        headers = {"Content-Type": "text/xml"}
-        response = requests.post(TALLY_URL, data=xml.encode("utf-8"), headers=headers)
-        doc.db_set("tally_response", response.text)
-    except Exception as e:
-        doc.db_set("tally_response", f"ERROR: {str(e)}", update_modified=False)
-
-
-
+def build_voucher_xml(doc, action="Create"):
+    """Return the <VOUCHER> block for `doc`; wrapped by tally_xml.import_envelope."""
+    if action == "Delete":
+        return build_delete_xml(doc)
 
+    validate_sales_voucher(doc)
 
+    writer = XmlWriter()
+    writer.start("VOUCHER", {"VCHTYPE": "Sales", "ACTION": "Create", "OBJVIEW": "Invoice Voucher View"})
+    writer.field("DATE", tally_date(doc.date))
+    writer.field("VOUCHERTYPENAME", doc.voucher_type)
+    writer.field("VOUCHERNUMBER", doc.voucher_number)
+    writer.field("PARTYNAME", doc.credit_ledger)
+    writer.field("PARTYLEDGERNAME", doc.credit_ledger)
+    writer.field("VCHENTRYMODE", "Item Invoice")
+    writer.field("NARRATION", doc.narration)
 
-def delete_sales_voucher(doc, method):
-    frappe.logger().info(doc.as_dict())
-
+    total_amount = 0
+    for item in doc.items:
+        uom = item.uom or ""
+        with writer.element("ALLINVENTORYENTRIES.LIST"):
+            writer.field("STOCKITEMNAME", item.item_name)
+            writer.field("ISDEEMEDPOSITIVE", "No")
+            writer.field("ACTUALQTY", f"{item.actual_quantity} {uom}")
+            writer.field("BILLEDQTY", f"{item.billed_quantity} {uom}")
+            writer.field("RATE", item.rate)
+            writer.field("AMOUNT", tally_amount(item.amount))
+            with writer.element("ACCOUNTINGALLOCATIONS.LIST"):
+                writer.field("LEDGERNAME", doc.credit_ledger)
+                writer.field("AMOUNT", tally_amount(item.amount))
+        total_amount += flt(item.amount)
+
+    with writer.element("LEDGERENTRIES.LIST"):
+        writer.field("LEDGERNAME", doc.debit_ledger)
+        writer.field("AMOUNT", tally_amount(-total_amount))
+
+    writer.end("VOUCHER")
+    return writer.getvalue()
+
+
+def build_delete_xml(doc):
     if not doc.date:
         frappe.throw("Date is required")
     if not doc.voucher_number:
         frappe.throw("Voucher Number is required")
-    company,TALLY_URL=get_active_tally_config()
-
-    xml_date = datetime.strptime(str(doc.date), "%Y-%m-%d").strftime("%d-%b-%Y")
-
-    xml = f"""
-    <ENVELOPE>
-        <HEADER>
-            <VERSION>1</VERSION>
-            <TALLYREQUEST>Import</TALLYREQUEST>
-            <TYPE>Data</TYPE>
-            <ID>Vouchers</ID>
-        </HEADER>
-        <BODY>
-            <DESC>
-            <STATICVARIABLES>
-                    <SVCURRENTCOMPANY>{company}</SVCURRENTCOMPANY>
-                </STATICVARIABLES>
-            </DESC>
-            <DATA>
-                <TALLYMESSAGE>
-                    <VOUCHER 
-                        DATE="{xml_date}" 
-                        TAGNAME="Voucher Number" 
-                        TAGVALUE="{doc.voucher_number}" 
-                        VCHTYPE="Sales" 
-                        ACTION="Delete">
-                    </VOUCHER>
-                </TALLYMESSAGE>
-            </DATA>
-        </BODY>
-    </ENVELOPE>
-    """
-
-    frappe.logger().info("Generated XML for Tally (Delete):")
-    frappe.logger().info(xml)
-
-    try:
-        headers = {"Content-Type": "text/xml"}
-        response = requests.post(TALLY_URL, data=xml.encode("utf-8"), headers=headers)
-
-        frappe.logger().info("Tally Response:")
-        frappe.logger().info(response.text)
-
-        doc.db_set("tally_response", response.text)
 
-    except Exception as e:
-        frappe.logger().error("Tally Error:")
-        frappe.logger().error(str(e))
-        doc.db_set("tally_response", f"ERROR: {str(e)}", update_modified=False)
+    return delete_voucher(doc, "Sales")
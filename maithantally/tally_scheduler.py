@@ -0,0 +1,135 @@
+import frappe
+from frappe.utils import add_to_date, get_datetime, now_datetime
+
+from maithantally import tally_concurrency, tally_config
+from maithantally.tally_sync_fetch_itemname import fetch_items
+from maithantally.tally_sync_fetch_ledgers import fetch_ledgers
+from maithantally.tally_sync_vouchers import sync_vouchers_from_tally_frappe_orm
+
+# Background pulls from Tally. A cron tick every minute enqueues whichever
+# job is due; each job reschedules itself from what it found:
+#
+# - a large delta pulls again sooner (half the configured interval);
+# - no changes, or Tally unreachable, doubles the wait up to Max Sync Interval;
+# - anything else goes back to the configured interval.
+#
+# A job that finds another pull holding the sync lock simply tries again on
+# its normal cadence.
+
+STATE_KEY = "maithantally:tally_schedule:{job}"
+
+LARGE_DELTA = 100   # changed records that count as "Tally is busy right now"
+MIN_INTERVAL = 1    # minutes
+
+
+class SyncFailed(Exception):
+    pass
+
+
+def _sync_vouchers():
+    run = sync_vouchers_from_tally_frappe_orm()
+    if run.status != "Completed":
+        raise SyncFailed(run.error)
+    return run.inserted + run.updated + run.tombstoned
+
+
+def _fetch_ledgers():
+    result = fetch_ledgers()
+    if result.get("error"):
+        raise SyncFailed(result["error"])
+    return result["inserted"] + result["updated"]
+
+
+def _fetch_items():
+    result = fetch_items()
+    if result.get("error"):
+        raise SyncFailed(result["error"])
+    return result["inserted"] + result["updated"]
+
+
+# job -> (runner method, pull, interval field on TallyConfig)
+JOBS = {
+    "vouchers": ("maithantally.tally_scheduler.run_voucher_sync", _sync_vouchers, "voucher_sync_interval"),
+    "ledgers": ("maithantally.tally_scheduler.run_ledger_sync", _fetch_ledgers, "ledger_sync_interval"),
+    "items": ("maithantally.tally_scheduler.run_item_sync", _fetch_items, "item_sync_interval"),
+}
+
+
+def run_due_jobs():
+    """Cron tick: enqueue every scheduled pull whose next run is due."""
+    try:
+        config = tally_config.get_active_tally_config()
+    except frappe.ValidationError:
+        frappe.clear_messages()
+        return
+    if not config.scheduled_sync:
+        return
+
+    now = now_datetime()
+    for job, (method, _, interval_field) in JOBS.items():
+        state = get_state(job)
+        if state.get("next_run") and get_datetime(state["next_run"]) > now:
+            continue
+
+        # Push next_run out first so the following ticks leave the job alone
+        # while it waits in the queue; the job sets the real value when done.
+        interval = state.get("interval") or getattr(config, interval_field)
+        set_state(job, state, interval, now)
+        tally_concurrency.enqueue_sync(method)
+
+
+def run_voucher_sync():
+    run_job("vouchers")
+
+
+def run_ledger_sync():
+    run_job("ledgers")
+
+
+def run_item_sync():
+    run_job("items")
+
+
+def run_job(job):
+    _, pull, interval_field = JOBS[job]
+    config = tally_config.get_active_tally_config()
+    base = getattr(config, interval_field)
+    state = get_state(job)
+    interval = state.get("interval") or base
+
+    try:
+        changes = pull()
+    except tally_concurrency.SyncLocked:
+        frappe.clear_messages()
+        set_state(job, state, base)
+        return
+    except Exception as e:
+        frappe.log_error(title=f"Scheduled Tally {job} sync failed", message=str(e))
+        set_state(job, state, min(interval * 2, config.max_sync_interval), failures=state.get("failures", 0) + 1)
+        return
+
+    set_state(job, state, next_interval(base, interval, changes, config.max_sync_interval), changes=changes)
+
+
+def next_interval(base, current, changes, max_interval):
+    if changes >= LARGE_DELTA:
+        return max(base // 2, MIN_INTERVAL)
+    if not changes:
+        return min(max(current, base) * 2, max_interval)
+    return base
+
+
+def get_state(job):
+    return frappe.cache.get_value(STATE_KEY.format(job=job)) or {}
+
+
+def set_state(job, state, interval, now=None, changes=None, failures=None):
+    now = now or now_datetime()
+    state = {**state, "interval": interval, "next_run": add_to_date(now, minutes=interval)}
+    if failures is not None:
+        state["failures"] = failures
+    if changes is not None:
+        state["last_changes"] = changes
+        state["last_success"] = now
+        state["failures"] = 0
+    frappe.cache.set_value(STATE_KEY.format(job=job), state)
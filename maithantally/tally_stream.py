@@ -0,0 +1,187 @@
+import codecs
+import hashlib
+import re
+import tempfile
+from contextlib import nullcontext
+
+from lxml import etree
+
+from maithantally import tally_client, tally_watermarks
+from maithantally.tally_chunks import ChunkFetchError
+
+# Streaming ingest for Tally exports. The response body is read off the
+# socket in chunks, cleaned at byte level and fed to an incremental lxml
+# parser; each <VOUCHER> is handed to the caller as soon as it closes and
+# freed right after, so memory stays flat however large the export is.
+
+CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_SIZE = 8 * 1024 * 1024   # larger downloads spill to a temp file
+
+# Control characters Tally leaks into names and narrations; none of them
+# are allowed in XML 1.0, raw or as character references. Control bytes
+# never occur inside a multi-byte UTF-8 sequence, so stripping them from
+# the raw bytes is safe.
+_CONTROL_BYTES_RE = re.compile(rb"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_CHARREF_RE = re.compile(rb"&#(x[0-9a-fA-F]+|[0-9]+);")
+_CHARREF_MAX_LEN = 12   # enough for &#x0000001F; and then some
+
+_FAILURE_MARKERS = (b"<LINEERROR>", b"Memory Access Violation")
+_VOUCHER_MARKERS = (b"<VOUCHER ", b"<VOUCHER>")
+_SCAN_OVERLAP = 64
+
+
+def _drop_invalid_charref(match):
+    value = match.group(1)
+    code = int(value[1:], 16) if value[:1] in (b"x", b"X") else int(value)
+    if code < 0x20 and code not in (0x09, 0x0a, 0x0d):
+        return b""
+    return match.group(0)
+
+
+def sanitize(chunks):
+    """Strip XML-illegal control characters and invalid UTF-8 from a byte
+    stream. A character reference split across two chunks is held back
+    until it is complete."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    pending = b""
+
+    for chunk in chunks:
+        if not chunk:
+            continue
+        data = pending + chunk
+
+        amp = data.rfind(b"&", -_CHARREF_MAX_LEN)
+        if amp != -1 and b";" not in data[amp:]:
+            data, pending = data[:amp], data[amp:]
+        else:
+            pending = b""
+
+        yield _clean(data, decoder)
+
+    yield _clean(pending, decoder, final=True)
+
+
+def _clean(data, decoder, final=False):
+    data = _CHARREF_RE.sub(_drop_invalid_charref, _CONTROL_BYTES_RE.sub(b"", data))
+    return decoder.decode(data, final).encode("utf-8")
+
+
+def iter_elements(chunks, tag="VOUCHER"):
+    """Yield every `tag` element of the document as soon as it closes.
+
+    The element (and everything parsed before it) is cleared once the
+    caller moves on, so hold on to values, not elements.
+    """
+    parser = etree.XMLPullParser(events=("end",), tag=f"{{*}}{tag}", recover=True, huge_tree=True)
+    fed = False
+
+    for chunk in sanitize(chunks):
+        if chunk:
+            parser.feed(chunk)
+            fed = True
+            yield from _drain(parser)
+
+    if fed:
+        try:
+            parser.close()
+        except etree.XMLSyntaxError:
+            pass
+        yield from _drain(parser)
+
+
+def iter_vouchers(chunks):
+    return iter_elements(chunks, "VOUCHER")
+
+
+def _drain(parser):
+    for _, elem in parser.read_events():
+        yield elem
+        elem.clear(keep_tail=True)
+        parent = elem.getparent()
+        if parent is not None:
+            while elem.getprevious() is not None:
+                del parent[0]
+
+
+def read_chunks(fileobj, chunk_size=CHUNK_SIZE):
+    fileobj.seek(0)
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+class Download:
+    """An export body spooled off the socket, plus what was learnt on the way."""
+
+    def __init__(self):
+        self.file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        self.vouchers = 0
+        self.alter_id = 0
+        self.master_id = 0
+        self.failed = False
+        self._tail = b""
+        self._sha = hashlib.sha256()
+
+    @property
+    def payload_hash(self):
+        return self._sha.hexdigest()
+
+    def write(self, chunk):
+        self.file.write(chunk)
+        self._sha.update(chunk)
+
+        # Markers may straddle two chunks, so each scan includes the tail of
+        # the previous one; counts subtract what the tail alone contained.
+        window = self._tail + chunk
+        for marker in _VOUCHER_MARKERS:
+            self.vouchers += window.count(marker) - self._tail.count(marker)
+        self.failed = self.failed or any(marker in window for marker in _FAILURE_MARKERS)
+
+        alter_id, master_id = tally_watermarks.max_ids(window)
+        self.alter_id = max(self.alter_id, alter_id)
+        self.master_id = max(self.master_id, master_id)
+
+        self._tail = window[-_SCAN_OVERLAP:]
+
+    def chunks(self, chunk_size=CHUNK_SIZE):
+        return read_chunks(self.file, chunk_size)
+
+    def head(self, size=500):
+        self.file.seek(0)
+        return self.file.read(size).decode("utf-8", errors="ignore")
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def download(url, xml, timeout=None, budget=None, chunk_size=CHUNK_SIZE, timer=None):
+    """Stream an export into a Download. Safe to run in a worker thread.
+
+    Raises ChunkFetchError when Tally answered with an error instead of
+    data, so the chunk planner can retry with a smaller window. A request
+    slot of `budget` is held until the whole body is spooled, and the
+    transfer is charged to `timer` as http_send.
+    """
+    result = Download()
+    try:
+        with tally_client.stream(url, xml, timeout=timeout, budget=budget, timer=timer) as response:
+            response.raise_for_status()
+            with timer.stage("http_send") if timer else nullcontext():
+                for chunk in response.iter_content(chunk_size):
+                    result.write(chunk)
+
+        if result.failed:
+            raise ChunkFetchError(result.head())
+    except Exception:
+        result.close()
+        raise
+
+    return result
@@ -1,32 +1,28 @@
-import frappe
-import requests
-from lxml import etree
 import re
-from io import BytesIO
-from frappe.utils import get_url
+import xml.sax.saxutils as saxutils
+
+import frappe
+from frappe.utils import flt
 
-def get_active_tally_config():
-    config = frappe.db.get_all(
-        "Tally Configuration",
-        filters={"is_active": 1},
-        fields=["company", "url"],
-        limit=1
-    )
-    if not config:
-        config_url = get_url("/desk/tally-configuration-")
-        frappe.throw(f'No Active Tally Configuration found.<br>'
-                     f'<a href="{config_url}" target="_blank"><b>Click here to activate</b></a>')
-    return config[0]["company"], config[0]["url"]
+from maithantally import tally_stream, tally_watermarks
+from maithantally.tally_concurrency import exclusive_sync, get_request_budget
+from maithantally.tally_config import get_active_tally_config
+from maithantally.tally_log import RunLog
+from maithantally.tally_masters import MasterBulkWriter
+from maithantally.tally_metrics import StageTimer
 
+WATERMARK_COLLECTION = "StockItem"
 
+ITEM_FIELDS = ("item_group", "uom", "opening_rate")
 
+# OPENINGRATE comes as "1,250.00/Nos" (the unit after the slash)
+_RATE_RE = re.compile(r"-?[\d,]*\.?\d+")
 
 
+def build_item_export(company, since_alter_id=0):
+    filters, filter_definition = tally_watermarks.collection_filter(since_alter_id)
 
-@frappe.whitelist() 
-def fetch_items():
-    company,TALLY_URL=get_active_tally_config()
-    xml_request = """<ENVELOPE>
+    return f"""<ENVELOPE>
         <HEADER>
             <VERSION>1</VERSION>
             <TALLYREQUEST>EXPORT</TALLYREQUEST>
@@ -35,46 +31,79 @@ def fetch_items():
         </HEADER>
         <BODY>
             <DESC>
+                <STATICVARIABLES>
+                    <SVCURRENTCOMPANY>{saxutils.escape(company)}</SVCURRENTCOMPANY>
+                    <SVEXPORTFORMAT>$$SysName:XML</SVEXPORTFORMAT>
+                </STATICVARIABLES>
                 <TDL>
                     <TDLMESSAGE>
                         <COLLECTION NAME="ITEMLIST" ISINITIALIZE="Yes">
                             <TYPE>StockItem</TYPE>
-                            <FETCH>Name</FETCH>
+                            <FETCH>Name, Parent, BaseUnits, OpeningRate, AlterID, MasterID</FETCH>
+                            {filters}
                         </COLLECTION>
+                        {filter_definition}
                     </TDLMESSAGE>
                 </TDL>
             </DESC>
         </BODY>
     </ENVELOPE>"""
 
-    try:
-        response = requests.post(TALLY_URL, data=xml_request)
-        response.raise_for_status()
 
-   
-        clean_xml = re.sub(r"[\x00-\x08\x0B\x0C\x0E-\x1F]", "", response.text)
-        tree = BytesIO(clean_xml.encode("utf-8"))
+def parse_rate(text):
+    match = _RATE_RE.search(text or "")
+    return abs(flt(match.group().replace(",", ""), 2)) if match else 0.0
+
 
-        inserted_items=[]
+def item_values(elem):
+    return {
+        "item_group": (elem.findtext("PARENT") or "").strip(),
+        "uom": (elem.findtext("BASEUNITS") or "").strip(),
+        "opening_rate": parse_rate(elem.findtext("OPENINGRATE")),
+    }
 
-        for event, elem in etree.iterparse(tree, events=("end",), recover=True):
-            if elem.tag.upper().endswith("STOCKITEM"):
-                name = elem.get("NAME")
-                if not name:
-                    continue
 
-               
-                if not frappe.db.exists("Items", {"item_name": name}):
-                    doc = frappe.get_doc({
-                        "doctype": "Items",
-                        "item_name": name
-                    })
-                    doc.insert(ignore_permissions=True)
-                    frappe.db.commit()
-                    inserted_items.append(name)
+@frappe.whitelist()
+@exclusive_sync
+def fetch_items(full=False):
+    """Stream the Tally stock items into Items, with group, UOM and opening rate.
 
-        return inserted_items
+    New items are bulk-inserted and changed ones bulk-updated, one commit
+    per batch. Only items altered since the last run are requested unless
+    `full` is set. Returns the inserted names (`items`) and the
+    inserted/updated/unchanged counts.
+    """
+    timer = StageTimer("items")
+    with timer.stage("config"):
+        config = get_active_tally_config()
+    log = RunLog("items", config)
+    since_alter_id = 0 if frappe.parse_json(full) else tally_watermarks.get_alter_id(config.company, WATERMARK_COLLECTION)
+
+    try:
+        with timer.stage("build_xml"):
+            xml = build_item_export(config.company, since_alter_id)
+        download = tally_stream.download(
+            config.url, xml, timeout=config.timeout, budget=get_request_budget(config), timer=timer
+        )
+
+        writer = MasterBulkWriter("Items", "item_name", ITEM_FIELDS, timer=timer)
+        with download:
+            for elem in timer.iterate(tally_stream.iter_elements(download.chunks(), "STOCKITEM"), "stream"):
+                name = (elem.get("NAME") or elem.findtext("NAME") or "").strip()
+                if name:
+                    writer.add(name, item_values(elem))
+        writer.flush()
+
+        tally_watermarks.advance(config.company, [WATERMARK_COLLECTION], download.alter_id, download.master_id)
+        frappe.db.commit()
+
+        log.counts.update(writer.counts)
+        return {"items": writer.inserted, **writer.counts}
 
     except Exception as e:
-        frappe.logger().error(f"Error fetching/parsing items: {e}")
-        return f"Error: {e}"
+        log.error("Error fetching/parsing items: %s", e)
+        return {"error": str(e)}
+
+    finally:
+        timer.publish()
+        log.summary()
@@ -1,35 +1,28 @@
-import frappe
-import requests
-from lxml import etree
-import re
-from io import BytesIO
-from frappe.utils import get_url
 import xml.sax.saxutils as saxutils
 
-def get_active_tally_config():
-    config = frappe.db.get_all(
-        "Tally Configuration",
-        filters={"is_active": 1},
-        fields=["company", "url"],
-        limit=1
-    )
-    if not config:
-        config_url = get_url("/desk/tally-configuration-")
-        frappe.throw(f'No Active Tally Configuration found.<br>'
-                     f'<a href="{config_url}" target="_blank"><b>Click here to activate</b></a>')
-    return config[0]["company"], config[0]["url"]
-
-@frappe.whitelist() 
-def fetch_ledgers():
-    company, TALLY_URL = get_active_tally_config()
-    
+import frappe
+
+from maithantally import tally_ledger_groups, tally_stream, tally_watermarks
+from maithantally.tally_concurrency import exclusive_sync, get_request_budget
+from maithantally.tally_config import get_active_tally_config
+from maithantally.tally_log import RunLog
+from maithantally.tally_masters import MasterBulkWriter
+from maithantally.tally_metrics import StageTimer
+
+WATERMARK_COLLECTION = "Ledger"
+GROUP_WATERMARK_COLLECTION = "Group"
+
+
+def build_master_export(company, tally_type, since_alter_id=0):
+    filters, filter_definition = tally_watermarks.collection_filter(since_alter_id)
+
     # CRITICAL CLOUD FIX: Added <STATICVARIABLES> block to provide Company Context
-    xml_request = f"""<ENVELOPE>
+    return f"""<ENVELOPE>
         <HEADER>
             <VERSION>1</VERSION>
             <TALLYREQUEST>EXPORT</TALLYREQUEST>
             <TYPE>COLLECTION</TYPE>
-            <ID>LEDGERLIST</ID>
+            <ID>MASTERLIST</ID>
         </HEADER>
         <BODY>
             <DESC>
@@ -39,55 +32,75 @@ def fetch_ledgers():
                 </STATICVARIABLES>
                 <TDL>
                     <TDLMESSAGE>
-                        <COLLECTION NAME="LEDGERLIST" ISINITIALIZE="Yes">
-                            <TYPE>Ledger</TYPE>
-                            <FETCH>Name, Parent</FETCH>
+                        <COLLECTION NAME="MASTERLIST" ISINITIALIZE="Yes">
+                            <TYPE>{tally_type}</TYPE>
+                            <FETCH>Name, Parent, AlterID, MasterID</FETCH>
+                            {filters}
                         </COLLECTION>
+                        {filter_definition}
                     </TDLMESSAGE>
                 </TDL>
             </DESC>
         </BODY>
     </ENVELOPE>"""
 
+
+def fetch_masters(config, budget, tally_type, collection, writer, parent_field, full=False, timer=None):
+    """Stream one master collection (Ledger or Group) through `writer`."""
+    since_alter_id = 0 if full else tally_watermarks.get_alter_id(config.company, collection)
+    timer = timer or StageTimer("ledgers")
+
+    with timer.stage("build_xml"):
+        xml = build_master_export(config.company, tally_type, since_alter_id)
+
+    # Streamed into a spool and parsed a master at a time (see tally_stream)
+    download = tally_stream.download(config.url, xml, timeout=config.timeout, budget=budget, timer=timer)
+    with download:
+        masters = timer.iterate(tally_stream.iter_elements(download.chunks(), tally_type.upper()), "stream")
+        for master in masters:
+            # Use findtext to avoid errors if tags are missing
+            name = (master.get("NAME") or master.findtext("NAME") or "").strip()
+            if name:
+                writer.add(name, {parent_field: (master.findtext("PARENT") or "").strip()})
+    writer.flush()
+
+    tally_watermarks.advance(config.company, [collection], download.alter_id, download.master_id)
+    frappe.db.commit()
+
+
+@frappe.whitelist()
+@exclusive_sync
+def fetch_ledgers(full=False):
+    """Stream the Tally groups and ledger masters into Ledger Group and Ledger.
+
+    New masters are bulk-inserted and ones moved to another group get their
+    parent updated. Only masters altered since the last run are requested
+    unless `full` is set. Returns the inserted ledger names (`ledgers`) and
+    the ledger inserted/updated/unchanged counts.
+    """
+    timer = StageTimer("ledgers")
+    with timer.stage("config"):
+        config = get_active_tally_config()
+    log = RunLog("ledgers", config)
+    full = frappe.parse_json(full)
+    budget = get_request_budget(config)
+
     try:
-        # Increased timeout to 60 for Cloud latency
-        response = requests.post(TALLY_URL, data=xml_request, timeout=60)
-        response.raise_for_status()
-
-        clean_xml = re.sub(r"[\x00-\x08\x0B\x0C\x0E-\x1F]", "", response.text)
-        tree = BytesIO(clean_xml.encode("utf-8"))
-
-        inserted_ledgers = [] 
-        
-        # PERFORMANCE FIX: Load existing names into a set to avoid thousands of DB queries
-        existing_ledgers = set(frappe.db.get_all("Ledger", pluck="ledger_name"))
-
-        for event, ledger in etree.iterparse(tree, events=("end",), recover=True):
-            if ledger.tag.upper().endswith("LEDGER"):
-                # Use findtext to avoid errors if tags are missing
-                name = ledger.get("NAME") or ledger.findtext("NAME")
-                parent = ledger.findtext("PARENT") or ""
-
-                if not name or name in existing_ledgers:
-                    continue
-
-                doc = frappe.get_doc({
-                    "doctype": "Ledger",
-                    "ledger_name": name,
-                    "parent_ledger": parent
-                })
-                doc.insert(ignore_permissions=True)
-                inserted_ledgers.append(name)
-                
-                # Update local set to prevent duplicate processing in same loop
-                existing_ledgers.add(name)
-
-        # BATCH FIX: Commit only once after the loop finishes
-        if inserted_ledgers:
-            frappe.db.commit()
-
-        return inserted_ledgers  
+        groups = MasterBulkWriter("Ledger Group", "group_name", ["parent_group"], timer=timer)
+        fetch_masters(config, budget, "Group", GROUP_WATERMARK_COLLECTION, groups, "parent_group", full, timer)
+
+        ledgers = MasterBulkWriter("Ledger", "ledger_name", ["parent_ledger"], timer=timer)
+        fetch_masters(config, budget, "Ledger", WATERMARK_COLLECTION, ledgers, "parent_ledger", full, timer)
+
+        log.counts.update(ledgers.counts)
+        return {"ledgers": ledgers.inserted, **ledgers.counts}
 
     except Exception as e:
-        frappe.logger().error(f"Error fetching/parsing ledgers: {e}")
-        return {"error": str(e)}
\ No newline at end of file
+        log.error("Error fetching/parsing ledgers: %s", e)
+        return {"error": str(e)}
+
+    finally:
+        # Bulk writes skip the Ledger controllers, so drop the group closure here.
+        tally_ledger_groups.clear_cache()
+        timer.publish()
+        log.summary()
@@ -0,0 +1,162 @@
+import frappe
+from frappe.utils import cint, getdate, now_datetime
+
+from maithantally import tally_archive, tally_watermarks
+from maithantally.tally_chunks import fetch_windows
+
+# A voucher pull is recorded as a "Tally Sync Run" and committed one date
+# window (chunk) at a time. Each completed chunk is written to the run, so
+# a run that dies half way can be resumed: the windows it already finished
+# are skipped and the rest are fetched again. Each chunk keeps the hash of
+# the export it came from, which is how tally_archive finds it for replay.
+
+RUN_DOCTYPE = "Tally Sync Run"
+COUNT_FIELDS = ("vouchers", "inserted", "updated", "unchanged", "tombstoned")
+
+
+def start(method, company, from_date, to_date, full=False, since_alter_id=0, update_watermarks=True):
+    run = frappe.get_doc({
+        "doctype": RUN_DOCTYPE,
+        "method": method,
+        "company": company,
+        "from_date": from_date,
+        "to_date": to_date,
+        "full_sync": 1 if full else 0,
+        "since_alter_id": cint(since_alter_id),
+        "update_watermarks": 1 if update_watermarks else 0,
+        "status": "Running",
+        "started_on": now_datetime(),
+    })
+    run.insert(ignore_permissions=True)
+    frappe.db.commit()
+    return run
+
+
+def load(name):
+    """Reopen a run for resumption."""
+    run = frappe.get_doc(RUN_DOCTYPE, name)
+    if run.status == "Completed":
+        frappe.throw(f"Tally Sync Run {name} has already completed")
+
+    run.status = "Running"
+    run.error = None
+    run.save(ignore_permissions=True)
+    frappe.db.commit()
+    return run
+
+
+def advance_watermarks(run, collections):
+    """Advance the run's watermarks past what it imported, unless it pulled
+    an explicit date range (see tally_watermarks)."""
+    if run.update_watermarks:
+        tally_watermarks.advance(
+            run.company, collections, run.last_alter_id, run.last_master_id, run.held_alter_id
+        )
+
+
+def completed_windows(run):
+    return [(getdate(chunk.from_date), getdate(chunk.to_date)) for chunk in run.chunks]
+
+
+def run_chunks(run, planner, fetch, max_parallel, process, writer, archive=False):
+    """Fetch and process every window, checkpointing each one on the run.
+
+    `process(window, download)` imports one window through `writer` (a
+    VoucherBulkWriter) and returns a dict with `vouchers` and, for full
+    syncs, `tombstoned`. With `archive` every export is kept (see
+    tally_archive) before it is processed.
+    """
+    for window, download in fetch_windows(planner, fetch, max_parallel):
+        before = dict(writer.counts)
+        writer.last_key = None
+        with download:
+            if archive:
+                tally_archive.store_download(download)
+            result = process(window, download)
+        writer.flush()
+
+        counts = {key: writer.counts[key] - before[key] for key in writer.counts}
+        counts["last_voucher_key"] = writer.last_key
+        if writer.held_alter_id and (not run.held_alter_id or writer.held_alter_id < run.held_alter_id):
+            run.held_alter_id = writer.held_alter_id
+        record_chunk(run, window, download, result, counts)
+
+
+def record_chunk(run, window, download, result, counts):
+    chunk = {
+        "from_date": window[0],
+        "to_date": window[1],
+        "vouchers": cint(result.get("vouchers")),
+        "tombstoned": cint(result.get("tombstoned")),
+        "payload_hash": download.payload_hash,
+        "completed_on": now_datetime(),
+        **counts,
+    }
+    run.append("chunks", chunk)
+    for field in COUNT_FIELDS:
+        run.set(field, cint(run.get(field)) + cint(chunk.get(field)))
+    run.last_alter_id = max(cint(run.last_alter_id), download.alter_id)
+    run.last_master_id = max(cint(run.last_master_id), download.master_id)
+
+    run.save(ignore_permissions=True)
+    frappe.db.commit()
+
+
+def finish(run, timer=None, log=None):
+    run.status = "Completed"
+    run.finished_on = now_datetime()
+    record_timings(run, timer)
+    record_log(run, log)
+    run.save(ignore_permissions=True)
+    frappe.db.commit()
+
+
+def fail(run, error, timer=None, log=None):
+    # The failed chunk is not recorded, so a resume fetches it again; any
+    # batch it already committed is simply matched by hash the next time.
+    frappe.db.rollback()
+    run.reload()
+    run.status = "Failed"
+    run.finished_on = now_datetime()
+    run.error = str(error)
+    record_timings(run, timer)
+    record_log(run, log)
+    run.save(ignore_permissions=True)
+    frappe.db.commit()
+
+
+def record_timings(run, timer):
+    """Keep the run's per-stage timings (added up across resumes) and
+    publish them to the site metrics (see tally_metrics)."""
+    if not timer:
+        return
+    run.stage_timings = timer.as_json(run.stage_timings)
+    timer.publish()
+
+
+def record_log(run, log):
+    """Keep the run's event counts (see tally_log) and log them in one line."""
+    if not log:
+        return
+    run.log_counts = log.as_json(run.log_counts)
+    log.summary()
+
+
+@frappe.whitelist()
+def resume(name):
+    frappe.only_for("System Manager")
+
+    run = frappe.get_doc(RUN_DOCTYPE, name)
+    if run.status != "Failed":
+        frappe.throw(f"Only failed runs can be resumed; {name} is {run.status}")
+
+    run.db_set("status", "Queued")
+    frappe.enqueue(
+        run.method,
+        queue="long",
+        timeout=4 * 60 * 60,
+        job_id=f"tally_sync_run::{name}",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        run=name,
+    )
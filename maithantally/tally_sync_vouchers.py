@@ -1,35 +1,43 @@
-import requests
-from lxml import etree
-import re
+import logging
 from datetime import datetime, timedelta, date # Import date and timedelta
-import io
 import frappe
 from frappe.utils import flt, nowdate, getdate # Keep nowdate and getdate
 
+from maithantally import tally_stream, tally_sync_run, tally_watermarks
+from maithantally.tally_bulk import VoucherBulkWriter, tombstone_missing
+from maithantally.tally_chunks import ChunkPlanner
+from maithantally.tally_concurrency import exclusive_sync, get_request_budget
+from maithantally.tally_config import get_active_tally_config
+from maithantally.tally_extract import extract_voucher
+from maithantally.tally_ledger_resolver import LedgerResolver
+from maithantally.tally_log import RunLog
+from maithantally.tally_metrics import StageTimer
+from maithantally.tally_xml import escape_xml
+
 # NOTE: This function MUST be executed using the 'bench execute' command.
 
-def sync_vouchers_from_tally_frappe_orm():
+@exclusive_sync
+def sync_vouchers_from_tally_frappe_orm(from_date=None, to_date=None, full=False, run=None):
     """
-    Fetches Vouchers from Tally using a defined date range, aggregates D/C into a 
-    single transaction, and performs CUD operations using Frappe ORM functions.
+    Fetches Vouchers from Tally using a defined date range and upserts them,
+    with their ledger entries, through the bulk writer.
+
+    Runs incrementally (only vouchers altered since the last successful run)
+    once watermarks exist; pass full=True to re-scan the whole range and
+    flag vouchers that no longer exist in Tally as deleted.
+
+    Progress is committed per date window on a Tally Sync Run; pass `run`
+    (the name of a failed run) to resume it from its last completed window.
     """
     
     # ---------------- CONFIGURATION & DATE RANGE ----------------
-    tally_url = "http://192.168.1.35:9000/" 
-
-    # --- DATE RANGE FIX: Use standard Python datetime manipulation ---
-    # Get today's date using frappe.utils.getdate() or datetime.now().date()
-    today = getdate() 
-    
-    # Define a broad date range (e.g., current day +/- 1 year)
-    # This should return a date object, safe for consistency.
-    from_date = today - timedelta(days=365) # Go back one year
-    to_date = today + timedelta(days=365)   # Go forward one year
-    
-    # Format dates as YYYYMMDD string for Tally
-    tally_from_date = from_date.strftime("%Y%m%d")
-    tally_to_date = to_date.strftime("%Y%m%d")
-
+    # Per-stage timings end up on the run and in the site metrics (see tally_metrics).
+    timer = StageTimer("pull")
+    with timer.stage("config"):
+        config = get_active_tally_config()
+    tally_url = config.url
+    # Per-voucher messages are counted and sampled, not printed (see tally_log).
+    log = RunLog("pull", config)
 
     VCHTYPE_DOCTYPE_MAP = {
         "Payment": "Payment Voucher",
@@ -37,40 +45,67 @@ def sync_vouchers_from_tally_frappe_orm():
         "Journal": "Journal Voucher",
         "Contra": "Contra Voucher"
     }
+
+    collections = tally_watermarks.scoped("vouchers", VCHTYPE_DOCTYPE_MAP)
+
+    if run:
+        # --- RESUME: same range and delta as the failed run, minus its completed windows ---
+        run = tally_sync_run.load(run)
+        company_name = run.company
+        from_date, to_date = getdate(run.from_date), getdate(run.to_date)
+        since_alter_id = run.since_alter_id
+        completed = tally_sync_run.completed_windows(run)
+    else:
+        company_name = config.company
+        # The watermarks belong to the default range; an explicit one is pulled in full.
+        explicit_range = bool(from_date or to_date)
+
+        # --- DATE RANGE FIX: Use standard Python datetime manipulation ---
+        # Get today's date using frappe.utils.getdate() or datetime.now().date()
+        today = getdate() 
+        
+        # Define a broad date range (e.g., current day +/- 1 year) unless one is given.
+        # It is fetched in adaptive windows (see tally_chunks), never in one request.
+        from_date = getdate(from_date) if from_date else today - timedelta(days=365) # Go back one year
+        to_date = getdate(to_date) if to_date else today + timedelta(days=365)   # Go forward one year
+
+        # --- INCREMENTAL: ALTERID watermark per voucher type (see tally_watermarks) ---
+        since_alter_id = 0 if full or explicit_range else tally_watermarks.get_since(company_name, collections)
+        completed = []
+        run = tally_sync_run.start(
+            "maithantally.tally_sync_vouchers.sync_vouchers_from_tally_frappe_orm",
+            company_name, from_date, to_date, full, since_alter_id,
+            update_watermarks=not explicit_range,
+        )
+    log.bind(run.name)
+
+    filters, filter_definition = tally_watermarks.collection_filter(since_alter_id)
     
     # --- Tally Payload (Includes date range variables SVFROMDATE/SVTODATE) ---
-    tally_payload = f"""<ENVELOPE>
+    def build_payload(window_from, window_to):
+        tally_from_date = window_from.strftime("%Y%m%d")
+        tally_to_date = window_to.strftime("%Y%m%d")
+        return f"""<ENVELOPE>
       <HEADER><VERSION>1</VERSION><TALLYREQUEST>Export</TALLYREQUEST><TYPE>Collection</TYPE><ID>VoucherList</ID></HEADER>
       <BODY><DESC><STATICVARIABLES>
-            <SVCURRENTCOMPANY>Dummy Company</SVCURRENTCOMPANY>
+            <SVCURRENTCOMPANY>{escape_xml(company_name)}</SVCURRENTCOMPANY>
             <SVEXPORTFORMAT>$$SysName:XML</SVEXPORTFORMAT>
             <SVFROMDATE>{tally_from_date}</SVFROMDATE>
             <SVTODATE>{tally_to_date}</SVTODATE>
         </STATICVARIABLES>
       <TDL><TDLMESSAGE><COLLECTION NAME="VoucherList" ISMODIFY="No"><TYPE>Voucher</TYPE><FETCH>
       
-             VOUCHERNUMBER,DATE,VCHTYPE,VOUCHERTYPENAME,NARRATION,
+             VOUCHERNUMBER,DATE,VCHTYPE,VOUCHERTYPENAME,NARRATION,ALTERID,MASTERID,
              ALLLEDGERENTRIES.LIST/LEDGERNAME,ALLLEDGERENTRIES.LIST/AMOUNT
-          </FETCH></COLLECTION></TDLMESSAGE></TDL></DESC></BODY>
+          </FETCH>{filters}</COLLECTION>{filter_definition}</TDLMESSAGE></TDL></DESC></BODY>
     </ENVELOPE>"""
     
     # ---------------- HELPER FUNCTIONS (No Changes needed here) ----------------
-    def clean_xml_text(text):
-        text = re.sub(r'[\x00-\x08\x0b-\x0c\x0e-\x1f]', '', text)
-        text = re.sub(r'&#\d+;', '', text)
-        text = text.replace('→', '->').replace('₹', 'Rs.').replace('✓', 'v')
-        return text
-
     def safe_str(s):
         if s is None: return ""
         s = str(s).replace('→', '->').replace('₹', 'Rs.').replace('✓', 'v')
         return str(s).strip() 
 
-    def elem_text(elem, name):
-        if elem is None: return None
-        res = elem.xpath(f".//*[local-name()='{name}']/text()")
-        return res[0].strip() if res else None
-
     def parse_date(tally_date):
         if not tally_date: return None
         s = str(tally_date).strip()
@@ -83,161 +118,142 @@ def sync_vouchers_from_tally_frappe_orm():
         return flt(str(val).replace(',', '').strip())
 
 
-    # ---------------- FETCH XML ----------------
-    print(f"[TALLY SYNC] Requesting data from {tally_from_date} to {tally_to_date}...")
-    try:
-        response = requests.post(tally_url, data=tally_payload, timeout=60)
-        response.raise_for_status()
-        raw_xml = response.content.decode('utf-8', errors='ignore')
-        print(f"[TALLY SYNC] XML fetched successfully from {tally_url}")
-    except requests.exceptions.RequestException as e:
-        frappe.log_error(title="Tally Request Failed", message=f"Could not connect to Tally URL: {tally_url}. Error: {e}")
-        print(f"[ERROR] Tally connection failed: {e}")
-        return
-    
-    # --- FRAPPE DB INITIALIZATION & EXISTING DOCS FETCH (Using Frappe ORM) ---
-    existing_frappe_docs = {}
-    
-    for doctype in VCHTYPE_DOCTYPE_MAP.values():
-        existing_frappe_docs[doctype] = {}
-        docs = frappe.get_all(
-            doctype,
-            fields=["name", "voucher_number", "voucher_type", "date", "debit_ledger", "credit_ledger", "ledger_amount", "narration"], 
-            ignore_permissions=True
-        )
-        for doc in docs:
-            # Unique Key: (Vch No, Vch Type, Date)
-            key_tuple = (doc.voucher_number, doc.voucher_type, str(doc.date) if doc.date else "")
-            existing_frappe_docs[doctype][key_tuple] = doc # Store the full Frappe doc object
+    # ---------------- FETCH XML (one call per date window, worker threads) ----------------
+    # The body is streamed into a spool (see tally_stream) and parsed from
+    # there on this thread, a voucher at a time. Every request takes a slot
+    # of the endpoint's request budget (see tally_concurrency).
+    budget = get_request_budget(config)
 
-    
-    # ---------------- PARSE & SYNC (AGGREGATION - ONE ROW PER VOUCHER) ----------------
-    cleaned_xml = clean_xml_text(raw_xml)
-    bytes_io = io.BytesIO(cleaned_xml.encode("utf-8"))
-    
-    # Use a set to track processed documents to handle the deletion logic correctly
-    seen_tally_keys = {dt: set() for dt in VCHTYPE_DOCTYPE_MAP.values()}
+    def fetch(window_from, window_to):
+        with timer.stage("build_xml"):
+            payload = build_payload(window_from, window_to)
+        download = tally_stream.download(tally_url, payload, timeout=config.timeout, budget=budget, timer=timer)
+        return download, download.vouchers
 
+    if since_alter_id:
+        # A delta is small: ask for the whole range at once, split only on failure.
+        planner = ChunkPlanner(from_date, to_date, window_days=(to_date - from_date).days + 1, completed=completed)
+        log.info("Requesting vouchers altered after ALTERID %s (%s to %s)", since_alter_id, from_date, to_date)
+    else:
+        planner = ChunkPlanner(from_date, to_date, completed=completed)
+        log.info("Requesting data from %s to %s in date windows", from_date, to_date)
+    
+    # ---------------- PARSE & SYNC (ONE LEDGER ROW PER TALLY ENTRY) ----------------
+    # Vouchers go through the bulk writer (see tally_bulk), which skips any
+    # voucher whose content hash is unchanged. Nothing is loaded up front:
+    # each window only looks at its own stored vouchers.
+    with timer.stage("ledger_resolve"):
+        ledgers = LedgerResolver.load()
+    writer = VoucherBulkWriter(timer=timer)
 
-    try:
-        context = etree.iterparse(bytes_io, events=("end",), recover=True)
-        for event, elem in context:
-            tag_local = elem.tag.split('}')[-1] if '}' in elem.tag else elem.tag
-            if tag_local.upper() != "VOUCHER":
-                elem.clear()
-                continue
+    def process_window(vouchers):
+        """Queue the window's valid vouchers; return the voucher numbers seen per doctype."""
+        seen = {dt: set() for dt in VCHTYPE_DOCTYPE_MAP.values()}
 
-            vchtype_attr = elem.get("VCHTYPE")
-            vchtype_child = elem_text(elem, "VOUCHERTYPENAME")
-            vchnum_child = elem_text(elem, "VOUCHERNUMBER")
-            narration = safe_str(elem_text(elem, "NARRATION"))
-            date_val = parse_date(elem_text(elem, "DATE"))
+        for elem in vouchers:
+            with timer.stage("parse"):
+                record = extract_voucher(elem)
+            narration = safe_str(record.narration)
+            date_val = parse_date(record.date)
 
-            vch_number = safe_str(vchnum_child or "")
-            vch_type = safe_str(vchtype_attr or vchtype_child or "")
+            vch_number = safe_str(record.voucher_number)
+            vch_type = safe_str(record.voucher_type)
             doctype = VCHTYPE_DOCTYPE_MAP.get(vch_type)
             
             if not doctype or not vch_number:
-                elem.clear()
+                log.event("skip_unsupported")
                 continue
 
-            ledger_nodes = elem.xpath(".//*[local-name()='ALLLEDGERENTRIES.LIST']") or elem.xpath(".//*[local-name()='LEDGERENTRIES.LIST']")
+            # It exists in Tally, so it must not be tombstoned even if skipped below.
+            seen[doctype].add(vch_number)
 
-            # --- 1. Aggregate Tally Entries to Single Frappe Row ---
-            debit_ledger, credit_ledger = None, None
+            # --- 1. One Voucher Ledger Entry per Tally ledger entry ---
+            entries = []
             debit_amount, credit_amount = 0.0, 0.0
-            
-            for ledger in ledger_nodes:
-                ledger_name = safe_str(elem_text(ledger, "LEDGERNAME"))
-                amount_signed = parse_float(elem_text(ledger, "AMOUNT")) 
-
-                # Positive AMOUNT is Credit, Negative AMOUNT is Debit
-                if amount_signed > 0:
-                    credit_ledger = ledger_name
-                    credit_amount = amount_signed
-                elif amount_signed < 0:
-                    debit_ledger = ledger_name
-                    debit_amount = abs(amount_signed)
-
-            # --- 2. Validation & Data Preparation ---
-            if not (debit_ledger and credit_ledger and flt(debit_amount) == flt(credit_amount) and debit_amount != 0):
-                elem.clear()
+            unknown_ledgers = []
+
+            with timer.stage("ledger_resolve"):
+                for raw_ledger_name, raw_amount in record.ledger_entries:
+                    ledger_name = ledgers.resolve(safe_str(raw_ledger_name))
+                    amount_signed = parse_float(raw_amount) 
+                    if not ledger_name or not amount_signed:
+                        continue
+                    if not ledgers.is_known(ledger_name):
+                        unknown_ledgers.append(ledger_name)
+
+                    # Positive AMOUNT is Credit, Negative AMOUNT is Debit
+                    if amount_signed > 0:
+                        credit_amount += amount_signed
+                    else:
+                        debit_amount += abs(amount_signed)
+                    entries.append({
+                        "ledger": ledger_name,
+                        "entry_type": "Credit" if amount_signed > 0 else "Debit",
+                        "ledger_amount": abs(amount_signed),
+                    })
+
+            # --- 2. Validation ---
+            # Incomplete or unbalanced vouchers (cancelled, optional, memo)
+            # never import, so the watermark moves past them. Unknown ledgers
+            # may be pulled later: those hold it back for the next delta.
+            if len(entries) < 2 or flt(debit_amount, 2) != flt(credit_amount, 2):
+                log.event("skip_unbalanced", "Skipped unbalanced or incomplete %s %s", doctype, vch_number, level=logging.INFO)
                 continue
-                
-            ledger_amount_abs = debit_amount
-            
-            current_frappe_key = (vch_number, vch_type, str(date_val) if date_val else "")
-            seen_tally_keys[doctype].add(current_frappe_key)
-            
-            doc_data = {
-                "doctype": doctype,
+            if unknown_ledgers:
+                writer.hold(record.alter_id)
+                # Sampled like the message: an Error Log per voucher is a DB write per voucher.
+                if log.event("skip_unknown_ledger", "Skipped %s: unknown ledgers %s", vch_number, unknown_ledgers, level=logging.WARNING):
+                    frappe.log_error(title="Tally Sync Unknown Ledger", message=f"Voucher: {vch_number}. Ledgers: {unknown_ledgers}")
+                continue
+
+            writer.add(doctype, {
                 "voucher_number": vch_number,
                 "voucher_type": vch_type,
                 "date": date_val,
                 "narration": narration,
-                "credit_ledger": credit_ledger,
-                "debit_ledger": debit_ledger,
-                "ledger_amount": ledger_amount_abs,
-            }
+                "entries": entries,
+            })
+            log.event("synced", "Queued %s %s", doctype, vch_number)
 
-            print(f"--- [AGGREGATED] Vch: {vch_number} ({doctype}) | D: {debit_ledger}, C: {credit_ledger}, Amt: {ledger_amount_abs}")
+        return seen
 
-            existing_doc = existing_frappe_docs[doctype].get(current_frappe_key)
-            
-            if existing_doc:
-                # --- UPDATE EXISTING DOCUMENT ---
-                changed = (str(existing_doc.debit_ledger) != str(debit_ledger) or 
-                           str(existing_doc.credit_ledger) != str(credit_ledger) or 
-                           flt(existing_doc.ledger_amount) != flt(ledger_amount_abs) or 
-                           str(existing_doc.narration) != str(narration) or
-                           str(existing_doc.date) != str(date_val))
-
-                if changed:
-                    doc = frappe.get_doc(doctype, existing_doc.name) 
-                    doc.debit_ledger = debit_ledger
-                    doc.credit_ledger = credit_ledger
-                    doc.ledger_amount = ledger_amount_abs
-                    doc.narration = narration
-                    doc.date = date_val
-                    doc.save(ignore_permissions=True) 
-                    print(f"[UPDATE] Updated {doctype} {existing_doc.name} | Vch: {vch_number}")
-                else:
-                    print(f"[SKIP] No change detected for {doctype} {existing_doc.name} | Vch: {vch_number}")
-                
-                del existing_frappe_docs[doctype][current_frappe_key]
-
-            else:
-                # --- INSERT NEW DOCUMENT ---
-                doc = frappe.get_doc(doc_data)
-                try:
-                    doc.insert(ignore_permissions=True) 
-                    print(f"[INSERT] Inserted {doctype} {doc.name} | Vch: {vch_number}")
-                except Exception as insert_e:
-                    frappe.log_error(title="Tally Insert Failed", message=f"Voucher: {vch_number}. Data: {doc_data}. Error: {str(insert_e)}")
-                    print(f"[ERROR] Failed to insert {vch_number}. Check Frappe Error Log.")
-
-            elem.clear()
-            while elem.getprevious() is not None:
-                del elem.getparent()[0]
-
-        # ---------------- DELETE OBSOLETE DOCUMENTS ----------------
-        documents_to_delete = []
-        for doctype in existing_frappe_docs:
-            for key_tuple, doc_obj in existing_frappe_docs[doctype].items():
-                 documents_to_delete.append((doctype, doc_obj.name))
-
-        for doctype_name, doc_name in documents_to_delete:
-            try:
-                frappe.delete_doc(doctype_name, doc_name, ignore_permissions=True)
-                print(f"[DELETE] Deleted obsolete {doctype_name} {doc_name}")
-            except Exception as delete_e:
-                frappe.log_error(title="Tally Delete Failed", message=f"Doc: {doc_name} - {str(delete_e)}")
-                
-        # ---------------- FINAL COMMIT ----------------
-        frappe.db.commit()
-        print("[INFO] All vouchers synced to Frappe successfully (Frappe ORM Mode)")
+    def process(window, download):
+        window_from, window_to = window
+        log.info("Window %s to %s fetched from %s", window_from, window_to, tally_url)
+        seen = process_window(timer.iterate(tally_stream.iter_vouchers(download.chunks()), "stream"))
+        writer.flush()
+
+        # ---------------- TOMBSTONE VANISHED VOUCHERS ----------------
+        # A delta fetch only returns altered vouchers, so absence means
+        # nothing there; deletions are reconciled by full runs only.
+        tombstoned = 0
+        if not since_alter_id:
+            for doctype, names in seen.items():
+                with timer.stage("db_write"):
+                    flagged = tombstone_missing(doctype, window_from, window_to, names)
+                if flagged:
+                    log.info("Flagged %s %s as deleted in Tally (%s to %s)", flagged, doctype, window_from, window_to)
+                tombstoned += flagged
 
+        return {"vouchers": sum(len(names) for names in seen.values()), "tombstoned": tombstoned}
+
+    try:
+        tally_sync_run.run_chunks(
+            run, planner, fetch, config.parallel_fetches, process, writer, archive=config.archive_payloads
+        )
     except Exception as e:
-        frappe.db.rollback()
+        # Completed windows stay committed on the run; the watermarks are not
+        # advanced, and tally_sync_run.resume picks up from the failed window.
         frappe.log_error(title="Tally Sync General Error", message=f"An error occurred during sync: {e}")
-        print(f"[ERROR] Sync process failed. Rolling back database changes. Error: {e}")
\ No newline at end of file
+        log.error("Sync failed; resume the run to continue: %s", e)
+        tally_sync_run.fail(run, e, timer, log)
+        return run
+
+    # ---------------- FINAL COMMIT ----------------
+    tally_sync_run.advance_watermarks(run, collections)
+    tally_sync_run.finish(run, timer, log)
+    log.info(
+        "All vouchers synced: %s inserted, %s updated, %s unchanged, %s flagged as deleted",
+        run.inserted, run.updated, run.unchanged, run.tombstoned,
+    )
+    return run
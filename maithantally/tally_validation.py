@@ -0,0 +1,60 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+import frappe
+
+from maithantally.tally_ledger_groups import is_under
+
+# Shared checks for the ledger-entry vouchers (contra, journal, ...). A
+# voucher is validated in one pass over its rows: group checks are lookups
+# in the cached group closure, and totals are summed as integer paise so
+# 200 rows of 0.10 balance exactly. Ledger existence is left to the Link
+# field validation Frappe already runs on save.
+
+ENTRY_TYPES = ("Debit", "Credit")
+
+
+def to_paise(amount):
+    return int((Decimal(str(amount or 0)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def format_paise(paise):
+    return f"{Decimal(paise) / 100:.2f}"
+
+
+def validate_entries(doc, voucher_label, allowed_groups=None):
+    """Validate `voucher_ledger_entry` of `doc` and check it balances.
+
+    With `allowed_groups` every ledger must sit under one of those groups.
+    Returns the (debit, credit) totals in paise.
+    """
+    rows = doc.voucher_ledger_entry or []
+    if len(rows) < 2:
+        frappe.throw(f"{voucher_label} must have at least two ledger entries")
+
+    totals = dict.fromkeys(ENTRY_TYPES, 0)
+
+    for row in rows:
+        if not row.ledger:
+            frappe.throw("Ledger is mandatory")
+
+        if not row.entry_type:
+            frappe.throw("Entry Type is mandatory")
+
+        if row.entry_type not in totals:
+            frappe.throw("Entry Type must be Debit or Credit")
+
+        amount = to_paise(row.ledger_amount)
+        if amount <= 0:
+            frappe.throw("Ledger Amount must be greater than zero")
+
+        if allowed_groups and not is_under(row.ledger, *allowed_groups):
+            frappe.throw(f"{row.ledger} is not allowed in {voucher_label}")
+
+        totals[row.entry_type] += amount
+
+    if totals["Debit"] != totals["Credit"]:
+        frappe.throw(
+            f"Debit ({format_paise(totals['Debit'])}) and Credit ({format_paise(totals['Credit'])}) must be equal"
+        )
+
+    return totals["Debit"], totals["Credit"]
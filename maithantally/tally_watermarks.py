@@ -0,0 +1,113 @@
+import re
+
+import frappe
+from frappe.utils import cint, now_datetime
+
+# Tally stamps every voucher and master with a company-wide, ever-increasing
+# ALTERID whenever it is created or altered (and a MASTERID that never
+# changes). Remembering the highest ALTERID imported per company and
+# collection lets the next pull ask Tally for only what changed since.
+#
+# A delta pull cannot see deletions, so full syncs (watermark 0) are still
+# needed now and then to reconcile; clearing a watermark forces one.
+#
+# A watermark only holds for the date range it was earned on, so each
+# voucher pull keeps its own (see scoped), and a run over an explicit range
+# neither reads nor advances them. A run that skipped vouchers it may be
+# able to import later (a ledger not pulled yet) stops its watermark just
+# below the lowest such ALTERID, so the next delta fetches them again.
+
+WATERMARK_DOCTYPE = "Tally Sync Watermark"
+FILTER_NAME = "MaithanAlteredSince"
+
+_ALTERID_RE = re.compile(rb"<ALTERID[^>]*>\s*(\d+)\s*</ALTERID>")
+_MASTERID_RE = re.compile(rb"<MASTERID[^>]*>\s*(\d+)\s*</MASTERID>")
+
+
+def get_alter_id(company, collection):
+    return cint(frappe.db.get_value(
+        WATERMARK_DOCTYPE, {"company": company, "collection": collection}, "last_alter_id"
+    ))
+
+
+def get_since(company, collections):
+    """Lowest watermark across `collections`; 0 (full sync) if any is unset."""
+    return min((get_alter_id(company, collection) for collection in collections), default=0)
+
+
+def scoped(scope, collections):
+    """Watermark collections of one pull method, e.g. scoped("contra", ["Journal"])."""
+    return [f"{scope}:{collection}" for collection in collections]
+
+
+def advance(company, collections, alter_id, master_id=None, held_alter_id=0):
+    """Move the watermarks forward after a successful run. Never moves back.
+
+    With `held_alter_id` (the lowest ALTERID the run skipped) the watermark
+    stops below it.
+    """
+    alter_id = cint(alter_id)
+    if cint(held_alter_id):
+        alter_id = min(alter_id, cint(held_alter_id) - 1)
+    if alter_id <= 0:
+        return
+
+    for collection in collections:
+        name = frappe.db.get_value(
+            WATERMARK_DOCTYPE, {"company": company, "collection": collection}, "name", for_update=True
+        )
+        if not name:
+            frappe.get_doc({
+                "doctype": WATERMARK_DOCTYPE,
+                "company": company,
+                "collection": collection,
+                "last_alter_id": alter_id,
+                "last_master_id": cint(master_id),
+                "last_synced_on": now_datetime(),
+            }).insert(ignore_permissions=True)
+            continue
+
+        current = frappe.db.get_value(WATERMARK_DOCTYPE, name, ["last_alter_id", "last_master_id"], as_dict=True)
+        frappe.db.set_value(WATERMARK_DOCTYPE, name, {
+            "last_alter_id": max(cint(current.last_alter_id), alter_id),
+            "last_master_id": max(cint(current.last_master_id), cint(master_id)),
+            "last_synced_on": now_datetime(),
+        })
+
+
+@frappe.whitelist()
+def reset(company, collections=None):
+    """Clear watermarks so the next pull is a full sync."""
+    frappe.only_for("System Manager")
+
+    filters = {"company": company}
+    if collections:
+        filters["collection"] = ["in", frappe.parse_json(collections)]
+    for name in frappe.get_all(WATERMARK_DOCTYPE, filters=filters, pluck="name"):
+        frappe.db.set_value(WATERMARK_DOCTYPE, name, "last_alter_id", 0)
+
+
+def max_ids(raw_xml):
+    """Highest (ALTERID, MASTERID) present in an export payload."""
+    alter_ids = _ALTERID_RE.findall(raw_xml)
+    master_ids = _MASTERID_RE.findall(raw_xml)
+    return (
+        max(map(int, alter_ids), default=0),
+        max(map(int, master_ids), default=0),
+    )
+
+
+def collection_filter(alter_id):
+    """TDL pieces restricting a collection to objects altered after `alter_id`.
+
+    Returns `(filters, definition)`: the first goes inside <COLLECTION>, the
+    second next to it inside <TDLMESSAGE>. Both are empty for a full sync.
+    """
+    alter_id = cint(alter_id)
+    if not alter_id:
+        return "", ""
+
+    return (
+        f"<FILTERS>{FILTER_NAME}</FILTERS>",
+        f'<SYSTEM TYPE="Formulae" NAME="{FILTER_NAME}">$AlterID &gt; {alter_id}</SYSTEM>',
+    )
@@ -0,0 +1,168 @@
+import xml.sax.saxutils as saxutils
+from contextlib import contextmanager
+
+from frappe.utils import flt, getdate
+
+# Every voucher pushed to Tally is serialised here. Fragments are appended to
+# a list and joined once, so a 1000-line voucher costs one join instead of
+# 1000 ever-growing string copies, and every value goes through the same
+# escaping: a ledger or item named "A & B" no longer breaks the import.
+
+_ATTR_ENTITIES = {'"': "&quot;", "\n": "&#10;", "\r": "&#13;", "\t": "&#9;"}
+
+
+def escape_xml(data):
+    if data is None:
+        return ""
+    return saxutils.escape(str(data))
+
+
+def escape_attr(data):
+    if data is None:
+        return ""
+    return saxutils.escape(str(data), _ATTR_ENTITIES)
+
+
+def tally_date(value):
+    """YYYYMMDD, as <DATE> expects."""
+    return getdate(value).strftime("%Y%m%d")
+
+
+def tally_tag_date(value):
+    """DD-Mon-YYYY, as the DATE attribute of Alter/Delete expects."""
+    return getdate(value).strftime("%d-%b-%Y")
+
+
+def tally_amount(value):
+    return f"{flt(value):.2f}"
+
+
+class XmlWriter:
+    """Append-only XML buffer with escaping built in."""
+
+    __slots__ = ("parts",)
+
+    def __init__(self):
+        self.parts = []
+
+    def start(self, tag, attrs=None):
+        if attrs:
+            rendered = "".join(f' {key}="{escape_attr(value)}"' for key, value in attrs.items())
+            self.parts.append(f"<{tag}{rendered}>")
+        else:
+            self.parts.append(f"<{tag}>")
+
+    def end(self, tag):
+        self.parts.append(f"</{tag}>")
+
+    @contextmanager
+    def element(self, tag, attrs=None):
+        self.start(tag, attrs)
+        yield self
+        self.end(tag)
+
+    def field(self, tag, value):
+        self.parts.append(f"<{tag}>{escape_xml(value)}</{tag}>")
+
+    def getvalue(self):
+        return "".join(self.parts)
+
+
+def ledger_entries(writer, rows, credit_first=False):
+    """ALLLEDGERENTRIES.LIST for voucher_ledger_entry rows (Debit/Credit)."""
+    if credit_first:
+        rows = [row for row in rows if row.entry_type == "Credit"] + [
+            row for row in rows if row.entry_type != "Credit"
+        ]
+
+    # One formatted append per row: this loop is the hot path of big vouchers.
+    append = writer.parts.append
+    for row in rows:
+        amount = abs(float(row.ledger_amount or 0))
+        if row.entry_type == "Credit":
+            deemed_positive, amount = "No", f"{amount:.2f}"
+        else:
+            deemed_positive, amount = "Yes", f"{-amount:.2f}"
+        append(
+            f"<ALLLEDGERENTRIES.LIST><LEDGERNAME>{escape_xml(row.ledger)}</LEDGERNAME>"
+            f"<ISDEEMEDPOSITIVE>{deemed_positive}</ISDEEMEDPOSITIVE>"
+            f"<AMOUNT>{amount}</AMOUNT></ALLLEDGERENTRIES.LIST>"
+        )
+
+
+def accounting_voucher(doc, vch_type, action="Create", persisted_view=True, credit_first=False):
+    """<VOUCHER> for the ledger-entry kinds: Contra, Journal, Payment, Receipt.
+
+    Contra and Journal carry the voucher view and an effective date;
+    Payment and Receipt are sent the way Tally's own exports write them.
+    """
+    writer = XmlWriter()
+
+    if action == "Create":
+        writer.start("VOUCHER", {"VCHTYPE": vch_type, "ACTION": "Create"})
+        if persisted_view:
+            writer.field("DATE", tally_date(doc.date))
+            writer.field("EFFECTIVEDATE", tally_date(doc.date))
+            writer.field("VOUCHERTYPENAME", vch_type)
+            writer.field("PERSISTEDVIEW", "Accounting Voucher View")
+        else:
+            writer.field("VOUCHERTYPENAME", vch_type)
+            writer.field("DATE", tally_tag_date(doc.date))
+        writer.field("VOUCHERNUMBER", doc.voucher_number)
+    else:
+        writer.start("VOUCHER", tag_attrs(doc, vch_type, action))
+        if persisted_view:
+            writer.field("VOUCHERTYPENAME", vch_type)
+            writer.field("PERSISTEDVIEW", "Accounting Voucher View")
+
+    writer.field("NARRATION", doc.narration)
+    ledger_entries(writer, doc.voucher_ledger_entry, credit_first=credit_first)
+    writer.end("VOUCHER")
+    return writer.getvalue()
+
+
+def tag_attrs(doc, vch_type, action):
+    """Attributes that address an existing voucher by date and number."""
+    return {
+        "VCHTYPE": vch_type,
+        "ACTION": action,
+        "DATE": tally_tag_date(doc.date),
+        "TAGNAME": "Voucher Number",
+        "TAGVALUE": doc.voucher_number,
+    }
+
+
+def delete_voucher(doc, vch_type):
+    writer = XmlWriter()
+    with writer.element("VOUCHER", tag_attrs(doc, vch_type, "Delete")):
+        pass
+    return writer.getvalue()
+
+
+def import_envelope(company, vouchers):
+    """Wrap one or more <VOUCHER> blocks in a single Tally import envelope."""
+    if isinstance(vouchers, str):
+        vouchers = [vouchers]
+
+    return f"""
+<ENVELOPE>
+    <HEADER>
+        <VERSION>1</VERSION>
+        <TALLYREQUEST>Import</TALLYREQUEST>
+        <TYPE>Data</TYPE>
+        <ID>Vouchers</ID>
+    </HEADER>
+    <BODY>
+        <DESC>
+            <STATICVARIABLES>
+                <SVCURRENTCOMPANY>{escape_xml(company)}</SVCURRENTCOMPANY>
+            </STATICVARIABLES>
+        </DESC>
+        <DATA>
+            <TALLYMESSAGE xmlns:UDF="TallyUDF">
+                {"".join(vouchers)}
+            </TALLYMESSAGE>
+        </DATA>
+    </BODY>
+</ENVELOPE>
+"""
@@ -0,0 +1,104 @@
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import UnitTestCase
+
+from maithantally.tally_batch import (
+    FAILED,
+    SUCCESS,
+    UNKNOWN,
+    build_lookup_export,
+    map_batch_results,
+    verify_unknown,
+)
+from maithantally.tally_response import parse_import_response
+
+
+def voucher(number, doctype="Journal Voucher"):
+    return frappe._dict(doctype=doctype, name=number, voucher_number=number, date="2025-04-01")
+
+
+def response(created=0, altered=0, errors=0, line_errors=()):
+    lines = "".join(f"<LINEERROR>{message}</LINEERROR>" for message in line_errors)
+    return parse_import_response(
+        f"<RESPONSE><CREATED>{created}</CREATED><ALTERED>{altered}</ALTERED>"
+        f"<ERRORS>{errors}</ERRORS>{lines}</RESPONSE>"
+    )
+
+
+class TestMapBatchResults(UnitTestCase):
+    def setUp(self):
+        self.docs = [voucher("JV/1"), voucher("JV/2"), voucher("JV/12")]
+
+    def test_clean_response_succeeds_for_every_voucher(self):
+        self.assertEqual(map_batch_results(self.docs, response(created=3)), [(SUCCESS, None)] * 3)
+
+    def test_nothing_processed_fails_every_voucher(self):
+        statuses = map_batch_results(self.docs, response(errors=1, line_errors=["Company not open"]))
+        self.assertEqual(statuses, [(FAILED, "Company not open")] * 3)
+
+    def test_error_naming_a_voucher_is_pinned_to_it(self):
+        statuses = map_batch_results(
+            self.docs, response(created=2, errors=1, line_errors=["Voucher Number 'JV/1' already exists"])
+        )
+        self.assertEqual(
+            statuses,
+            [(FAILED, "Voucher Number 'JV/1' already exists"), (SUCCESS, None), (SUCCESS, None)],
+        )
+
+    def test_number_prefix_of_another_is_not_a_match(self):
+        statuses = map_batch_results(
+            self.docs, response(created=2, errors=1, line_errors=["Voucher No. JV/12 has no ledger"])
+        )
+        self.assertEqual([status for status, _ in statuses], [SUCCESS, SUCCESS, FAILED])
+
+    def test_escaped_quotes_in_the_response_still_match(self):
+        statuses = map_batch_results(
+            self.docs, response(created=2, errors=1, line_errors=["Voucher &apos;JV/2&apos; is a duplicate"])
+        )
+        self.assertEqual([status for status, _ in statuses], [SUCCESS, FAILED, SUCCESS])
+
+    def test_unattributed_error_leaves_the_rest_unknown(self):
+        statuses = map_batch_results(
+            self.docs, response(created=2, errors=1, line_errors=["Ledger 'Suspense' does not exist"])
+        )
+        self.assertEqual(statuses, [(UNKNOWN, "Ledger 'Suspense' does not exist")] * 3)
+
+    def test_more_errors_than_attributed_leaves_the_rest_unknown(self):
+        statuses = map_batch_results(
+            self.docs, response(created=1, errors=2, line_errors=["Voucher 'JV/1' already exists"])
+        )
+        self.assertEqual([status for status, _ in statuses], [FAILED, UNKNOWN, UNKNOWN])
+
+
+class TestVerifyUnknown(UnitTestCase):
+    def test_unknown_creates_and_deletes_are_settled_by_lookup(self):
+        items = [
+            (voucher("JV/1"), "Create"),
+            (voucher("JV/2"), "Create"),
+            (voucher("JV/3"), "Delete"),
+            (voucher("JV/4"), "Alter"),
+        ]
+        statuses = [(UNKNOWN, "errors")] * 4
+        present = {("journal", "jv/1"), ("journal", "jv/3")}
+
+        with patch("maithantally.tally_batch.find_vouchers", return_value=present) as find:
+            settled = verify_unknown(frappe._dict(), items, statuses)
+
+        self.assertEqual([doc.name for doc in find.call_args.args[1]], ["JV/1", "JV/2", "JV/3"])
+        self.assertEqual(
+            settled, [(SUCCESS, None), (FAILED, "errors"), (FAILED, "errors"), (UNKNOWN, "errors")]
+        )
+
+    def test_statuses_stand_when_tally_cannot_be_asked(self):
+        items = [(voucher("JV/1"), "Create")]
+        statuses = [(UNKNOWN, "errors")]
+
+        with patch("maithantally.tally_batch.find_vouchers", side_effect=ConnectionError):
+            self.assertEqual(verify_unknown(frappe._dict(), items, statuses), statuses)
+
+    def test_lookup_export_escapes_numbers(self):
+        xml = build_lookup_export("A & B Ltd", [voucher("R&D/1"), voucher("R&D/2")])
+
+        self.assertIn("<SVCURRENTCOMPANY>A &amp; B Ltd</SVCURRENTCOMPANY>", xml)
+        self.assertIn('>$VoucherNumber = "R&amp;D/1" OR $VoucherNumber = "R&amp;D/2"</SYSTEM>', xml)
@@ -0,0 +1,108 @@
+import frappe
+from frappe.tests import IntegrationTestCase, UnitTestCase
+from frappe.utils import getdate
+
+from maithantally.tally_bulk import LEDGER_ENTRY_DOCTYPE, VoucherBulkWriter, content_hash
+
+DOCTYPE = "Journal Voucher"
+PREFIX = "TST-BULK-"
+
+
+def pulled(number, narration="Pulled from Tally", amount=100):
+    return {
+        "voucher_number": number,
+        "voucher_type": "Journal",
+        "date": getdate("2025-04-01"),
+        "narration": narration,
+        "entries": [
+            {"ledger": "Cash", "entry_type": "Debit", "ledger_amount": amount},
+            {"ledger": "Bank", "entry_type": "Credit", "ledger_amount": amount},
+        ],
+    }
+
+
+def write(*vouchers):
+    writer = VoucherBulkWriter()
+    for voucher in vouchers:
+        writer.add(DOCTYPE, voucher)
+    writer.flush()
+    return writer.counts
+
+
+class TestContentHash(UnitTestCase):
+    def test_same_content_same_hash(self):
+        self.assertEqual(content_hash(pulled("JV/1")), content_hash(pulled("JV/1")))
+
+    def test_amounts_compare_to_the_paisa(self):
+        self.assertEqual(content_hash(pulled("JV/1", amount=100)), content_hash(pulled("JV/1", amount=100.001)))
+        self.assertNotEqual(content_hash(pulled("JV/1", amount=100)), content_hash(pulled("JV/1", amount=100.01)))
+
+    def test_every_written_field_changes_the_hash(self):
+        base = content_hash(pulled("JV/1"))
+        changes = {
+            "voucher_type": "Contra",
+            "date": getdate("2025-04-02"),
+            "narration": "Altered in Tally",
+        }
+        for field, value in changes.items():
+            self.assertNotEqual(content_hash({**pulled("JV/1"), field: value}), base, field)
+
+        swapped = pulled("JV/1")
+        swapped["entries"].reverse()
+        self.assertNotEqual(content_hash(swapped), base, "entry order")
+
+    def test_voucher_number_is_not_part_of_the_hash(self):
+        self.assertEqual(content_hash(pulled("jv/1")), content_hash(pulled("JV/1")))
+
+
+class TestVoucherBulkWriter(IntegrationTestCase):
+    def tearDown(self):
+        # The writer commits per batch, so clean up explicitly.
+        names = frappe.get_all(DOCTYPE, filters={"name": ["like", f"{PREFIX}%"]}, pluck="name")
+        if names:
+            frappe.db.delete(LEDGER_ENTRY_DOCTYPE, {"parenttype": DOCTYPE, "parent": ["in", names]})
+            frappe.db.delete(DOCTYPE, {"name": ["in", names]})
+        frappe.db.commit()
+
+    def stored(self):
+        return frappe.get_all(
+            DOCTYPE, filters={"name": ["like", f"{PREFIX}%"]}, fields=["name", "narration"]
+        )
+
+    def test_insert_then_unchanged(self):
+        self.assertEqual(write(pulled(f"{PREFIX}1"))["inserted"], 1)
+        self.assertEqual(write(pulled(f"{PREFIX}1"))["unchanged"], 1)
+
+    def test_changed_voucher_is_updated(self):
+        write(pulled(f"{PREFIX}1"))
+        counts = write(pulled(f"{PREFIX}1", amount=250))
+
+        self.assertEqual(counts["updated"], 1)
+        amounts = frappe.get_all(
+            LEDGER_ENTRY_DOCTYPE, filters={"parenttype": DOCTYPE, "parent": f"{PREFIX}1"}, pluck="ledger_amount"
+        )
+        self.assertEqual(sorted(amounts), [250, 250])
+
+    def test_number_in_another_case_updates_the_stored_voucher(self):
+        # tally.import_vouchers upper-cases voucher numbers; a voucher first
+        # stored in lower case must be updated, not inserted a second time.
+        write(pulled(f"{PREFIX.lower()}jv/001"))
+        counts = write(pulled(f"{PREFIX}JV/001", narration="Altered in Tally"))
+
+        self.assertEqual(counts, {"inserted": 0, "updated": 1, "unchanged": 0})
+        self.assertEqual(
+            [(row.name, row.narration) for row in self.stored()],
+            [(f"{PREFIX.lower()}jv/001", "Altered in Tally")],
+        )
+        parents = frappe.get_all(
+            LEDGER_ENTRY_DOCTYPE,
+            filters={"parenttype": DOCTYPE, "parent": ["like", f"{PREFIX}%"]},
+            pluck="parent",
+        )
+        self.assertEqual(parents, [f"{PREFIX.lower()}jv/001"] * 2)
+
+    def test_same_number_twice_in_one_batch(self):
+        counts = write(pulled(f"{PREFIX}jv/002"), pulled(f"{PREFIX}JV/002", narration="Later"))
+
+        self.assertEqual(counts["inserted"], 1)
+        self.assertEqual([row.narration for row in self.stored()], ["Later"])
@@ -0,0 +1,48 @@
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from maithantally.tally_cache import VersionedCache
+
+KEY = "maithantally:test_versioned_cache"
+
+
+class TestVersionedCache(IntegrationTestCase):
+    def setUp(self):
+        self.loads = 0
+        self.builds = 0
+        self.cache = VersionedCache(KEY, f"{KEY}_version", self.load, build=self.build)
+
+    def tearDown(self):
+        frappe.cache.delete_value(KEY)
+        frappe.cache.delete_value(f"{KEY}_version")
+
+    def load(self):
+        self.loads += 1
+        return {"loads": self.loads}
+
+    def build(self, value):
+        self.builds += 1
+        return dict(value, built=True)
+
+    def test_loaded_and_built_once(self):
+        self.assertEqual(self.cache.get(), {"loads": 1, "built": True})
+        self.assertEqual(self.cache.get(), {"loads": 1, "built": True})
+        self.assertEqual((self.loads, self.builds), (1, 1))
+
+    def test_another_process_reuses_the_redis_copy(self):
+        self.cache.get()
+        other = VersionedCache(KEY, f"{KEY}_version", self.load, build=self.build)
+
+        self.assertEqual(other.get(), {"loads": 1, "built": True})
+        self.assertEqual((self.loads, self.builds), (1, 2))
+
+    def test_clear_reaches_every_process(self):
+        self.cache.get()
+        other = VersionedCache(KEY, f"{KEY}_version", self.load, build=self.build)
+        other.get()
+
+        self.cache.clear()
+
+        self.assertEqual(other.get(), {"loads": 2, "built": True})
+        self.assertEqual(self.cache.get(), {"loads": 2, "built": True})
+        self.assertEqual(self.loads, 2)
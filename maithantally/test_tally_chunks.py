@@ -0,0 +1,115 @@
+from datetime import date
+
+from frappe.tests import UnitTestCase
+
+from maithantally.tally_chunks import MAX_ATTEMPTS_PER_WINDOW, ChunkFetchError, ChunkPlanner, fetch_windows
+from maithantally.tally_concurrency import TallyBusy
+
+
+def drain(planner):
+    windows = []
+    while planner.has_more():
+        windows.append(planner.next_window())
+    return windows
+
+
+def covered_days(windows):
+    return sorted(day for start, end in windows for day in range(start.toordinal(), end.toordinal() + 1))
+
+
+class TestChunkPlanner(UnitTestCase):
+    def test_windows_cover_the_range_once(self):
+        planner = ChunkPlanner(date(2025, 1, 1), date(2025, 3, 15), window_days=31)
+        windows = drain(planner)
+
+        self.assertEqual(windows[0], (date(2025, 1, 1), date(2025, 1, 31)))
+        self.assertEqual(windows[-1][1], date(2025, 3, 15))
+        self.assertEqual(
+            covered_days(windows), list(range(date(2025, 1, 1).toordinal(), date(2025, 3, 15).toordinal() + 1))
+        )
+
+    def test_failed_window_is_split_in_half_and_retried_first(self):
+        planner = ChunkPlanner(date(2025, 1, 1), date(2025, 2, 28), window_days=10)
+        window = planner.next_window()
+
+        planner.record_failure(window, "Memory Access Violation")
+
+        self.assertEqual(planner.next_window(), (date(2025, 1, 1), date(2025, 1, 5)))
+        self.assertEqual(planner.next_window(), (date(2025, 1, 6), date(2025, 1, 10)))
+        self.assertEqual(planner.window_days, 5)
+        self.assertEqual(planner.next_window()[0], date(2025, 1, 11))
+
+    def test_odd_window_split_keeps_every_day(self):
+        planner = ChunkPlanner(date(2025, 1, 1), date(2025, 1, 7), window_days=7)
+        planner.record_failure(planner.next_window(), "timeout")
+
+        self.assertEqual(covered_days(drain(planner)), covered_days([(date(2025, 1, 1), date(2025, 1, 7))]))
+
+    def test_one_day_window_gives_up_after_max_attempts(self):
+        planner = ChunkPlanner(date(2025, 1, 1), date(2025, 1, 1), window_days=1)
+        window = planner.next_window()
+
+        for _ in range(MAX_ATTEMPTS_PER_WINDOW - 1):
+            planner.record_failure(window, "timeout")
+            self.assertEqual(planner.next_window(), window)
+
+        with self.assertRaises(ChunkFetchError):
+            planner.record_failure(window, "timeout")
+
+    def test_window_size_adapts_to_voucher_counts(self):
+        planner = ChunkPlanner(date(2025, 1, 1), date(2025, 12, 31), window_days=10, max_days=15)
+
+        planner.record_success(planner.next_window(), 10)
+        self.assertEqual(planner.window_days, 15)
+
+        planner.record_success(planner.next_window(), 10_000)
+        self.assertEqual(planner.window_days, 7)
+
+    def test_resume_skips_completed_windows(self):
+        completed = [(date(2025, 1, 1), date(2025, 1, 10)), (date(2025, 1, 21), date(2025, 1, 25))]
+        planner = ChunkPlanner(date(2025, 1, 1), date(2025, 1, 31), window_days=31, completed=completed)
+
+        self.assertEqual(
+            drain(planner),
+            [(date(2025, 1, 11), date(2025, 1, 20)), (date(2025, 1, 26), date(2025, 1, 31))],
+        )
+
+    def test_resume_with_everything_completed_has_nothing_left(self):
+        planner = ChunkPlanner(
+            date(2025, 1, 1), date(2025, 1, 31), completed=[(date(2025, 1, 1), date(2025, 1, 31))]
+        )
+
+        self.assertFalse(planner.has_more())
+        self.assertIsNone(planner.next_window())
+
+
+class TestFetchWindows(UnitTestCase):
+    def test_busy_window_is_retried_unchanged(self):
+        calls = []
+
+        def fetch(start, end):
+            calls.append((start, end))
+            if len(calls) == 1:
+                raise TallyBusy("no slot")
+            return "payload", 10
+
+        planner = ChunkPlanner(date(2025, 1, 1), date(2025, 1, 10), window_days=10)
+        fetched = list(fetch_windows(planner, fetch, max_parallel=1))
+
+        window = (date(2025, 1, 1), date(2025, 1, 10))
+        self.assertEqual(calls, [window, window])
+        self.assertEqual(fetched, [(window, "payload")])
+
+    def test_failed_window_is_split(self):
+        calls = []
+
+        def fetch(start, end):
+            calls.append((start, end))
+            if len(calls) == 1:
+                raise ChunkFetchError("Memory Access Violation")
+            return "payload", 10
+
+        planner = ChunkPlanner(date(2025, 1, 1), date(2025, 1, 10), window_days=10)
+        fetched = [window for window, _ in fetch_windows(planner, fetch, max_parallel=1)]
+
+        self.assertEqual(fetched, [(date(2025, 1, 1), date(2025, 1, 5)), (date(2025, 1, 6), date(2025, 1, 10))])
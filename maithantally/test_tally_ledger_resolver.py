@@ -0,0 +1,49 @@
+from frappe.tests import UnitTestCase
+
+from maithantally.tally_ledger_resolver import LedgerResolver
+
+LEDGERS = (
+    "Cash",
+    "HDFC Bank",
+    "HDFC Bank - Current Account",
+    "Rent and Rates",
+    "Office  Expenses",
+)
+
+
+class TestLedgerResolver(UnitTestCase):
+    def setUp(self):
+        self.resolver = LedgerResolver(LEDGERS)
+
+    def test_exact_name(self):
+        self.assertEqual(self.resolver.resolve("Cash"), "Cash")
+
+    def test_case_and_whitespace_are_ignored(self):
+        self.assertEqual(self.resolver.resolve("  hdfc   BANK "), "HDFC Bank")
+        self.assertEqual(self.resolver.resolve("Office Expenses"), "Office  Expenses")
+
+    def test_and_matches_ampersand(self):
+        self.assertEqual(self.resolver.resolve("Rent & Rates"), "Rent and Rates")
+        self.assertEqual(self.resolver.resolve("RENT&RATES"), "Rent and Rates")
+
+    def test_contained_name_picks_the_shortest_ledger(self):
+        self.assertEqual(self.resolver.resolve("DFC Ban"), "HDFC Bank")
+        self.assertEqual(self.resolver.resolve("current"), "HDFC Bank - Current Account")
+
+    def test_short_fragment_without_trigrams(self):
+        self.assertEqual(self.resolver.resolve("ca"), "Cash")
+
+    def test_unknown_name_comes_back_cleaned(self):
+        self.assertEqual(self.resolver.resolve("  Suspense   Account "), "Suspense Account")
+        self.assertFalse(self.resolver.is_known("Suspense Account"))
+
+    def test_empty_name(self):
+        self.assertIsNone(self.resolver.resolve(""))
+        self.assertIsNone(self.resolver.resolve(None))
+
+    def test_added_ledger_is_matched_after_an_earlier_miss(self):
+        self.assertEqual(self.resolver.resolve("Petty Cash"), "Petty Cash")
+        self.resolver.add("Petty Cash Box")
+
+        self.assertEqual(self.resolver.resolve("Petty Cash"), "Petty Cash Box")
+        self.assertTrue(self.resolver.is_known("Petty Cash Box"))
@@ -0,0 +1,69 @@
+from frappe.tests import UnitTestCase
+
+from maithantally.tally_stream import Download, iter_vouchers, sanitize
+
+EXPORT = (
+    "<ENVELOPE><BODY><DATA><TALLYMESSAGE>"
+    '<VOUCHER VCHTYPE="Journal"><VOUCHERNUMBER>JV/1</VOUCHERNUMBER>'
+    "<NARRATION>Rent &amp; rates\x04&#4;</NARRATION><ALTERID>17</ALTERID></VOUCHER>"
+    '<VOUCHER VCHTYPE="Contra"><VOUCHERNUMBER>C/2</VOUCHERNUMBER>'
+    "<NARRATION>Café &#x1F;float</NARRATION><ALTERID>42</ALTERID></VOUCHER>"
+    "</TALLYMESSAGE></DATA></BODY></ENVELOPE>"
+).encode()
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def vouchers(chunks):
+    return [
+        (elem.findtext("VOUCHERNUMBER"), elem.findtext("NARRATION"), elem.findtext("ALTERID"))
+        for elem in iter_vouchers(chunks)
+    ]
+
+
+class TestSanitize(UnitTestCase):
+    def test_control_characters_and_their_references_are_dropped(self):
+        cleaned = b"".join(sanitize([b"A\x01B&#1;C&#x0b;D&#9;E&#65;"]))
+        self.assertEqual(cleaned, b"ABCD&#9;E&#65;")
+
+    def test_reference_split_across_chunks(self):
+        for cut in range(1, len(b"&#x1F;")):
+            data = b"A&#x1F;B"
+            cleaned = b"".join(sanitize([data[:1 + cut], data[1 + cut:]]))
+            self.assertEqual(cleaned, b"AB", f"cut after {cut} bytes of the reference")
+
+    def test_multibyte_character_split_across_chunks(self):
+        data = "Café ₹".encode()
+        self.assertEqual(b"".join(sanitize(split(data, 1))), data)
+
+    def test_invalid_utf8_is_dropped(self):
+        self.assertEqual(b"".join(sanitize([b"A\xff", b"\xfeB"])), b"AB")
+
+    def test_unterminated_ampersand_is_flushed_at_the_end(self):
+        self.assertEqual(b"".join(sanitize([b"Rent &", b" rates &"])), b"Rent & rates &")
+
+
+class TestIterVouchers(UnitTestCase):
+    def test_same_vouchers_whatever_the_chunking(self):
+        expected = [("JV/1", "Rent & rates", "17"), ("C/2", "Café float", "42")]
+        for size in (1, 2, 3, 7, 64, len(EXPORT)):
+            self.assertEqual(vouchers(split(EXPORT, size)), expected, f"chunks of {size} bytes")
+
+    def test_empty_body_yields_nothing(self):
+        self.assertEqual(vouchers([]), [])
+        self.assertEqual(vouchers([b""]), [])
+
+
+class TestDownload(UnitTestCase):
+    def test_markers_straddling_chunks_are_counted_once(self):
+        download = Download()
+        for chunk in split(EXPORT, 5):
+            download.write(chunk)
+
+        self.assertEqual(download.vouchers, 2)
+        self.assertEqual(download.alter_id, 42)
+        self.assertFalse(download.failed)
+        self.assertEqual(b"".join(download.chunks()), EXPORT)
+        download.close()
@@ -0,0 +1,53 @@
+import frappe
+from frappe.tests import UnitTestCase
+
+from maithantally.tally_validation import format_paise, to_paise, validate_entries
+
+
+def voucher(*entries):
+    return frappe._dict(
+        voucher_ledger_entry=[
+            frappe._dict(ledger=ledger, entry_type=entry_type, ledger_amount=amount)
+            for ledger, entry_type, amount in entries
+        ]
+    )
+
+
+class TestPaise(UnitTestCase):
+    def test_to_paise(self):
+        self.assertEqual(to_paise(12.34), 1234)
+        self.assertEqual(to_paise("1000"), 100000)
+        self.assertEqual(to_paise(None), 0)
+        self.assertEqual(to_paise(-5.5), -550)
+
+    def test_half_paisa_rounds_up(self):
+        # float(2.675) is 2.67499...; the string form is what was entered.
+        self.assertEqual(to_paise(2.675), 268)
+        self.assertEqual(to_paise(0.005), 1)
+
+    def test_many_small_amounts_sum_exactly(self):
+        self.assertNotEqual(sum([0.10] * 200), 20.0)
+        self.assertEqual(sum(to_paise(0.10) for _ in range(200)), to_paise(20))
+
+    def test_format_paise(self):
+        self.assertEqual(format_paise(123456), "1234.56")
+        self.assertEqual(format_paise(5), "0.05")
+
+
+class TestValidateEntries(UnitTestCase):
+    def test_balanced_voucher_returns_its_totals(self):
+        doc = voucher(("Rent", "Debit", 1000), ("Cash", "Credit", 600), ("Bank", "Credit", 400))
+        self.assertEqual(validate_entries(doc, "Journal Voucher"), (100000, 100000))
+
+    def test_many_small_rows_balance_exactly(self):
+        doc = voucher(*[("Rent", "Debit", 0.10)] * 200, ("Cash", "Credit", 20))
+        self.assertEqual(validate_entries(doc, "Journal Voucher"), (2000, 2000))
+
+    def test_unbalanced_voucher_is_rejected(self):
+        doc = voucher(("Rent", "Debit", 1000), ("Cash", "Credit", 999.99))
+        with self.assertRaisesRegex(frappe.ValidationError, r"Debit \(1000.00\) and Credit \(999.99\)"):
+            validate_entries(doc, "Journal Voucher")
+
+    def test_single_entry_is_rejected(self):
+        with self.assertRaises(frappe.ValidationError):
+            validate_entries(voucher(("Rent", "Debit", 1000)), "Journal Voucher")